@@ -0,0 +1,171 @@
+"""asyncio front for the download engine.
+
+An embedding service that follows many batches at once should not need a
+thread per listener. AsyncDownloadEngine runs each batch's blocking work
+(download_core and yt-dlp) on a bounded thread pool and delivers every
+message to the event loop with call_soon_threadsafe, where any number of
+listeners read it through async iterators:
+
+    async with AsyncDownloadEngine(max_active_jobs=4) as engine:
+        job = await engine.submit(urls, download_path, format_preset='hd')
+        async for msg_type, job_id, data in job.events():
+            ...
+        result = await job.wait()
+
+Batches beyond max_active_jobs wait for a pool thread. events() first
+replays the job's recent messages, so a listener that subscribes late
+still sees how the batch started; a listener that falls behind skips
+progress messages rather than letting its backlog grow. A finished batch is
+dropped from engine.jobs once its result has been collected with wait(), or
+after `retention` seconds otherwise, so a long-running service does not keep
+every batch it ever ran.
+"""
+import asyncio
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from download_engine import DownloadEngine, EngineJob
+from job_manager import FINISHED_JOB_RETENTION
+
+DEFAULT_MAX_ACTIVE_JOBS = 4
+# Messages kept per job for listeners that subscribe late
+EVENT_HISTORY = 1000
+# A listener this many messages behind stops receiving progress messages
+PROGRESS_BACKLOG = 200
+
+
+class AsyncJob:
+    """Handle of a batch running under AsyncDownloadEngine; use it on the event loop only"""
+    def __init__(self, job, loop):
+        self.job = job
+        self.loop = loop
+        self.future = None
+        self._history = deque(maxlen=EVENT_HISTORY)
+        self._listeners = []
+        self._finished = False
+        self.finished_at = None
+        self.collected = False
+
+    @property
+    def job_id(self):
+        return self.job.job_id
+
+    @property
+    def done(self):
+        return self._finished
+
+    @property
+    def result(self):
+        return self.job.result
+
+    def cancel(self):
+        """Stop the batch; running downloads stop at their next progress event"""
+        self.job.cancel()
+
+    def _dispatch(self, message):
+        # Runs on the event loop
+        self._history.append(message)
+        for queue in self._listeners:
+            if message[0] == 'progress' and queue.qsize() >= PROGRESS_BACKLOG:
+                continue
+            queue.put_nowait(message)
+        if message[0] == 'complete':
+            self._finished = True
+            self.finished_at = time.time()
+
+    async def events(self):
+        """Yield (msg_type, job_id, data) for every message until the batch completes"""
+        queue = asyncio.Queue()
+        for message in self._history:
+            queue.put_nowait(message)
+        if not self._finished:
+            self._listeners.append(queue)
+        try:
+            while True:
+                if self._finished and queue.empty():
+                    return
+                message = await queue.get()
+                yield message
+                if message[0] == 'complete':
+                    return
+        finally:
+            if queue in self._listeners:
+                self._listeners.remove(queue)
+
+    async def wait(self):
+        """Wait for the batch to end and return its BatchResult"""
+        await asyncio.shield(self.future)
+        self.collected = True
+        return self.job.result
+
+
+class AsyncDownloadEngine:
+    """Run download batches on a thread pool and stream their messages to asyncio"""
+    def __init__(self, engine=None, max_active_jobs=DEFAULT_MAX_ACTIVE_JOBS, retention=FINISHED_JOB_RETENTION):
+        self.engine = engine or DownloadEngine()
+        self.retention = retention
+        self.executor = ThreadPoolExecutor(max_workers=max_active_jobs, thread_name_prefix="AsyncBatch")
+        self.jobs = {}
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.aclose()
+
+    async def submit(self, urls, download_path, job_id=None, **options):
+        """Queue a batch and return its AsyncJob; options are download_videos() keyword arguments"""
+        loop = asyncio.get_running_loop()
+        job = EngineJob(urls, job_id=job_id, queue_messages=False)
+        async_job = AsyncJob(job, loop)
+
+        def on_message(msg_type, msg_job_id, data):
+            loop.call_soon_threadsafe(async_job._dispatch, (msg_type, msg_job_id, data))
+
+        job.on_message = on_message
+        self.engine.job_manager.register(job)
+        self._prune()
+        self.jobs[job.job_id] = async_job
+        async_job.future = loop.run_in_executor(self.executor, self._run, job, download_path, options)
+        return async_job
+
+    def _run(self, job, download_path, options):
+        # Runs on a pool thread
+        try:
+            self.engine.execute(job, job.urls, download_path, **options)
+        finally:
+            if not job.done:
+                job.mark_complete()
+
+    async def run(self, urls, download_path, **options):
+        """Run a batch and return its BatchResult"""
+        job = await self.submit(urls, download_path, **options)
+        return await job.wait()
+
+    def _prune(self):
+        # Finished batches whose result was collected go at once; the others
+        # are kept `retention` seconds for late get() and events() callers
+        cutoff = time.time() - self.retention
+        for job_id, job in list(self.jobs.items()):
+            if job.future.done() and (job.collected or (job.finished_at or 0) < cutoff):
+                del self.jobs[job_id]
+
+    def get(self, job_id):
+        return self.jobs.get(job_id)
+
+    def cancel(self, job_id):
+        job = self.jobs.get(job_id)
+        if job is not None:
+            job.cancel()
+        return job
+
+    async def aclose(self, cancel=True):
+        """Cancel (unless told otherwise) and wait for every batch, then stop the pool"""
+        jobs = list(self.jobs.values())
+        if cancel:
+            for job in jobs:
+                job.cancel()
+        if jobs:
+            await asyncio.gather(*(job.future for job in jobs), return_exceptions=True)
+        self.executor.shutdown(wait=False)
@@ -0,0 +1,232 @@
+"""Process-wide bandwidth limits shared fairly between running downloads.
+
+yt-dlp only knows a fixed rate limit per download, so parallel downloads
+(and several batches or sessions at once) multiply whatever limit each is
+given. The governor sits in the progress hook instead: every running
+download holds a Lease, reports the bytes of each block it receives and
+is put to sleep by its own token bucket when it gets ahead of its share.
+
+Shares are recomputed whenever a download starts or ends, or a limit
+changes: the global rate is split max-min fairly, so downloads held below
+an equal share by their own cap (per download, or their session's cap
+divided among the session's downloads) leave the rest to the others.
+Transfers handed to aria2c do not report blocks; only their per-download
+cap (yt-dlp's ratelimit) applies.
+"""
+import os
+import threading
+import time
+from collections import deque
+
+BANDWIDTH_LIMIT_ENV = 'YTDL_BANDWIDTH_LIMIT'
+# A bucket may run this many seconds ahead of its rate after an idle spell
+BURST_SECONDS = 1.0
+MIN_BURST_BYTES = 64 * 1024
+# Sleeps are cut into slices so cancellation is noticed promptly
+MAX_SLEEP_SLICE = 0.5
+# Throughput is measured over this many recent seconds
+THROUGHPUT_WINDOW = 5.0
+
+_default_governor = None
+_default_governor_lock = threading.Lock()
+
+
+def parse_rate(value):
+    """'2.5M', '500K', '1000000' -> bytes per second; empty or 0 -> None (no limit)"""
+    if value is None or value == '':
+        return None
+    if isinstance(value, (int, float)):
+        return float(value) or None
+    value = str(value).strip().upper().replace('/S', '').rstrip('B')
+    multiplier = 1
+    for suffix, factor in (('K', 1024), ('M', 1024 ** 2), ('G', 1024 ** 3)):
+        if value.endswith(suffix):
+            value, multiplier = value[:-1], factor
+            break
+    return float(value) * multiplier or None
+
+
+def allocate(total, caps):
+    """Max-min fair split of total between keys whose demand is capped by caps[key]
+
+    None means unlimited, both for total and for a cap; keys get None when
+    nothing limits them.
+    """
+    shares = {}
+    pending = dict(caps)
+    remaining = total
+    while pending:
+        share = remaining / len(pending) if remaining is not None else None
+        capped = {key: cap for key, cap in pending.items() if cap is not None and (share is None or cap <= share)}
+        if not capped:
+            shares.update((key, share) for key in pending)
+            break
+        for key, cap in capped.items():
+            shares[key] = cap
+            del pending[key]
+            if remaining is not None:
+                remaining -= cap
+    return shares
+
+
+class TokenBucket:
+    """Token bucket that lets consumers go into debt and tells them how long to sleep"""
+    def __init__(self, rate=None):
+        self.rate = None
+        self.tokens = 0.0
+        self.updated = time.monotonic()
+        self.set_rate(rate)
+
+    @property
+    def capacity(self):
+        return max(self.rate * BURST_SECONDS, MIN_BURST_BYTES)
+
+    def set_rate(self, rate):
+        self._refill()
+        self.rate = rate
+        if rate is not None:
+            self.tokens = min(self.tokens, self.capacity)
+
+    def _refill(self):
+        now = time.monotonic()
+        if self.rate is not None:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def consume(self, nbytes):
+        """Take nbytes; returns the seconds to wait until the bucket is out of debt"""
+        self._refill()
+        if self.rate is None:
+            return 0.0
+        self.tokens -= nbytes
+        return -self.tokens / self.rate if self.tokens < 0 else 0.0
+
+
+class Lease:
+    """One running download's claim on the bandwidth"""
+    def __init__(self, governor, key, group=None, cap=None):
+        self.governor = governor
+        self.key = key
+        self.group = group
+        self.cap = cap
+        self.bucket = TokenBucket()
+        self.bytes = 0
+
+    @property
+    def rate(self):
+        return self.bucket.rate
+
+    def consume(self, nbytes, stop_event=None):
+        """Account for nbytes just received, sleeping while this download is over its share"""
+        if nbytes <= 0:
+            return
+        with self.governor._lock:
+            self.bytes += nbytes
+            self.governor._record(self.group, nbytes)
+            delay = self.bucket.consume(nbytes)
+        while delay > 0 and not (stop_event is not None and stop_event.is_set()):
+            step = min(delay, MAX_SLEEP_SLICE)
+            time.sleep(step)
+            delay -= step
+
+    def release(self):
+        self.governor.release(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+
+class BandwidthGovernor:
+    """Global and per-session bandwidth limits for every download of the process
+
+    rate is the total for all downloads in bytes per second (None for no
+    limit). Sessions (a Streamlit session, a batch) get their own cap with
+    set_group_rate(); single downloads get theirs when they acquire a lease.
+    """
+    def __init__(self, rate=None):
+        self.rate = rate
+        self.group_rates = {}
+        self._leases = {}
+        self._samples = deque()
+        self._lock = threading.Lock()
+
+    def set_rate(self, rate):
+        """Change the global limit; running downloads are rebalanced at once"""
+        with self._lock:
+            self.rate = rate or None
+            self._rebalance()
+
+    def set_group_rate(self, group, rate):
+        with self._lock:
+            if rate:
+                self.group_rates[group] = rate
+            else:
+                self.group_rates.pop(group, None)
+            self._rebalance()
+
+    def acquire(self, key, group=None, cap=None):
+        """Register a starting download and return its Lease"""
+        lease = Lease(self, key, group, cap or None)
+        with self._lock:
+            self._leases[key] = lease
+            self._rebalance()
+        return lease
+
+    def release(self, lease):
+        with self._lock:
+            if self._leases.get(lease.key) is lease:
+                del self._leases[lease.key]
+                self._rebalance()
+
+    def _rebalance(self):
+        # Called with the lock held
+        members = {}
+        for lease in self._leases.values():
+            members[lease.group] = members.get(lease.group, 0) + 1
+        caps = {}
+        for key, lease in self._leases.items():
+            cap = lease.cap
+            group_rate = self.group_rates.get(lease.group) if lease.group is not None else None
+            if group_rate is not None:
+                share = group_rate / members[lease.group]
+                cap = share if cap is None else min(cap, share)
+            caps[key] = cap
+        for key, share in allocate(self.rate, caps).items():
+            self._leases[key].bucket.set_rate(share)
+
+    def _record(self, group, nbytes):
+        # Called with the lock held
+        now = time.monotonic()
+        self._samples.append((now, group, nbytes))
+        while self._samples and now - self._samples[0][0] > THROUGHPUT_WINDOW:
+            self._samples.popleft()
+
+    def stats(self, group=None):
+        """Current limits and measured throughput (of one group, if given)"""
+        with self._lock:
+            now = time.monotonic()
+            samples = [(t, g, n) for t, g, n in self._samples if now - t <= THROUGHPUT_WINDOW]
+            leases = [lease for lease in self._leases.values() if group is None or lease.group == group]
+            group_bytes = sum(n for t, g, n in samples if group is None or g == group)
+            # Right after the first downloads start the window is not full yet
+            span = max(now - samples[0][0], 1.0) if samples else THROUGHPUT_WINDOW
+            return {
+                'rate_limit': self.rate,
+                'group_rate_limit': self.group_rates.get(group) if group is not None else None,
+                'active': len(leases),
+                'bytes_per_second': group_bytes / span,
+                'total_bytes_per_second': sum(n for t, g, n in samples) / span,
+                'shares': {lease.key: lease.rate for lease in leases},
+            }
+
+
+def get_default_governor():
+    """Return the process-wide BandwidthGovernor (initial limit from YTDL_BANDWIDTH_LIMIT)"""
+    global _default_governor
+    with _default_governor_lock:
+        if _default_governor is None:
+            _default_governor = BandwidthGovernor(parse_rate(os.environ.get(BANDWIDTH_LIMIT_ENV)))
+        return _default_governor
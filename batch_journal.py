@@ -0,0 +1,264 @@
+"""Durable journal of download batches and the state of every URL in them.
+
+Each batch records its URLs, download path and options; each URL moves
+through queued -> extracting -> downloading -> merging -> done (or failed,
+or skipped when a filter turned it down) with the bytes written so far.
+Entries of an expanded playlist or channel record the collection they came
+from, so a resumed batch applies the collection's filters to them again. The journal lives next to the download
+archive, so a batch whose process died (a Streamlit server restart, a
+killed daemon) can be resumed: finished URLs are not fetched again and
+partially written files are continued by yt-dlp. A batch counts as
+interrupted when the process that ran it is gone; besides its pid, the
+journal records the process's boot id and start time, since a restarted
+container often gives the new server the old server's pid.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from download_archive import APP_DATA_DIR
+
+DEFAULT_JOURNAL_PATH = os.path.join(APP_DATA_DIR, "batch_journal.sqlite3")
+ITEM_STATES = ('queued', 'extracting', 'downloading', 'merging', 'done', 'skipped', 'failed')
+# States a URL does not leave; a batch with only these left is finished
+FINISHED_STATES = ('done', 'skipped', 'failed')
+# Byte counters are written at most this often per URL; state changes always are
+PROGRESS_WRITE_INTERVAL = 2.0
+
+_default_journal = None
+_default_journal_lock = threading.Lock()
+
+
+def process_identity(pid):
+    """'<boot id>:<start time>' of a process, which tells a reused pid apart; None where unknown"""
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            stat = f.read()
+        with open("/proc/sys/kernel/random/boot_id") as f:
+            boot_id = f.read().strip()
+    except OSError:
+        return None
+    # Fields after the command name, which is in parentheses and may contain spaces;
+    # the start time is field 22 of the whole line
+    fields = stat.rsplit(')', 1)[-1].split()
+    return f"{boot_id}:{fields[19]}" if len(fields) > 19 else None
+
+
+def pid_alive(pid):
+    """True if a process with this pid exists"""
+    if not pid:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    except OSError:
+        return False
+    return True
+
+
+def process_running(pid, identity=None):
+    """True if the process recorded as (pid, identity) still runs, not just some process with its pid"""
+    if not pid_alive(pid):
+        return False
+    if identity is None:
+        return True
+    current = process_identity(pid)
+    return current is None or current == identity
+
+
+class BatchJournal:
+    """SQLite-backed record of batches, safe to share between threads and processes"""
+    def __init__(self, path=DEFAULT_JOURNAL_PATH):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self._lock = threading.Lock()
+        self._last_progress_write = {}
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                """CREATE TABLE IF NOT EXISTS batches (
+                    batch_id TEXT PRIMARY KEY,
+                    owner TEXT,
+                    pid INTEGER,
+                    process_identity TEXT,
+                    download_path TEXT NOT NULL,
+                    options TEXT,
+                    status TEXT NOT NULL,
+                    created_at REAL,
+                    updated_at REAL
+                )"""
+            )
+            self._conn.execute(
+                """CREATE TABLE IF NOT EXISTS items (
+                    batch_id TEXT NOT NULL,
+                    position INTEGER NOT NULL,
+                    url TEXT NOT NULL,
+                    state TEXT NOT NULL,
+                    bytes_done INTEGER DEFAULT 0,
+                    total_bytes INTEGER,
+                    filepaths TEXT,
+                    error TEXT,
+                    source TEXT,
+                    updated_at REAL,
+                    PRIMARY KEY (batch_id, url)
+                )"""
+            )
+            # Journals written before these columns existed
+            columns = [row['name'] for row in self._conn.execute("PRAGMA table_info(batches)")]
+            if 'process_identity' not in columns:
+                self._conn.execute("ALTER TABLE batches ADD COLUMN process_identity TEXT")
+            columns = [row['name'] for row in self._conn.execute("PRAGMA table_info(items)")]
+            if 'source' not in columns:
+                self._conn.execute("ALTER TABLE items ADD COLUMN source TEXT")
+
+    def start_batch(self, batch_id, urls, download_path, options=None, owner='app'):
+        """Record a batch as running in this process; an existing batch keeps its item states"""
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                """INSERT INTO batches (batch_id, owner, pid, process_identity, download_path, options, status, created_at, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, 'running', ?, ?)
+                ON CONFLICT(batch_id) DO UPDATE SET owner = excluded.owner, pid = excluded.pid,
+                    process_identity = excluded.process_identity, status = 'running', updated_at = excluded.updated_at""",
+                (batch_id, owner, os.getpid(), process_identity(os.getpid()), download_path, json.dumps(options or {}), now, now)
+            )
+            self._conn.executemany(
+                """INSERT OR IGNORE INTO items (batch_id, position, url, state, updated_at)
+                VALUES (?, ?, ?, 'queued', ?)""",
+                [(batch_id, position, url, now) for position, url in enumerate(urls)]
+            )
+
+    def add_items(self, batch_id, urls, source=None):
+        """Append URLs to a running batch (entries of the expanded collection source); known URLs are kept"""
+        now = time.time()
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                "SELECT COALESCE(MAX(position), -1) FROM items WHERE batch_id = ?", (batch_id,)
+            ).fetchone()
+            self._conn.executemany(
+                """INSERT OR IGNORE INTO items (batch_id, position, url, state, source, updated_at)
+                VALUES (?, ?, ?, 'queued', ?, ?)""",
+                [(batch_id, row[0] + 1 + offset, url, source, now) for offset, url in enumerate(urls)]
+            )
+
+    def finish_batch(self, batch_id, status='done'):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE batches SET status = ?, updated_at = ? WHERE batch_id = ?",
+                (status, time.time(), batch_id)
+            )
+
+    def set_state(self, batch_id, url, state, filepaths=None, error=None):
+        """Move one URL to a new state"""
+        assert state in ITEM_STATES, state
+        fields = {'state': state, 'updated_at': time.time()}
+        if filepaths is not None:
+            fields['filepaths'] = json.dumps(list(filepaths))
+        if error is not None:
+            fields['error'] = error
+        assignments = ", ".join(f"{name} = :{name}" for name in fields)
+        with self._lock, self._conn:
+            self._conn.execute(
+                f"UPDATE items SET {assignments} WHERE batch_id = :batch_id AND url = :url",
+                dict(fields, batch_id=batch_id, url=url)
+            )
+            self._last_progress_write.pop((batch_id, url), None)
+
+    def replace_filepath(self, batch_id, old_path, new_path):
+        """Swap old_path for new_path in the output files of a batch's URLs"""
+        with self._lock, self._conn:
+            rows = self._conn.execute(
+                "SELECT url, filepaths FROM items WHERE batch_id = ? AND filepaths LIKE ?",
+                (batch_id, '%' + json.dumps(old_path)[1:-1] + '%')
+            ).fetchall()
+            for row in rows:
+                filepaths = [new_path if path == old_path else path for path in json.loads(row['filepaths'])]
+                self._conn.execute(
+                    "UPDATE items SET filepaths = ? WHERE batch_id = ? AND url = ?",
+                    (json.dumps(list(dict.fromkeys(filepaths))), batch_id, row['url'])
+                )
+
+    def update_progress(self, batch_id, url, downloaded_bytes, total_bytes=None):
+        """Record bytes written for a downloading URL, throttled per URL"""
+        key = (batch_id, url)
+        now = time.monotonic()
+        with self._lock:
+            if now - self._last_progress_write.get(key, 0.0) < PROGRESS_WRITE_INTERVAL:
+                return
+            self._last_progress_write[key] = now
+            with self._conn:
+                self._conn.execute(
+                    """UPDATE items SET state = 'downloading', bytes_done = ?, total_bytes = ?, updated_at = ?
+                    WHERE batch_id = ? AND url = ?""",
+                    (downloaded_bytes or 0, total_bytes, time.time(), batch_id, url)
+                )
+
+    def get_batch(self, batch_id):
+        """Return the batch row as a dict with its items, or None"""
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM batches WHERE batch_id = ?", (batch_id,)).fetchone()
+            if row is None:
+                return None
+            items = self._conn.execute(
+                "SELECT * FROM items WHERE batch_id = ? ORDER BY position", (batch_id,)
+            ).fetchall()
+        return self._batch_dict(row, items)
+
+    def get_item(self, batch_id, url):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT * FROM items WHERE batch_id = ? AND url = ?", (batch_id, url)
+            ).fetchone()
+        return self._item_dict(row) if row is not None else None
+
+    def interrupted_batches(self, owner=None, include_cancelled=False):
+        """Return running batches whose process is gone and that still have unfinished URLs
+
+        With include_cancelled, batches stopped by the user count as well.
+        """
+        statuses = ('running', 'cancelled') if include_cancelled else ('running',)
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT * FROM batches WHERE status IN ({', '.join('?' * len(statuses))}) ORDER BY created_at",
+                statuses
+            ).fetchall()
+        batches = []
+        for row in rows:
+            if (owner is not None and row['owner'] != owner) or process_running(row['pid'], row['process_identity']):
+                continue
+            batch = self.get_batch(row['batch_id'])
+            if any(item['state'] not in FINISHED_STATES for item in batch['items']):
+                batches.append(batch)
+        return batches
+
+    def _item_dict(self, row):
+        item = dict(row)
+        item['filepaths'] = json.loads(item['filepaths']) if item['filepaths'] else []
+        return item
+
+    def _batch_dict(self, row, items):
+        batch = dict(row)
+        batch['options'] = json.loads(batch['options']) if batch['options'] else {}
+        batch['items'] = [self._item_dict(item) for item in items]
+        batch['urls'] = [item['url'] for item in batch['items']]
+        return batch
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def get_default_journal():
+    """Return the process-wide journal stored under the user's home directory"""
+    global _default_journal
+    with _default_journal_lock:
+        if _default_journal is None:
+            _default_journal = BatchJournal()
+        return _default_journal
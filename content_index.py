@@ -0,0 +1,220 @@
+"""Content-hash index of downloaded files and duplicate-output handling.
+
+The same video reached through different URLs (a short and a watch link, a
+playlist entry and a single link, two titles for one upload) ends up on
+disk twice. After a batch, deduplicate() hashes each new output on a worker
+pool and compares it with the indexed files of the same size in the download
+directory; duplicates are replaced by hardlinks to the existing copy or
+removed, and the bytes saved are reported.
+
+Hashes are cached in a SQLite index keyed by path and validated against the
+file's size and mtime, so a file is hashed once no matter how many batches
+compare against it. Candidates are looked up by size in the index rather
+than by listing the directory, so the cost is independent of the size of
+the directory. Every archived or deduplicated download is indexed; files
+that reached the directory some other way are not compared against.
+"""
+import os
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from download_archive import APP_DATA_DIR, hash_file
+
+DEFAULT_INDEX_PATH = os.path.join(APP_DATA_DIR, "content_index.sqlite3")
+DEFAULT_HASH_WORKERS = 4
+# hardlink: replace the new copy by a link to the existing file
+# delete: remove the new copy and use the existing file
+# report: only report duplicates
+DEDUPE_MODES = ('hardlink', 'delete', 'report')
+DEFAULT_DEDUPE_MODE = 'hardlink'
+
+_default_index = None
+_default_index_lock = threading.Lock()
+
+
+class DedupeReport:
+    """Duplicates found among a batch's outputs and what was done about them"""
+    def __init__(self, mode):
+        self.mode = mode
+        self.duplicates = []
+        self.errors = []
+        self.saved_bytes = 0
+
+    def add(self, path, original, size, action):
+        self.duplicates.append({'path': path, 'original': original, 'size': size, 'action': action})
+        if action in ('hardlinked', 'deleted'):
+            self.saved_bytes += size
+
+    def outputs(self, paths):
+        """Map a list of output paths to the files that now hold their content"""
+        replaced = {d['path']: d['original'] for d in self.duplicates if d['action'] == 'deleted'}
+        return [replaced.get(path, path) for path in paths]
+
+    def to_dict(self):
+        return {
+            'mode': self.mode,
+            'duplicates': self.duplicates,
+            'errors': self.errors,
+            'saved_bytes': self.saved_bytes,
+        }
+
+
+class ContentIndex:
+    """SQLite cache of file content hashes, invalidated by size and mtime"""
+    def __init__(self, path=DEFAULT_INDEX_PATH):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                """CREATE TABLE IF NOT EXISTS files (
+                    path TEXT PRIMARY KEY,
+                    size INTEGER NOT NULL,
+                    mtime_ns INTEGER NOT NULL,
+                    content_hash TEXT NOT NULL
+                )"""
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS files_by_hash ON files (size, content_hash)")
+
+    def file_hash(self, filepath):
+        """Return the SHA-256 of a file, hashing it only if it changed since last time"""
+        filepath = os.path.abspath(filepath)
+        st = os.stat(filepath)
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT size, mtime_ns, content_hash FROM files WHERE path = ?", (filepath,)
+            ).fetchone()
+        if row is not None and row[0] == st.st_size and row[1] == st.st_mtime_ns:
+            return row[2]
+
+        content_hash = hash_file(filepath)
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO files (path, size, mtime_ns, content_hash) VALUES (?, ?, ?, ?)",
+                (filepath, st.st_size, st.st_mtime_ns, content_hash)
+            )
+        return content_hash
+
+    def files_with_sizes(self, sizes, directory=None):
+        """Return {path: size} of indexed files with one of the given sizes, in directory if given"""
+        sizes = list(set(sizes))
+        if not sizes:
+            return {}
+        directory = os.path.abspath(directory) if directory is not None else None
+        rows = []
+        with self._lock:
+            # Older SQLite builds allow 999 parameters per statement
+            for start in range(0, len(sizes), 500):
+                chunk = sizes[start:start + 500]
+                rows += self._conn.execute(
+                    f"SELECT path, size FROM files WHERE size IN ({', '.join('?' * len(chunk))})", chunk
+                ).fetchall()
+        return {path: size for path, size in rows if directory is None or os.path.dirname(path) == directory}
+
+    def forget(self, filepath):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM files WHERE path = ?", (os.path.abspath(filepath),))
+
+    def hash_files(self, filepaths, max_workers=DEFAULT_HASH_WORKERS):
+        """Return {path: hash} for the given files, hashed on a worker pool; unreadable files are left out"""
+        def safe_hash(path):
+            try:
+                return path, self.file_hash(path)
+            except OSError:
+                return path, None
+
+        filepaths = list(dict.fromkeys(filepaths))
+        if not filepaths:
+            return {}
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(filepaths)), thread_name_prefix="ContentHash") as pool:
+            return {path: content_hash for path, content_hash in pool.map(safe_hash, filepaths) if content_hash}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def _same_file(a, b):
+    try:
+        return os.path.samefile(a, b)
+    except OSError:
+        return False
+
+
+def _replace_with_hardlink(path, original):
+    """Atomically replace path by a hardlink to original"""
+    tmp_path = path + ".dedupe-link"
+    os.link(original, tmp_path)
+    try:
+        os.replace(tmp_path, path)
+    except OSError:
+        os.remove(tmp_path)
+        raise
+
+
+def deduplicate(outputs, directory, mode=DEFAULT_DEDUPE_MODE, index=None, max_workers=DEFAULT_HASH_WORKERS):
+    """Find outputs whose content already exists in directory (or earlier in outputs)
+
+    Candidates are the indexed files in directory with exactly the size of
+    an output; only those and the outputs themselves are hashed (or found
+    unchanged in the index). Returns a DedupeReport.
+    """
+    assert mode in DEDUPE_MODES, mode
+    index = index or get_default_index()
+    report = DedupeReport(mode)
+    outputs = [os.path.abspath(path) for path in outputs if os.path.isfile(path)]
+    if not outputs:
+        return report
+
+    sizes = {path: os.path.getsize(path) for path in outputs}
+    candidates = {}
+    for path, size in index.files_with_sizes(sizes.values(), directory).items():
+        if os.path.isfile(path):
+            candidates[path] = size
+        else:
+            index.forget(path)
+    hashes = index.hash_files(outputs + list(candidates), max_workers)
+
+    # Files that were there before the batch win, so the older copy is kept
+    originals = {}
+    for path, size in candidates.items():
+        if path not in sizes and path in hashes:
+            originals.setdefault((size, hashes[path]), path)
+
+    for path in outputs:
+        if path not in hashes:
+            continue
+        key = (sizes[path], hashes[path])
+        original = originals.get(key)
+        if original is None or _same_file(original, path):
+            originals.setdefault(key, path)
+            if original is not None:
+                report.add(path, original, sizes[path], 'already linked')
+            continue
+        try:
+            if mode == 'hardlink':
+                _replace_with_hardlink(path, original)
+                report.add(path, original, sizes[path], 'hardlinked')
+            elif mode == 'delete':
+                os.remove(path)
+                index.forget(path)
+                report.add(path, original, sizes[path], 'deleted')
+            else:
+                report.add(path, original, sizes[path], 'found')
+        except OSError as e:
+            # Hardlinks fail across filesystems; the duplicate is still reported
+            report.errors.append(f"{os.path.basename(path)}: {e}")
+            report.add(path, original, sizes[path], 'found')
+    return report
+
+
+def get_default_index():
+    """Return the process-wide index stored under the user's home directory"""
+    global _default_index
+    with _default_index_lock:
+        if _default_index is None:
+            _default_index = ContentIndex()
+        return _default_index
@@ -0,0 +1,74 @@
+"""Bounded ring-buffer store for structured debug records.
+
+Appending is O(1) and never copies the buffer. Every record gets a
+monotonically increasing sequence number, so a reader such as the Streamlit
+sidebar keeps a cursor and fetches only the records it has not seen yet.
+"""
+import itertools
+import threading
+import time
+from collections import deque, namedtuple
+from datetime import datetime
+
+DEFAULT_CAPACITY = 500
+LEVELS = ('DEBUG', 'INFO', 'WARNING', 'ERROR')
+
+
+class LogRecord(namedtuple('LogRecord', 'seq created level source message')):
+    """One debug record; ``created`` is a time.time() timestamp"""
+    __slots__ = ()
+
+    def format(self):
+        timestamp = datetime.fromtimestamp(self.created).strftime("%H:%M:%S.%f")[:-3]
+        return f"[{timestamp}] {self.level} {self.source}: {self.message}"
+
+
+class DebugLog:
+    """Fixed-capacity, thread-safe log with cursor-based incremental reads"""
+    def __init__(self, capacity=DEFAULT_CAPACITY):
+        self.capacity = capacity
+        self._records = deque(maxlen=capacity)
+        self._seq = itertools.count(1)
+        self._last_seq = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._records)
+
+    @property
+    def last_seq(self):
+        return self._last_seq
+
+    def append(self, message, level='DEBUG', source='app'):
+        """Store a record and return it"""
+        created = time.time()
+        with self._lock:
+            seq = next(self._seq)
+            record = LogRecord(seq, created, level, source, message)
+            self._records.append(record)
+            self._last_seq = seq
+        return record
+
+    def read_since(self, cursor=0, level=None):
+        """Return (records newer than cursor, new cursor)
+
+        Only the new records are touched, so the cost depends on how much was
+        logged since the last read, not on the size of the buffer. Records
+        that were overwritten before being read are skipped.
+        """
+        with self._lock:
+            new_count = min(self._last_seq - cursor, len(self._records))
+            if new_count <= 0:
+                return [], self._last_seq
+            records = list(itertools.islice(reversed(self._records), new_count))
+            last_seq = self._last_seq
+        records.reverse()
+        if level is not None:
+            records = [r for r in records if LEVELS.index(r.level) >= LEVELS.index(level)]
+        return records, last_seq
+
+    def clear(self):
+        with self._lock:
+            self._records.clear()
+
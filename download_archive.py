@@ -0,0 +1,240 @@
+"""Persistent index of completed downloads, keyed by extractor, video id and preset.
+
+Both the Streamlit app and the Tk app consult this archive before asking
+yt-dlp for anything, so re-submitting a URL (or a playlist containing it)
+skips videos that are already on disk without an extractor round-trip.
+A video only counts as downloaded for the quality preset it was fetched
+with; asking for another preset downloads it again.
+"""
+import hashlib
+import mmap
+import os
+import re
+import sqlite3
+import threading
+from datetime import datetime
+from urllib.parse import parse_qs, urlparse
+
+APP_DATA_DIR = os.path.join(os.path.expanduser("~"), ".youtube_downloader")
+DEFAULT_ARCHIVE_PATH = os.path.join(APP_DATA_DIR, "download_archive.sqlite3")
+HASH_CHUNK_SIZE = 1024 * 1024
+
+YOUTUBE_HOSTS = {'youtube.com', 'www.youtube.com', 'm.youtube.com', 'music.youtube.com', 'youtube-nocookie.com', 'www.youtube-nocookie.com'}
+YOUTUBE_ID_RE = re.compile(r'^[0-9A-Za-z_-]{11}$')
+YOUTUBE_PATH_PREFIXES = ('/shorts/', '/embed/', '/live/', '/v/')
+
+# Preset of records written before presets were part of the key; matches no preset
+UNKNOWN_PRESET = ''
+
+_default_archive = None
+_default_archive_lock = threading.Lock()
+
+
+def parse_video_id(url):
+    """Return (extractor, video_id) for a single-video URL without any network access"""
+    parsed = urlparse(url.strip())
+    host = (parsed.hostname or '').lower()
+    video_id = None
+
+    if host == 'youtu.be':
+        video_id = parsed.path.lstrip('/').split('/')[0]
+    elif host in YOUTUBE_HOSTS:
+        if parsed.path == '/watch':
+            video_id = parse_qs(parsed.query).get('v', [None])[0]
+        else:
+            for prefix in YOUTUBE_PATH_PREFIXES:
+                if parsed.path.startswith(prefix):
+                    video_id = parsed.path[len(prefix):].split('/')[0]
+                    break
+
+    if video_id and YOUTUBE_ID_RE.match(video_id):
+        return 'youtube', video_id
+    return None
+
+
+def hash_file(filepath, chunk_size=HASH_CHUNK_SIZE):
+    """Return the SHA-256 hex digest of a file
+
+    The file is memory-mapped and fed to the hash in chunk_size slices, so
+    nothing is copied into Python buffers and hashlib can release the GIL
+    while it works; hashing several files on a thread pool runs in parallel.
+    """
+    digest = hashlib.sha256()
+    with open(filepath, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return digest.hexdigest()
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            view = memoryview(data)
+            try:
+                for offset in range(0, len(data), chunk_size):
+                    digest.update(view[offset:offset + chunk_size])
+            finally:
+                view.release()
+    return digest.hexdigest()
+
+
+def iter_video_infos(info):
+    """Yield every video info dict contained in an extract_info() result"""
+    if not info:
+        return
+    if info.get('_type') in ('playlist', 'multi_video'):
+        for entry in info.get('entries') or []:
+            yield from iter_video_infos(entry)
+    else:
+        yield info
+
+
+def get_output_path(info):
+    """Return the final file path yt-dlp wrote for a video info dict"""
+    for download in info.get('requested_downloads') or []:
+        if download.get('filepath'):
+            return download['filepath']
+    return info.get('filepath') or info.get('_filename')
+
+
+class DownloadArchive:
+    """SQLite-backed record of completed videos.
+
+    Lookups hit an in-memory dict first and fall back to the primary-key
+    index, so they stay cheap even for archives with many thousands of rows
+    and pick up rows written by another process.
+    """
+    def __init__(self, path=DEFAULT_ARCHIVE_PATH):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            unkeyed = self._rename_unkeyed_table()
+            self._conn.execute(
+                """CREATE TABLE IF NOT EXISTS downloads (
+                    extractor TEXT NOT NULL,
+                    video_id TEXT NOT NULL,
+                    preset TEXT NOT NULL,
+                    format_id TEXT,
+                    filepath TEXT,
+                    filesize INTEGER,
+                    content_hash TEXT,
+                    completed_at TEXT,
+                    PRIMARY KEY (extractor, video_id, preset)
+                )"""
+            )
+            if unkeyed:
+                self._conn.execute(
+                    """INSERT INTO downloads
+                    SELECT extractor, video_id, ?, format_id, filepath, filesize, content_hash, completed_at
+                    FROM downloads_unkeyed""", (UNKNOWN_PRESET,)
+                )
+                self._conn.execute("DROP TABLE downloads_unkeyed")
+            self._records = {
+                (row['extractor'], row['video_id'], row['preset']): dict(row)
+                for row in self._conn.execute("SELECT * FROM downloads")
+            }
+
+    def _rename_unkeyed_table(self):
+        # Called with the lock held. Archives written before presets were part
+        # of the key are moved aside, to be copied into the new table
+        columns = [row['name'] for row in self._conn.execute("PRAGMA table_info(downloads)")]
+        if not columns or 'preset' in columns:
+            return False
+        self._conn.execute("ALTER TABLE downloads RENAME TO downloads_unkeyed")
+        return True
+
+    def __len__(self):
+        with self._lock:
+            return len(self._records)
+
+    def get(self, extractor, video_id, preset):
+        """Return the stored record for a video downloaded with preset, or None"""
+        key = (extractor.lower(), video_id, preset)
+        with self._lock:
+            record = self._records.get(key)
+            if record is None:
+                row = self._conn.execute(
+                    "SELECT * FROM downloads WHERE extractor = ? AND video_id = ? AND preset = ?", key
+                ).fetchone()
+                if row is not None:
+                    record = self._records[key] = dict(row)
+        return record
+
+    def get_existing(self, extractor, video_id, preset):
+        """Return the record only if its output file is still on disk"""
+        record = self.get(extractor, video_id, preset)
+        if record and record.get('filepath') and os.path.isfile(record['filepath']):
+            return record
+        return None
+
+    def lookup_url(self, url, preset):
+        """Return the record for a single-video URL downloaded with preset whose file still exists"""
+        parsed = parse_video_id(url)
+        if parsed is None:
+            return None
+        return self.get_existing(*parsed, preset)
+
+    def update_filepath(self, old_path, new_path):
+        """Point the records of old_path at new_path, a file with the same content"""
+        old_path, new_path = os.path.abspath(old_path), os.path.abspath(new_path)
+        with self._lock, self._conn:
+            self._conn.execute("UPDATE downloads SET filepath = ? WHERE filepath = ?", (new_path, old_path))
+            for record in self._records.values():
+                if record['filepath'] == old_path:
+                    record['filepath'] = new_path
+
+    def record(self, info, preset, hasher=hash_file):
+        """Store every downloaded video in an extract_info() result under preset; return the new records
+
+        hasher(filepath) computes the content hash; pass a caching one such
+        as ContentIndex.file_hash to avoid hashing the same file twice.
+        """
+        added = []
+        for video in iter_video_infos(info):
+            extractor = (video.get('extractor_key') or video.get('ie_key') or '').lower()
+            video_id = video.get('id')
+            filepath = get_output_path(video)
+            if not extractor or not video_id or not filepath or not os.path.isfile(filepath):
+                continue
+            record = {
+                'extractor': extractor,
+                'video_id': video_id,
+                'preset': preset,
+                'format_id': video.get('format_id'),
+                'filepath': os.path.abspath(filepath),
+                'filesize': os.path.getsize(filepath),
+                'content_hash': hasher(filepath),
+                'completed_at': datetime.now().isoformat(),
+            }
+            with self._lock, self._conn:
+                self._conn.execute(
+                    """INSERT OR REPLACE INTO downloads
+                    (extractor, video_id, preset, format_id, filepath, filesize, content_hash, completed_at)
+                    VALUES (:extractor, :video_id, :preset, :format_id, :filepath, :filesize, :content_hash, :completed_at)""",
+                    record
+                )
+                self._records[(extractor, video_id, preset)] = record
+            added.append(record)
+        return added
+
+    def match_filter(self, info, *, incomplete=False, preset):
+        """yt-dlp match_filter (bind preset first): skip playlist entries that are already archived"""
+        extractor = info.get('extractor_key') or info.get('ie_key')
+        video_id = info.get('id')
+        if extractor and video_id and info.get('_type', 'video') in ('video', 'url', 'url_transparent'):
+            record = self.get_existing(extractor, video_id, preset)
+            if record:
+                return f"{video_id} is already in the download archive ({os.path.basename(record['filepath'])})"
+        return None
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def get_default_archive():
+    """Return the process-wide archive stored under the user's home directory"""
+    global _default_archive
+    with _default_archive_lock:
+        if _default_archive is None:
+            _default_archive = DownloadArchive()
+        return _default_archive
@@ -0,0 +1,727 @@
+"""UI-independent download loop shared by the Streamlit app and the job daemon.
+
+download_videos() runs one batch for a job_manager.Job: everything it has to
+say goes through the job (job.debug for the log, job.post for messages
+such as 'log', 'job', 'progress', 'output', 'skipped', 'estimate',
+'expanded', 'bandwidth', 'validation', 'dedupe', 'throughput' and 'complete'), so it can run inside the Streamlit process or in
+the background daemon alike.
+"""
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime
+
+import yt_dlp
+
+from bandwidth_governor import get_default_governor
+from batch_journal import get_default_journal
+from content_index import DEFAULT_DEDUPE_MODE, deduplicate, get_default_index
+from download_archive import get_default_archive, hash_file, get_output_path, iter_video_infos
+from download_scheduler import DownloadScheduler, DEFAULT_MAX_CONCURRENT, DEFAULT_PER_HOST_LIMIT
+from ffmpeg_toolchain import get_toolchain
+from format_presets import DEFAULT_PRESET, make_format_selector
+from formatting import format_bytes
+from media_validator import validate_files
+from metadata_cache import extract_info_cached
+from output_tracker import OutputTracker, get_snapshot
+from path_health import get_path_health
+from playlist_expander import DEFAULT_EXPANSION_WORKERS, PlaylistFilters, expand_url, is_collection_url
+from postprocess_pipeline import DeferredPostProcessingYDL, PostProcessPipeline
+from preflight import DiskAdmission, run_preflight
+from progress_pipeline import ProgressCoalescer, DEFAULT_MAX_RATE
+from throughput_profiles import DEFAULT_PROFILE, apply_profile
+from url_canonical import canonicalize_url, dedupe_urls
+
+# An 'expanded' message is posted after this many entries of a collection
+EXPANSION_REPORT_EVERY = 25
+
+
+class JobLogger:
+    """Logger for yt-dlp that reports to one job's log and status channel
+
+    yt-dlp sends its screen output to debug() as well; it is kept in the
+    job's log only. Its verbose '[debug] ' lines are kept only with verbose.
+    """
+    def __init__(self, job, verbose=False):
+        self.job = job
+        self.verbose = verbose
+
+    def debug(self, msg):
+        if msg.startswith('[debug] '):
+            if self.verbose:
+                self.job.debug(msg[len('[debug] '):].strip(), source='yt-dlp')
+        else:
+            self.job.debug(msg.strip(), 'INFO', 'yt-dlp')
+
+    def info(self, msg):
+        self.job.debug(msg.strip(), 'INFO', 'yt-dlp')
+        try:
+            self.job.post('log', f"ℹ️ {msg.strip()}")
+        except:
+            pass
+
+    def warning(self, msg):
+        self.job.debug(msg.strip(), 'WARNING', 'yt-dlp')
+        try:
+            self.job.post('log', f"⚠️ WARNING: {msg.strip()}")
+        except:
+            pass
+
+    def error(self, msg):
+        self.job.debug(msg.strip(), 'ERROR', 'yt-dlp')
+        try:
+            self.job.post('log', f"❌ ERROR: {msg.strip()}")
+        except:
+            pass
+
+
+def ytdlp_progress_hook(d, session_job, job_id=None, coalescer=None, debug=False):
+    """Progress hook for yt-dlp downloads
+    
+    Events are handed to the coalescer, which forwards at most a few per
+    second per file to the session job's queue. Per-key debug logging only
+    happens when debug mode is on.
+    """
+    # Raising from the hook is how yt-dlp aborts a running download
+    if session_job.cancelled:
+        raise yt_dlp.utils.DownloadCancelled("Download stopped by user")
+    try:
+        if debug:
+            session_job.debug(f"[{job_id}] Progress hook called with status: {d.get('status', 'unknown')}", source='progress')
+            # Log all progress data for debugging
+            for key, value in d.items():
+                if key not in ['info_dict']:  # Skip large nested data
+                    session_job.debug(f"Progress {key}: {value}", source='progress')
+        
+        # Put progress data in queue for main thread to process, tagged with its job
+        if coalescer is not None:
+            coalescer.push(job_id, d)
+        else:
+            session_job.post('progress', job_id, d)
+    except Exception as e:
+        session_job.debug(f"Progress hook error: {e}", 'ERROR', 'progress')
+
+
+def download_videos(session_job, urls, download_path, max_concurrent=DEFAULT_MAX_CONCURRENT, per_host_limit=DEFAULT_PER_HOST_LIMIT, use_archive=True, debug=False, progress_rate=DEFAULT_MAX_RATE, owner='app', dedupe_mode=DEFAULT_DEDUPE_MODE, throughput_profile=DEFAULT_PROFILE, format_preset=DEFAULT_PRESET, preflight=True, quota_bytes=None, playlist_filters=None, rate_limit=None, session_rate_limit=None, global_rate_limit=None, more_urls=None):
+    """Download videos using yt-dlp with extensive debugging - NO UI ACCESS
+    
+    URLs are fanned out to a bounded pool of workers, each with its own
+    yt-dlp instance, so several videos download at the same time. With
+    use_archive, videos recorded in the download archive are skipped.
+    Progress events reach the UI at most progress_rate times per second per
+    file unless debug is on.
+    
+    Every URL's state is written to the batch journal under the job id, so
+    calling this again with the id of an interrupted batch resumes it:
+    URLs the journal has as done are not fetched again. URLs are reduced to
+    their canonical form first, and repeats of the same video dropped.
+    
+    Outputs whose content already exists in download_path are handled
+    according to dedupe_mode (see content_index.DEDUPE_MODES; None skips
+    the check). throughput_profile names the transfer settings from
+    throughput_profiles; it is reported with the batch's throughput.
+    format_preset names the quality preset from format_presets.
+    
+    With preflight, the size of every URL is estimated on a thread of its
+    own while the first downloads already run, and jobs only start while
+    their estimate fits in the free disk space and in quota_bytes (the most
+    the batch may write; None for no limit); a job whose estimate has not
+    arrived yet starts as one of unknown size. Jobs that can never fit fail
+    without being downloaded.
+    
+    Playlist and channel URLs are expanded page by page while the batch
+    runs, each entry becoming a job of its own as soon as it is known.
+    playlist_filters (a PlaylistFilters dict) limits the item range and the
+    duration and upload date of the entries; entries turned down by a
+    filter are journaled as skipped.
+    
+    Bandwidth is shared through the process-wide governor: rate_limit caps
+    each download, session_rate_limit the whole batch and global_rate_limit
+    (if given; 0 removes it) every download of the process, all in bytes
+    per second. Running downloads are rebalanced as they start and finish.
+    
+    more_urls is an optional iterator of further lists of URLs that join
+    the batch while it runs: the next list is taken whenever fewer than
+    max_concurrent jobs are waiting, so the workers never run dry between
+    lists and the lists are never all held at once. Each list is announced
+    with an 'added' message.
+    """
+    batch_id = session_job.job_id
+    journal = None
+    pipeline = None
+    coalescer = None
+    failed = False
+    governor = get_default_governor()
+    try:
+        session_job.debug("Starting download_videos function")
+        # Watch, short and mobile links to one video become a single job
+        urls, duplicates = dedupe_urls(urls)
+        for url, canonical in duplicates:
+            session_job.debug(f"Dropped duplicate URL {url} (same as {canonical})")
+        if duplicates:
+            session_job.post('log', f"♻️ Skipping {len(duplicates)} duplicate URL(s)")
+        session_job.debug(f"URLs to download: {urls}")
+        session_job.debug(f"Download path: {download_path}")
+        filters = PlaylistFilters.from_dict(playlist_filters)
+        
+        # Cached check, so starting a batch does not write-test the directory again
+        path_health = get_path_health()
+        health = path_health.check(download_path)
+        if not health.ok:
+            session_job.post('log', health.message)
+            return
+        
+        # Outputs are learned from yt-dlp's hooks; the directory is only
+        # scanned in debug mode, to show what else changed in it
+        tracker = OutputTracker()
+        initial_snapshot = None
+        if debug:
+            try:
+                initial_snapshot = get_snapshot(download_path)
+                session_job.debug(f"Files in directory before: {len(initial_snapshot)} files")
+            except OSError as e:
+                session_job.debug(f"Error scanning directory: {e}", 'ERROR')
+        
+        # Simple yt-dlp configuration for debugging (progress hooks are added per job)
+        ydl_opts = {
+            'outtmpl': os.path.join(download_path, '%(title)s.%(ext)s'),
+            'logger': JobLogger(session_job, verbose=debug),
+            'ignoreerrors': True,
+            'retries': 1,  # Only 1 retry for faster debugging
+            'socket_timeout': 15,  # Shorter timeout
+            'noplaylist': False,
+            'extract_flat': False,
+            'continue_dl': True,
+            'overwrites': False,
+            'verbose': debug,
+            # The progress hook drives the UI; yt-dlp's own progress lines would
+            # only flood the status log
+            'noprogress': not debug,
+            'quiet': False,
+            'no_warnings': False,
+        }
+        
+        # The governor throttles in the progress hook; yt-dlp's own limit
+        # keeps single downloads (and aria2c) smooth under the per-download cap
+        if rate_limit:
+            ydl_opts['ratelimit'] = rate_limit
+        if global_rate_limit is not None:
+            governor.set_rate(global_rate_limit)
+        governor.set_group_rate(batch_id, session_rate_limit)
+        limits = [f"{label} {format_bytes(rate)}/s" for label, rate in
+                  (('all downloads', governor.rate), ('this batch', session_rate_limit), ('each video', rate_limit)) if rate]
+        if limits:
+            session_job.post('log', f"📶 Bandwidth limits: {', '.join(limits)}")
+        
+        profile_info = apply_profile(ydl_opts, throughput_profile)
+        if profile_info['note']:
+            session_job.post('log', f"⚠️ {profile_info['note']}")
+        session_job.debug(f"Throughput profile: {profile_info}")
+        session_job.debug("yt-dlp options configured")
+        
+        # Persistent archive of finished videos: skips single URLs up front and
+        # playlist entries before yt-dlp resolves them
+        archive = None
+        if use_archive:
+            try:
+                archive = get_default_archive()
+                # Archived under another preset is not downloaded as far as this batch is concerned
+                ydl_opts['match_filter'] = lambda info, *, incomplete=False: archive.match_filter(info, incomplete=incomplete, preset=format_preset)
+                session_job.debug(f"Download archive loaded: {len(archive)} video(s) at {archive.path}")
+            except Exception as e:
+                session_job.debug(f"Download archive unavailable: {e}")
+        
+        # Durable per-URL state so the batch can be resumed after a crash
+        try:
+            journal = get_default_journal()
+            journal.start_batch(batch_id, urls, download_path, {
+                'max_concurrent': max_concurrent,
+                'per_host_limit': per_host_limit,
+                'use_archive': use_archive,
+                'debug': debug,
+                'dedupe_mode': dedupe_mode,
+                'throughput_profile': throughput_profile,
+                'format_preset': format_preset,
+                'preflight': preflight,
+                'quota_bytes': quota_bytes,
+                'playlist_filters': filters.to_dict(),
+                'rate_limit': rate_limit,
+                'session_rate_limit': session_rate_limit,
+            }, owner=owner)
+        except Exception as e:
+            journal = None
+            session_job.debug(f"Batch journal unavailable: {e}", 'ERROR')
+        
+        # URLs that came from expanding a playlist or channel, including those
+        # journaled by an earlier run of this batch
+        expanded_urls = set()
+        if journal is not None:
+            batch = journal.get_batch(batch_id)
+            expanded_urls.update(item['url'] for item in batch['items'] if item['source'])
+        
+        # Content hashes are cached, so archiving and deduplication hash each file once
+        content_index = None
+        try:
+            content_index = get_default_index()
+        except Exception as e:
+            session_job.debug(f"Content index unavailable: {e}", 'ERROR')
+        
+        # ffmpeg is located and probed once per process
+        toolchain = get_toolchain()
+        for note in toolchain.notes:
+            session_job.debug(f"ffmpeg: {note}", 'WARNING')
+        if toolchain.available:
+            if toolchain.location:
+                ydl_opts['ffmpeg_location'] = toolchain.location
+            session_job.debug(f"ffmpeg capabilities: {toolchain.to_dict()}")
+            session_job.post('log', f"🔧 Using {toolchain.describe()}")
+        else:
+            session_job.debug("ffmpeg not found")
+            session_job.post('log', "⚠️ Warning: ffmpeg not found")
+        
+        # Separate video and audio streams can only be merged with ffmpeg, and
+        # only into containers it can write; otherwise presets use single files
+        can_merge = toolchain.can_merge
+        ydl_opts['format'] = make_format_selector(format_preset, can_merge, toolchain.merge_containers())
+        session_job.debug(f"Format preset: {format_preset} (merging {'enabled' if can_merge else 'disabled'})")
+        
+        # Sizes are estimated next to the first downloads, so jobs only start
+        # while they fit on disk; a job picked before its estimate has
+        # arrived starts as one of unknown size
+        admission = None
+        estimators = []
+        if preflight:
+            admission = DiskAdmission(
+                download_path, {}, quota_bytes,
+                measure=lambda job: transferred.get(job.job_id, 0),
+                on_wait=lambda job, reason: session_job.post('log', f"💾 {job.job_id}: {reason}")
+            )
+        
+        def already_done(url):
+            item = journal.get_item(batch_id, url) if journal is not None else None
+            return (item and item['state'] in ('done', 'skipped')) or (archive is not None and archive.lookup_url(url, format_preset))
+        
+        def estimate_sizes(batch_urls, report):
+            try:
+                estimate = run_preflight(
+                    [url for url in batch_urls if not already_done(url)], format_preset,
+                    on_item=lambda item: admission.set_estimate(item.url, item.peak_bytes(format_preset)),
+                    stop_event=session_job.cancel_event
+                )
+            except Exception as e:
+                session_job.debug(f"Pre-flight failed: {e}", 'ERROR')
+                return
+            session_job.debug(f"Pre-flight estimate: {estimate.to_dict()}")
+            if report:
+                session_job.post('estimate', None, estimate.to_dict())
+                if estimate.items:
+                    session_job.post('log', f"📏 Batch estimate: {estimate.describe()}")
+        
+        def start_estimate(batch_urls, report=False):
+            """Estimate batch_urls on a thread of their own, handing each size to the admission as it is known"""
+            if admission is None:
+                return
+            thread = threading.Thread(target=estimate_sizes, args=(batch_urls, report), daemon=True, name=f"Preflight-{batch_id}")
+            thread.start()
+            estimators.append(thread)
+        
+        start_estimate(urls, report=True)
+        
+        more = " (more to follow)" if more_urls is not None else ""
+        session_job.post('log', f"🚀 **Starting download of {len(urls)} URL(s)**{more} ({max_concurrent} at a time)")
+        
+        coalescer = ProgressCoalescer(lambda job_id, d: session_job.post('progress', job_id, d), max_rate=progress_rate, full_fidelity=debug)
+        
+        def run_job(job):
+            """Download one URL in its own yt-dlp instance"""
+            with governor.acquire(job.job_id, batch_id, rate_limit) as lease:
+                session_job.post('bandwidth', None, governor.stats(batch_id))
+                return download_job(job, lease)
+        
+        def download_job(job, lease):
+            received = {}
+            
+            def progress_hook(d):
+                ytdlp_progress_hook(d, session_job, job.job_id, coalescer, debug)
+                if d.get('status') == 'downloading' and d.get('downloaded_bytes') is not None:
+                    # Fragments of one file may report from several threads
+                    with transfer_lock:
+                        filename = d.get('filename')
+                        delta = d['downloaded_bytes'] - received.get(filename, 0)
+                        received[filename] = d['downloaded_bytes']
+                    lease.consume(delta, session_job.cancel_event)
+                tracker.progress_hook(d, job.job_id)
+                # Files that were already on disk are reported without 'elapsed'
+                if d.get('status') == 'finished' and 'elapsed' in d:
+                    with transfer_lock:
+                        transferred[job.job_id] = transferred.get(job.job_id, 0) + (d.get('total_bytes') or d.get('downloaded_bytes') or 0)
+                if journal is not None:
+                    if d.get('status') == 'downloading':
+                        journal.update_progress(batch_id, job.url, d.get('downloaded_bytes'), d.get('total_bytes') or d.get('total_bytes_estimate'))
+                    elif d.get('status') == 'finished':
+                        # yt-dlp may still merge formats or post-process the file
+                        journal.set_state(batch_id, job.url, 'merging')
+            
+            job_opts = dict(ydl_opts)
+            job_opts['progress_hooks'] = [progress_hook]
+            job_opts['postprocessor_hooks'] = [lambda d: tracker.postprocessor_hook(d, job.job_id)]
+            job_opts['post_hooks'] = [lambda filepath: on_output(job, filepath)]
+            if job.url in expanded_urls and filters.has_limits:
+                # Flat playlist entries may lack the duration or date; check the full metadata
+                job_opts['match_filter'] = lambda info, *, incomplete=False: (
+                    filters.match_filter(info, incomplete=incomplete)
+                    or (archive.match_filter(info, incomplete=incomplete, preset=format_preset) if archive is not None else None))
+            # yt-dlp returns the info of a video its filter turned down as if it had downloaded it
+            rejections = []
+            match_filter = job_opts.get('match_filter')
+            if match_filter is not None:
+                def noting_filter(info, *, incomplete=False):
+                    reason = match_filter(info, incomplete=incomplete)
+                    if reason:
+                        rejections.append(reason)
+                    return reason
+                job_opts['match_filter'] = noting_filter
+            
+            if journal is not None:
+                item = journal.get_item(batch_id, job.url)
+                if item and item['state'] == 'skipped':
+                    session_job.debug(f"[{job.job_id}] Skipped in an earlier run of this batch: {item['error']}")
+                    return item
+                if item and item['state'] == 'done':
+                    existing = [path for path in item['filepaths'] if os.path.isfile(path)]
+                    if existing or not item['filepaths']:
+                        session_job.debug(f"[{job.job_id}] Already finished in an earlier run of this batch")
+                        for path in existing:
+                            session_job.post('skipped', job.job_id, path)
+                        return item
+            
+            if archive is not None:
+                record = archive.lookup_url(job.url, format_preset)
+                if record:
+                    session_job.debug(f"[{job.job_id}] Found in download archive: {record['filepath']}")
+                    session_job.post('skipped', job.job_id, record['filepath'])
+                    if journal is not None:
+                        journal.set_state(batch_id, job.url, 'done', filepaths=[record['filepath']])
+                    return record
+            
+            if journal is not None:
+                journal.set_state(batch_id, job.url, 'extracting')
+            
+            session_job.debug(f"[{job.job_id}] Creating yt-dlp instance for {job.url}")
+            session_job.post('log', f"📺 **{job.job_id}**: Starting {job.url}")
+            
+            ydl = DeferredPostProcessingYDL(job_opts)
+            handed_over = False
+            try:
+                session_job.debug(f"[{job.job_id}] Starting yt-dlp.download()")
+                download_start_time = datetime.now()
+                
+                # Reuses a fresh extraction from a preview or an earlier batch
+                info = extract_info_cached(ydl, job.url, download=True)
+                if not info and not session_job.cancelled:
+                    # With ignoreerrors yt-dlp reports failures by returning nothing
+                    raise yt_dlp.utils.DownloadError(f"Could not download {job.url}")
+                
+                download_duration = (datetime.now() - download_start_time).total_seconds()
+                session_job.debug(f"[{job.job_id}] Download completed in {download_duration:.2f} seconds")
+                
+                if info and rejections:
+                    skip_job(job, rejections[-1])
+                elif info:
+                    # Merging runs on the post-processing pool; this worker is
+                    # free for the next URL in the meantime. The job ends (and
+                    # the pipeline closes ydl) once its videos are post-processed.
+                    done = Future()
+                    handed_over = True
+                    queued = pipeline.submit(ydl, lambda errors: resolve(done, finish_job, job, info, errors))
+                    if queued:
+                        session_job.debug(f"[{job.job_id}] Queued post-processing of {queued} video(s)")
+                    return done
+                
+            except yt_dlp.utils.DownloadCancelled:
+                session_job.debug(f"[{job.job_id}] Download stopped by user")
+                session_job.post('log', f"🛑 Stopped: {job.url}")
+                
+            except yt_dlp.utils.DownloadError as e:
+                fail_job(job, f"❌ Download error: {e}", str(e))
+                raise
+                
+            except Exception as e:
+                fail_job(job, f"❌ Unexpected error: {e}", str(e))
+                raise
+            finally:
+                if not handed_over:
+                    ydl.close()
+        
+        def skip_job(job, reason):
+            """Report a URL that a filter turned down; nothing was written for it"""
+            session_job.debug(f"[{job.job_id}] Skipped: {reason}")
+            session_job.post('log', f"⏭️ Skipped {job.url}: {reason}")
+            if journal is not None:
+                journal.set_state(batch_id, job.url, 'skipped', filepaths=[], error=reason)
+        
+        def resolve(future, func, *args):
+            """Settle future with what func(*args) returns or raises"""
+            try:
+                future.set_result(func(*args))
+            except Exception as e:
+                future.set_exception(e)
+        
+        def fail_job(job, message, error_msg):
+            """Report a URL that failed, while downloading or post-processing"""
+            session_job.debug(f"[{job.job_id}] {message}", 'ERROR')
+            session_job.post('log', message)
+            if journal is not None:
+                journal.set_state(batch_id, job.url, 'failed', error=error_msg)
+        
+        def finish_job(job, info, errors):
+            """Record a URL once its videos are post-processed (runs on the post-processing pool)"""
+            if errors:
+                error_msg = "; ".join(str(e) for e in errors)
+                fail_job(job, f"❌ Post-processing error: {error_msg}", error_msg)
+                raise yt_dlp.utils.PostProcessingError(error_msg)
+            try:
+                if archive is not None:
+                    archive.record(info, format_preset, hasher=content_index.file_hash if content_index else hash_file)
+                tracker.add_info(info, job.job_id)
+                if journal is not None:
+                    filepaths = [os.path.abspath(path) for path in map(get_output_path, iter_video_infos(info)) if path]
+                    journal.set_state(batch_id, job.url, 'done', filepaths=filepaths)
+            except Exception as e:
+                session_job.debug(f"[{job.job_id}] Could not record finished download: {e}", 'ERROR')
+            if not session_job.cancelled:
+                session_job.post('log', f"✅ Completed: {job.url}")
+            return info
+        
+        def on_output(job, filepath):
+            """Final file of one video, after merging and post-processing"""
+            tracker.post_hook(filepath, job.job_id)
+            session_job.post('output', job.job_id, os.path.abspath(filepath))
+        
+        # Bytes actually transferred per job, for the throughput report
+        transferred = {}
+        transfer_lock = threading.Lock()
+        
+        def on_job_event(job, status):
+            """Forward scheduler state changes to the UI queue"""
+            session_job.debug(f"[{job.job_id}] Job {status}")
+            data = {'status': status, 'url': job.url}
+            if status in ('finished', 'failed', 'cancelled'):
+                # The download's share has gone back to the others
+                session_job.post('bandwidth', None, governor.stats(batch_id))
+            if status == 'finished':
+                data['bytes'] = transferred.get(job.job_id, 0)
+                data['seconds'] = job.duration
+            elif status == 'failed' and job.started_at is None:
+                # Turned down by the disk admission before it started
+                data['error'] = job.error
+                session_job.post('log', f"💾 Not downloading {job.url}: {job.error}")
+                if journal is not None:
+                    journal.set_state(batch_id, job.url, 'failed', error=job.error)
+            session_job.post('job', job.job_id, data)
+        
+        expand_lock = threading.Lock()
+        # Every URL queued so far, given or found in a collection
+        seen = set(urls)
+        
+        def expand_collections(scheduler, collections):
+            """Submit the entries of every collection while it is being paged through"""
+            unexpanded = [len(collections)]
+            
+            def report(url, entries):
+                # Each collection not fully expanded yet counts as one item
+                with expand_lock:
+                    total = len(scheduler.jobs) + unexpanded[0]
+                session_job.post('expanded', None, {'url': url, 'entries': entries, 'total': total})
+            
+            def expand(url):
+                entries = 0
+                if journal is not None:
+                    journal.set_state(batch_id, url, 'extracting')
+                try:
+                    for entry in expand_url(url, filters, session_job.cancel_event):
+                        entry_url = canonicalize_url(entry['url'])
+                        with expand_lock:
+                            if entry_url in seen:
+                                continue
+                            seen.add(entry_url)
+                            expanded_urls.add(entry_url)
+                        if journal is not None:
+                            journal.add_items(batch_id, [entry_url], source=url)
+                        scheduler.submit(entry_url)
+                        entries += 1
+                        if entries % EXPANSION_REPORT_EVERY == 0:
+                            report(url, entries)
+                except Exception as e:
+                    session_job.debug(f"Could not expand {url}: {e}", 'ERROR')
+                    session_job.post('log', f"❌ Could not list {url}: {e}")
+                    if journal is not None:
+                        journal.set_state(batch_id, url, 'failed', error=str(e))
+                else:
+                    if not session_job.cancelled:
+                        session_job.post('log', f"📚 {url}: {entries} video(s) queued")
+                    if journal is not None:
+                        journal.set_state(batch_id, url, 'done', filepaths=[])
+                finally:
+                    with expand_lock:
+                        unexpanded[0] -= 1
+                    report(url, entries)
+            
+            with ThreadPoolExecutor(max_workers=min(DEFAULT_EXPANSION_WORKERS, len(collections)), thread_name_prefix="Expand") as pool:
+                list(pool.map(expand, collections))
+        
+        def queue_urls(scheduler, batch_urls):
+            """Submit single videos at once and expand collections while the first of them already download"""
+            collections = [url for url in batch_urls if is_collection_url(url)]
+            for url in batch_urls:
+                if url not in collections:
+                    scheduler.submit(url)
+            if collections:
+                expand_collections(scheduler, collections)
+        
+        def feed_urls(scheduler, chunks):
+            """Queue the lists of more_urls one by one as the waiting jobs run low"""
+            while not session_job.cancelled:
+                scheduler.wait_for_room(max_concurrent)
+                chunk = next(chunks, None)
+                if chunk is None or session_job.cancelled:
+                    return
+                chunk, repeats = dedupe_urls(chunk)
+                with expand_lock:
+                    new_urls = [url for url in chunk if url not in seen]
+                    seen.update(new_urls)
+                dropped = len(repeats) + len(chunk) - len(new_urls)
+                if dropped:
+                    session_job.debug(f"Dropped {dropped} URL(s) already in this batch")
+                if not new_urls:
+                    continue
+                if journal is not None:
+                    journal.add_items(batch_id, new_urls)
+                session_job.post('added', None, new_urls)
+                session_job.debug(f"Queued {len(new_urls)} more URL(s)")
+                start_estimate(new_urls)
+                queue_urls(scheduler, new_urls)
+        
+        pipeline = PostProcessPipeline()
+        scheduler = DownloadScheduler(
+            run_job,
+            max_concurrent=max_concurrent,
+            per_host_limit=per_host_limit,
+            stop_event=session_job.cancel_event,
+            on_event=on_job_event,
+            admission=admission
+        )
+        batch_started = time.monotonic()
+        
+        queue_urls(scheduler, urls)
+        if more_urls is not None:
+            feed_urls(scheduler, iter(more_urls))
+        scheduler.close()
+        scheduler.join(deferred=False)
+        batch_seconds = time.monotonic() - batch_started
+        
+        if pipeline.pending():
+            session_job.post('log', f"⚙️ Waiting for post-processing of {pipeline.pending()} download(s)...")
+        pipeline.join()
+        # Jobs end when their post-processing does
+        scheduler.join()
+        for thread in estimators:
+            thread.join()
+        session_job.debug(f"Post-processing: {pipeline.stats()}")
+        
+        total_bytes = sum(transferred.values())
+        throughput = dict(profile_info, bytes=total_bytes, seconds=round(batch_seconds, 2),
+                          bytes_per_second=total_bytes / batch_seconds if batch_seconds > 0 else 0)
+        session_job.debug(f"Throughput: {throughput}")
+        session_job.post('throughput', None, throughput)
+        if total_bytes:
+            session_job.post('log', f"🚀 Transferred {total_bytes / (1024 * 1024):.1f} MB in {batch_seconds:.1f}s "
+                                    f"({throughput['bytes_per_second'] / (1024 * 1024):.2f} MB/s, profile: {profile_info['profile']})")
+        
+        # Progress held back by the rate limit is delivered before the totals
+        coalescer.close()
+        progress_stats = coalescer.stats()
+        session_job.debug(f"Progress events: {progress_stats}")
+        session_job.post('progress_stats', progress_stats)
+        
+        if session_job.cancelled:
+            session_job.debug("Download stopped by user")
+        
+        # Final file analysis
+        session_job.debug("Performing final file analysis...")
+        try:
+            if initial_snapshot is not None:
+                added, changed, removed = initial_snapshot.diff(get_snapshot(download_path))
+                session_job.debug(f"Directory changes during session: {len(added)} added, {len(changed)} changed, {len(removed)} removed")
+                session_job.debug(f"Files added during session: {added}")
+            
+            outputs = tracker.outputs()
+            session_job.debug(f"Outputs reported by yt-dlp: {outputs}")
+            
+            # Structural check of every output, in parallel
+            results = validate_files(outputs)
+            valid_downloads = []
+            for result in results:
+                filename = os.path.basename(result.path)
+                session_job.debug(f"Final check for {filename}: {result.message}")
+                if result.valid:
+                    valid_downloads.append(filename)
+                else:
+                    session_job.post('log', f"⚠️ {filename} failed validation: {result.message}")
+            session_job.post('validation', None, [result.to_dict() for result in results])
+            
+            # Identical content reached through another URL or an earlier batch
+            if dedupe_mode and content_index is not None:
+                report = deduplicate([result.path for result in results if result.valid], download_path, dedupe_mode, content_index)
+                for duplicate in report.duplicates:
+                    if duplicate['action'] != 'already linked':
+                        session_job.post('log', f"♻️ {os.path.basename(duplicate['path'])} is identical to {os.path.basename(duplicate['original'])} ({duplicate['action']})")
+                    if duplicate['action'] == 'deleted':
+                        # The archive and journal already name the deleted copy; the next
+                        # run must find the kept original instead of downloading again
+                        if archive is not None:
+                            archive.update_filepath(duplicate['path'], duplicate['original'])
+                        if journal is not None:
+                            journal.replace_filepath(batch_id, duplicate['path'], duplicate['original'])
+                for error in report.errors:
+                    session_job.debug(f"Deduplication: {error}", 'WARNING')
+                if report.saved_bytes:
+                    session_job.post('log', f"♻️ Duplicate files: saved {report.saved_bytes / (1024 * 1024):.1f} MB")
+                session_job.post('dedupe', None, report.to_dict())
+            
+            success_count = len(valid_downloads)
+            total_count = len(scheduler.jobs)
+            
+            session_job.debug(f"Final summary: {success_count}/{total_count} successful downloads")
+            
+            if success_count > 0:
+                session_job.post('log', f"🎉 **{success_count}/{total_count} video(s) downloaded successfully!**")
+                session_job.post('log', f"📁 Downloaded files: {', '.join(valid_downloads)}")
+            else:
+                session_job.post('log', "❌ **No videos were downloaded successfully**")
+                
+        except Exception as e:
+            session_job.debug(f"Error during file analysis: {e}", 'ERROR')
+            
+        # A failed download may be the directory's fault (permissions, full
+        # disk); the next batch tests it afresh
+        if any(job.status == 'failed' for job in scheduler.jobs):
+            path_health.invalidate(download_path)
+        
+    except Exception as e:
+        session_job.debug(f"Critical error in download_videos: {str(e)}", 'ERROR')
+        session_job.post('log', f"❌ Critical error: {str(e)}")
+        failed = True
+    finally:
+        governor.set_group_rate(batch_id, None)
+        if coalescer is not None:
+            coalescer.close()
+        if pipeline is not None:
+            pipeline.shutdown()
+        if journal is not None:
+            # A batch stopped by the user is not offered for resuming
+            journal.finish_batch(batch_id, 'cancelled' if session_job.cancelled else 'failed' if failed else 'done')
+        session_job.debug("download_videos function completed")
+        # Mark download as complete - the UI relies on this explicit signal
+        session_job.mark_complete()
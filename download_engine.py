@@ -0,0 +1,258 @@
+"""One download engine behind every front end.
+
+The Streamlit page, the Tk app, the headless CLI and the daemon all run
+batches through DownloadEngine, which hands them to download_core on a
+thread of its own. Scheduling, caching and throughput settings therefore
+live in one place and can be exercised (or benchmarked) without any UI:
+
+    engine = DownloadEngine()
+    job = engine.submit(urls, download_path, on_message=print, format_preset='hd')
+    result = job.wait_result()
+    print(result.describe())
+
+submit() returns an EngineJob, the handle of the batch: it can be
+cancelled, polled (drain() returns the queued messages, as for any Job)
+or watched through on_message(msg_type, job_id, data) callbacks, which are
+called on the engine's threads. When the batch ends, job.result holds a
+BatchResult with one VideoResult per URL.
+"""
+import threading
+
+from job_manager import Job, JobManager
+
+# Message types whose last value is kept on the BatchResult
+SUMMARY_MESSAGES = ('throughput', 'estimate', 'dedupe')
+
+_default_engine = None
+_default_engine_lock = threading.Lock()
+
+
+class VideoResult:
+    """Outcome of one URL of a batch"""
+    def __init__(self, url, job_id=None, status=None, error=None, files=None, bytes=None, seconds=None):
+        self.url = url
+        self.job_id = job_id
+        self.status = status
+        self.error = error
+        # [{'path': ..., 'valid': True/False/None}]
+        self.files = files or []
+        self.bytes = bytes
+        self.seconds = seconds
+
+    @property
+    def ok(self):
+        return self.status in ('finished', 'expanded', 'skipped')
+
+    def to_dict(self):
+        return {
+            'url': self.url,
+            'job_id': self.job_id,
+            'status': self.status,
+            'error': self.error,
+            'files': self.files,
+            'bytes': self.bytes,
+            'seconds': self.seconds,
+        }
+
+
+class BatchResult:
+    """Outcome of a batch: its videos and the batch-level reports"""
+    def __init__(self, batch_id, videos, cancelled=False, reports=None):
+        self.batch_id = batch_id
+        self.videos = videos
+        self.cancelled = cancelled
+        self.reports = reports or {}
+
+    @property
+    def throughput(self):
+        return self.reports.get('throughput')
+
+    @property
+    def ok(self):
+        return not self.cancelled and all(video.ok for video in self.videos)
+
+    def counts(self):
+        counts = {}
+        for video in self.videos:
+            counts[video.status] = counts.get(video.status, 0) + 1
+        return counts
+
+    def describe(self):
+        counts = ", ".join(f"{count} {status}" for status, count in sorted(self.counts().items()))
+        return f"{len(self.videos)} URL(s): {counts or 'nothing to do'}" + (" (cancelled)" if self.cancelled else "")
+
+    def to_dict(self):
+        return {
+            'batch_id': self.batch_id,
+            'cancelled': self.cancelled,
+            'counts': self.counts(),
+            'videos': [video.to_dict() for video in self.videos],
+            'reports': self.reports,
+        }
+
+
+class ResultCollector:
+    """Builds a BatchResult from the messages download_core posts"""
+    def __init__(self):
+        self.videos = {}
+        self.files = {}
+        self.validation = {}
+        self.reports = {}
+        # URLs that joined the batch after it started (download_videos' more_urls)
+        self.added = []
+        self.last_error = None
+        self._lock = threading.Lock()
+
+    def handle(self, message):
+        msg_type = message[0]
+        with self._lock:
+            if msg_type == 'job':
+                _, job_id, data = message
+                self.videos.setdefault(job_id, {}).update(data)
+            elif msg_type in ('output', 'skipped'):
+                _, job_id, path = message
+                files = self.files.setdefault(job_id, [])
+                if path not in files:
+                    files.append(path)
+            elif msg_type == 'validation':
+                self.validation.update((result['path'], result) for result in message[-1])
+            elif msg_type == 'added':
+                self.added.extend(message[-1])
+            elif msg_type in SUMMARY_MESSAGES:
+                self.reports[msg_type] = message[-1]
+            elif msg_type == 'log' and message[-1].startswith('❌'):
+                self.last_error = message[-1]
+
+    def build(self, batch_id, urls, cancelled=False, journal=None):
+        """One VideoResult per URL; the journal knows about post-processing failures and playlists"""
+        items = {}
+        if journal is not None:
+            batch = journal.get_batch(batch_id)
+            items = {item['url']: item for item in batch['items']} if batch else {}
+        with self._lock:
+            videos = []
+            for job_id, video in self.videos.items():
+                item = items.pop(video['url'], None)
+                status, error = video.get('status'), video.get('error')
+                if item and item['state'] in ('failed', 'skipped'):
+                    status, error = item['state'], item.get('error') or error
+                files = [{'path': path, 'valid': self.validation.get(path, {}).get('valid')}
+                         for path in self.files.get(job_id, [])]
+                videos.append(VideoResult(video['url'], job_id, status, error, files, video.get('bytes'), video.get('seconds')))
+            # Playlists and channels have no job of their own
+            for url, item in items.items():
+                videos.append(VideoResult(url, status='expanded' if item['state'] == 'done' else item['state'], error=item.get('error')))
+            # A batch that could not start (unusable directory, for instance) has no jobs
+            reported = {video.url for video in videos}
+            for url in list(urls) + self.added:
+                if url not in reported:
+                    videos.append(VideoResult(url, status='cancelled' if cancelled else 'failed',
+                                              error=None if cancelled else (self.last_error or "Batch did not start")))
+            return BatchResult(batch_id, videos, cancelled, dict(self.reports))
+
+
+class EngineJob(Job):
+    """Handle of a batch run by the engine
+
+    on_message(msg_type, job_id, data) is called for every message; with
+    queue_messages=False messages are not queued for drain(), for front
+    ends that only use the callback. echo is a file object debug lines are
+    also printed to as they are logged (a CLI's stderr, say); by default
+    they are only kept in the job's log.
+    """
+    def __init__(self, urls, session_id=None, job_id=None, on_message=None, queue_messages=True, echo=None):
+        super().__init__(session_id, job_id)
+        self.urls = list(urls)
+        self.on_message = on_message
+        self.queue_messages = queue_messages
+        self.echo = echo
+        self.result = None
+        self.collector = ResultCollector()
+
+    def post(self, *message):
+        self.collector.handle(message)
+        if self.queue_messages:
+            super().post(*message)
+        if self.on_message:
+            msg_type, job_id, data = message if len(message) == 3 else (message[0], None, message[1])
+            try:
+                self.on_message(msg_type, job_id, data)
+            except Exception as e:
+                self.log.append(f"Message callback failed: {e}", 'ERROR', 'engine')
+
+    def debug(self, message, level='DEBUG', source='app'):
+        record = super().debug(message, level, source)
+        if self.echo:
+            print(f"[{self.job_id}] {record.format()}", file=self.echo)
+        return record
+
+    def mark_complete(self):
+        # The result is in place before anyone is told the batch is complete
+        try:
+            from batch_journal import get_default_journal
+            journal = get_default_journal()
+        except Exception:
+            journal = None
+        self.result = self.collector.build(self.job_id, self.urls, self.cancelled, journal)
+        super().mark_complete()
+
+    def wait(self, timeout=None):
+        """Block until the batch has ended; returns False on timeout"""
+        return self.completed.wait(timeout)
+
+    def wait_result(self, timeout=None):
+        """Block until the batch has ended and return its BatchResult (None on timeout)"""
+        self.wait(timeout)
+        return self.result
+
+
+class DownloadEngine:
+    """Runs download batches for any front end
+
+    defaults are download_core options applied to every batch unless a
+    submit() call overrides them. Batches run side by side, each on its own
+    thread, tracked by job_manager.
+    """
+    def __init__(self, job_manager=None, **defaults):
+        self.job_manager = job_manager or JobManager()
+        self.defaults = defaults
+
+    def submit(self, urls, download_path, on_message=None, session_id=None, job_id=None,
+               queue_messages=True, echo=None, **options):
+        """Start a batch in the background and return its EngineJob
+
+        job_id resumes an interrupted batch; options are download_videos()
+        keyword arguments (max_concurrent, format_preset, owner, ...).
+        """
+        job = EngineJob(urls, session_id, job_id, on_message, queue_messages, echo)
+        self.job_manager.register(job)
+        self.job_manager.start(job, self.execute, job.urls, download_path, **options)
+        return job
+
+    def run(self, urls, download_path, **options):
+        """Run a batch on the calling thread and return its BatchResult"""
+        job = EngineJob(urls, queue_messages=False, echo=options.pop('echo', None), on_message=options.pop('on_message', None))
+        self.execute(job, job.urls, download_path, **options)
+        return job.result
+
+    def execute(self, job, urls, download_path, **options):
+        """Run a batch for an existing Job on the calling thread"""
+        # Imported here so front ends start without loading yt-dlp
+        from download_core import download_videos
+        download_videos(job, urls, download_path, **dict(self.defaults, **options))
+
+    def get(self, job_id):
+        return self.job_manager.get(job_id)
+
+    def cancel(self, job_id):
+        """Stop a batch: queued videos are dropped, running ones stop at their next progress event"""
+        return self.job_manager.cancel(job_id)
+
+
+def get_default_engine():
+    """Return the process-wide DownloadEngine"""
+    global _default_engine
+    with _default_engine_lock:
+        if _default_engine is None:
+            _default_engine = DownloadEngine()
+        return _default_engine
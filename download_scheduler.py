@@ -0,0 +1,265 @@
+"""Bounded worker-pool scheduler for running several downloads at once.
+
+The scheduler knows nothing about yt-dlp or any UI: it hands each submitted
+URL to a ``run_job`` callable on one of its worker threads, limiting how many
+jobs run in total and how many run against the same host.
+"""
+import itertools
+import threading
+from concurrent.futures import Future
+from datetime import datetime
+from urllib.parse import urlparse
+
+DEFAULT_MAX_CONCURRENT = 3
+DEFAULT_PER_HOST_LIMIT = 2
+
+# Hostnames that are served by the same backend and share one host limit
+HOST_ALIASES = {
+    'youtu.be': 'youtube.com',
+    'm.youtube.com': 'youtube.com',
+    'music.youtube.com': 'youtube.com',
+    'youtube-nocookie.com': 'youtube.com',
+}
+
+_job_counter = itertools.count(1)
+
+
+def get_host(url):
+    """Return the normalized host used for per-host limits"""
+    host = (urlparse(url).hostname or '').lower()
+    if host.startswith('www.'):
+        host = host[4:]
+    return HOST_ALIASES.get(host, host)
+
+
+def new_job_id():
+    """Return a short process-unique job id"""
+    return f"job-{next(_job_counter)}"
+
+
+class DownloadJob:
+    """A single URL scheduled for download"""
+    def __init__(self, url, job_id=None):
+        self.job_id = job_id or new_job_id()
+        self.url = url
+        self.host = get_host(url)
+        self.status = 'queued'
+        self.error = None
+        self.result = None
+        self.started_at = None
+        self.finished_at = None
+
+    @property
+    def duration(self):
+        if self.started_at and self.finished_at:
+            return (self.finished_at - self.started_at).total_seconds()
+        return None
+
+    def __repr__(self):
+        return f"DownloadJob({self.job_id!r}, {self.url!r}, status={self.status!r})"
+
+
+class DownloadScheduler:
+    """Run download jobs on a bounded pool of worker threads.
+
+    ``run_job(job)`` is called on a worker thread for every job and may return
+    a result object or raise. It may also return a ``concurrent.futures.Future``
+    when part of the job's work continues elsewhere (post-processing, for
+    instance): the worker moves on, and the job finishes or fails when the
+    future resolves. ``on_event(job, status)`` is called whenever a
+    job changes state ('queued', 'started', 'finished', 'failed', 'cancelled').
+    Setting ``stop_event`` prevents queued jobs from starting; running jobs are
+    expected to watch the same event themselves.
+
+    ``admission`` optionally gates jobs on something other than concurrency
+    (disk space, for instance): ``admission.admit(job)`` returns 'admit',
+    'wait' (the job stays queued and is asked again later) or 'reject' (the
+    job fails with ``job.error`` set by the admission), and
+    ``admission.release(job)`` is called when an admitted job ends.
+    ``admit`` runs with the scheduler's lock held, so it must answer from
+    memory; ``release`` is called without it.
+    """
+    def __init__(self, run_job, max_concurrent=DEFAULT_MAX_CONCURRENT,
+                 per_host_limit=DEFAULT_PER_HOST_LIMIT, stop_event=None, on_event=None, admission=None):
+        self.run_job = run_job
+        self.max_concurrent = max(1, int(max_concurrent))
+        self.per_host_limit = max(1, int(per_host_limit)) if per_host_limit else None
+        self.stop_event = stop_event or threading.Event()
+        self.on_event = on_event
+        self.admission = admission
+        self.jobs = []
+        self._pending = []
+        self._host_active = {}
+        self._cond = threading.Condition()
+        self._closed = False
+        self._workers = []
+        # Jobs whose run_job returned a future that has not resolved yet
+        self._deferred = 0
+
+    def _emit(self, job, status):
+        job.status = status
+        if self.on_event:
+            try:
+                self.on_event(job, status)
+            except Exception:
+                pass
+
+    def submit(self, url, job_id=None):
+        """Queue a URL and return its DownloadJob"""
+        job = DownloadJob(url, job_id)
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("Scheduler is closed to new jobs")
+            # Reported before a worker can see the job, so 'queued' never follows 'started'
+            self._emit(job, 'queued')
+            self.jobs.append(job)
+            self._pending.append(job)
+            self._ensure_workers()
+            self._cond.notify_all()
+        return job
+
+    def wait_for_room(self, max_pending):
+        """Block while max_pending or more jobs are waiting to start (or until stopped)
+
+        Lets a producer keep the workers busy without queueing all its URLs up front.
+        """
+        with self._cond:
+            while len(self._pending) >= max_pending and not self.stop_event.is_set():
+                # Workers do not notify when they take a job; check again periodically
+                self._cond.wait(timeout=0.5)
+
+    def close(self):
+        """Signal that no more jobs will be submitted"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def join(self, deferred=True):
+        """Wait until every submitted job has ended (call close() first)
+
+        With deferred=False only the workers are waited for; jobs that handed
+        their remaining work to a future may still be running.
+        """
+        while True:
+            with self._cond:
+                workers = list(self._workers)
+            for worker in workers:
+                worker.join()
+            with self._cond:
+                if len(self._workers) == len(workers):
+                    break
+        if deferred:
+            with self._cond:
+                while self._deferred:
+                    self._cond.wait()
+
+    def _ensure_workers(self):
+        # Called with the condition held: spawn workers lazily up to the limit
+        busy = len(self._workers) - sum(1 for w in self._workers if not w.is_alive())
+        if busy < self.max_concurrent and len(self._pending) > 0:
+            worker = threading.Thread(
+                target=self._worker_loop,
+                daemon=True,
+                name=f"DownloadWorker-{len(self._workers) + 1}"
+            )
+            self._workers.append(worker)
+            worker.start()
+
+    def _next_job(self, rejected):
+        # Called with the condition held; jobs the admission turns down are
+        # moved to rejected
+        for job in list(self._pending):
+            if self.per_host_limit is not None and self._host_active.get(job.host, 0) >= self.per_host_limit:
+                continue
+            decision = self.admission.admit(job) if self.admission else 'admit'
+            if decision == 'wait':
+                continue
+            self._pending.remove(job)
+            if decision == 'reject':
+                rejected.append(job)
+                continue
+            return job
+        return None
+
+    def _cancel_pending(self):
+        # Called with the condition held
+        cancelled, self._pending = self._pending, []
+        return cancelled
+
+    def _worker_loop(self):
+        while True:
+            with self._cond:
+                job = None
+                cancelled = []
+                rejected = []
+                while job is None:
+                    if self.stop_event.is_set():
+                        cancelled = self._cancel_pending()
+                        break
+                    job = self._next_job(rejected)
+                    if job is not None or rejected:
+                        break
+                    if self._closed and not self._pending:
+                        break
+                    # Wake up periodically so a stop request is noticed promptly
+                    self._cond.wait(timeout=0.5)
+                if job is not None:
+                    self._host_active[job.host] = self._host_active.get(job.host, 0) + 1
+                    if self._pending:
+                        self._ensure_workers()
+
+            for cancelled_job in cancelled:
+                self._emit(cancelled_job, 'cancelled')
+            for rejected_job in rejected:
+                self._emit(rejected_job, 'failed')
+            if job is None:
+                if rejected:
+                    continue
+                return
+
+            job.started_at = datetime.now()
+            self._emit(job, 'started')
+            result = status = None
+            try:
+                result = self.run_job(job)
+            except Exception as e:
+                job.error = str(e)
+                status = 'cancelled' if self.stop_event.is_set() else 'failed'
+            finally:
+                deferred = isinstance(result, Future)
+                with self._cond:
+                    # The host is free once the worker is, even if the job is not over yet
+                    self._host_active[job.host] -= 1
+                    if deferred:
+                        self._deferred += 1
+                    self._cond.notify_all()
+            if deferred:
+                result.add_done_callback(lambda future, job=job: self._finish_deferred(job, future))
+            else:
+                if status is None:
+                    job.result = result
+                    status = 'cancelled' if self.stop_event.is_set() else 'finished'
+                self._finish(job, status)
+
+    def _finish(self, job, status):
+        job.finished_at = datetime.now()
+        if self.admission:
+            self.admission.release(job)
+            with self._cond:
+                self._cond.notify_all()
+        self._emit(job, status)
+
+    def _finish_deferred(self, job, future):
+        # Runs wherever the future was resolved
+        try:
+            job.result = future.result()
+            status = 'cancelled' if self.stop_event.is_set() else 'finished'
+        except Exception as e:
+            job.error = str(e)
+            status = 'cancelled' if self.stop_event.is_set() else 'failed'
+        try:
+            self._finish(job, status)
+        finally:
+            with self._cond:
+                self._deferred -= 1
+                self._cond.notify_all()
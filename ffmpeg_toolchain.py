@@ -0,0 +1,187 @@
+"""Find ffmpeg and ffprobe once per process and record what they support.
+
+Both apps used to look for a bundled ffmpeg, chmod it and log the result at
+the start of every batch. get_toolchain() does that work once: it looks for
+the binaries in a configured location (YTDL_FFMPEG_LOCATION), then in the
+PyInstaller bundle, then on PATH, runs them once to read the version and
+the muxers they were built with, and caches the result for the
+lifetime of the process. The format selector asks it whether streams can be
+merged and into which containers; the post-processing stage gets its path.
+"""
+import os
+import shutil
+import stat
+import subprocess
+import sys
+import threading
+
+FFMPEG_LOCATION_ENV = 'YTDL_FFMPEG_LOCATION'
+PROBE_TIMEOUT = 10
+# Container extension -> ffmpeg muxer needed to merge into it
+CONTAINER_MUXERS = {
+    'mp4': 'mp4',
+    'webm': 'webm',
+    'mkv': 'matroska',
+}
+
+_toolchain = None
+_toolchain_lock = threading.Lock()
+
+
+def _executable_name(name):
+    return f"{name}.exe" if sys.platform == "win32" else name
+
+
+class Toolchain:
+    """Resolved ffmpeg/ffprobe paths and their capabilities"""
+    def __init__(self, ffmpeg=None, ffprobe=None, source=None, version=None, muxers=None, notes=None):
+        self.ffmpeg = ffmpeg
+        self.ffprobe = ffprobe
+        self.source = source
+        self.version = version
+        # None means the binary could not be asked; assume the usual build
+        self.muxers = muxers
+        self.notes = notes or []
+
+    @property
+    def available(self):
+        return self.ffmpeg is not None
+
+    @property
+    def location(self):
+        """Value for yt-dlp's ffmpeg_location option, or None to let yt-dlp search PATH"""
+        if not self.available or self.source == 'path':
+            return None
+        if self.ffprobe and os.path.dirname(self.ffprobe) == os.path.dirname(self.ffmpeg):
+            return os.path.dirname(self.ffmpeg)
+        return self.ffmpeg
+
+    def supports_muxer(self, name):
+        return self.available and (self.muxers is None or name in self.muxers)
+
+    def merge_containers(self):
+        """Container extensions separate streams can be merged into"""
+        return [ext for ext, muxer in CONTAINER_MUXERS.items() if self.supports_muxer(muxer)]
+
+    @property
+    def can_merge(self):
+        return bool(self.merge_containers())
+
+    def describe(self):
+        if not self.available:
+            return "ffmpeg not found"
+        version = f"ffmpeg {self.version}" if self.version else "ffmpeg"
+        probe = "with ffprobe" if self.ffprobe else "without ffprobe"
+        return f"{version} ({self.source}: {self.ffmpeg}, {probe})"
+
+    def to_dict(self):
+        return {
+            'ffmpeg': self.ffmpeg,
+            'ffprobe': self.ffprobe,
+            'source': self.source,
+            'version': self.version,
+            'merge_containers': self.merge_containers(),
+            'notes': self.notes,
+        }
+
+
+def _ensure_executable(path, notes):
+    """Return path if it can be executed, adding the execute bit if needed (bundles lose it)"""
+    try:
+        mode = os.stat(path).st_mode
+        if not mode & stat.S_IXUSR:
+            os.chmod(path, mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+    except OSError as e:
+        notes.append(f"Could not set permissions for {path}: {e}")
+    return path if os.access(path, os.X_OK) else None
+
+
+def _find_in(directory, name, notes):
+    path = os.path.join(directory, _executable_name(name))
+    if os.path.isfile(path):
+        return _ensure_executable(path, notes)
+    return None
+
+
+def find_executables(override=None):
+    """Return (ffmpeg, ffprobe, source, notes), trying override, the bundle and PATH in that order"""
+    notes = []
+    override = override or os.environ.get(FFMPEG_LOCATION_ENV)
+    if override:
+        override = os.path.expanduser(override)
+        directory = override if os.path.isdir(override) else os.path.dirname(override)
+        ffmpeg = _ensure_executable(override, notes) if os.path.isfile(override) else _find_in(directory, 'ffmpeg', notes)
+        if ffmpeg:
+            return ffmpeg, _find_in(directory, 'ffprobe', notes), 'configured', notes
+        notes.append(f"No usable ffmpeg at {override}")
+
+    bundle_dir = getattr(sys, '_MEIPASS', None) if getattr(sys, 'frozen', False) else None
+    if bundle_dir:
+        ffmpeg = _find_in(bundle_dir, 'ffmpeg', notes)
+        if ffmpeg:
+            return ffmpeg, _find_in(bundle_dir, 'ffprobe', notes), 'bundle', notes
+        notes.append(f"Bundled ffmpeg not found in {bundle_dir}")
+
+    ffmpeg = shutil.which('ffmpeg')
+    if ffmpeg:
+        return ffmpeg, shutil.which('ffprobe'), 'path', notes
+    return None, None, None, notes
+
+
+def _run(args):
+    try:
+        result = subprocess.run(args, capture_output=True, text=True, timeout=PROBE_TIMEOUT)
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return result.stdout if result.returncode == 0 else None
+
+
+def parse_version(output):
+    """'ffmpeg version 6.1.1-3ubuntu5 Copyright ...' -> '6.1.1-3ubuntu5'"""
+    words = (output or '').split()
+    if len(words) >= 3 and words[1] == 'version':
+        return words[2]
+    return None
+
+
+def parse_listing(output):
+    """Names from the table printed by 'ffmpeg -muxers'
+
+    Rows follow a ' --' separator and look like ' E  mp4   MP4 (MPEG-4 Part 14)';
+    a row may list several comma-separated names.
+    """
+    names = set()
+    in_table = False
+    for line in (output or '').splitlines():
+        if not in_table:
+            in_table = line.strip().startswith('--')
+            continue
+        parts = line.split()
+        if len(parts) >= 2:
+            names.update(parts[1].split(','))
+    return names
+
+
+def probe_toolchain(override=None):
+    """Locate ffmpeg/ffprobe and ask ffmpeg for its version and muxers"""
+    ffmpeg, ffprobe, source, notes = find_executables(override)
+    if ffmpeg is None:
+        return Toolchain(notes=notes)
+    version = parse_version(_run([ffmpeg, '-version']))
+    muxers = _run([ffmpeg, '-hide_banner', '-muxers'])
+    if muxers is None:
+        notes.append("Could not list ffmpeg muxers")
+    return Toolchain(
+        ffmpeg, ffprobe, source, version,
+        muxers=parse_listing(muxers) if muxers is not None else None,
+        notes=notes,
+    )
+
+
+def get_toolchain(refresh=False):
+    """Return the process-wide Toolchain, probing only on first use or when refresh is set"""
+    global _toolchain
+    with _toolchain_lock:
+        if _toolchain is None or refresh:
+            _toolchain = probe_toolchain()
+        return _toolchain
@@ -0,0 +1,232 @@
+"""Named quality presets and a cost model for picking formats.
+
+Instead of a fixed format string, yt-dlp is given a selector function built
+by make_format_selector(). For every video it looks at the extracted format
+list, builds the candidates (single progressive files and video+audio
+pairs), keeps those that reach the best quality the preset allows, and
+among them picks the one with the lowest estimated cost: seconds to
+transfer the bytes plus seconds to merge separate streams. A 1080p video
+that exists both as a large AVC stream and a smaller VP9/AV1 stream is
+therefore fetched as the smaller one, and a merge is only done when no
+single file offers the same quality.
+
+yt-dlp is only imported once a pair of formats is costed, so front ends can
+list the presets without loading it.
+"""
+
+DEFAULT_PRESET = 'hd'
+
+PRESETS = {
+    'hd': {
+        'label': "HD (up to 1080p, fewest bytes)",
+        'max_height': 1080,
+    },
+    'max': {
+        'label': "Maximum resolution",
+        'max_height': None,
+    },
+    'progressive': {
+        'label': "Single file, no merge",
+        'max_height': None,
+        'progressive_only': True,
+    },
+    'size_capped': {
+        'label': "Best quality under 200 MB",
+        'max_height': None,
+        'max_bytes': 200 * 1024 * 1024,
+    },
+    'audio': {
+        'label': "Audio only",
+        'audio_only': True,
+    },
+}
+
+# Cost model: download speed assumed when comparing candidates, and the
+# rate at which ffmpeg stream-copies separate streams into one file
+ASSUMED_BYTES_PER_SECOND = 5 * 1024 * 1024
+MERGE_BYTES_PER_SECOND = 200 * 1024 * 1024
+# Audio tracks below this fraction of the best available bitrate are not
+# considered the same quality
+AUDIO_QUALITY_FLOOR = 0.6
+PREFERRED_CONTAINERS = ('mp4',)
+
+
+def preset_names():
+    return list(PRESETS)
+
+
+def preset_label(name):
+    return PRESETS[name]['label']
+
+
+def has_video(fmt):
+    # 'none' means absent; a missing codec is unknown and counts as present
+    return fmt.get('vcodec') != 'none'
+
+
+def has_audio(fmt):
+    return fmt.get('acodec') != 'none'
+
+
+def estimate_bytes(fmt, duration=None):
+    """Return the expected size of a format in bytes, or None if unknown"""
+    size = fmt.get('filesize') or fmt.get('filesize_approx')
+    if size:
+        return size
+    tbr = fmt.get('tbr') or ((fmt.get('vbr') or 0) + (fmt.get('abr') or 0))
+    if tbr and duration:
+        return int(tbr * 1000 / 8 * duration)
+    return None
+
+
+def infer_duration(formats):
+    """Work out the duration from any format that has both a size and a bitrate
+
+    yt-dlp's selector context does not carry the duration, but it is needed
+    to size formats that only declare a bitrate.
+    """
+    for fmt in formats:
+        size = fmt.get('filesize') or fmt.get('filesize_approx')
+        if size and fmt.get('tbr'):
+            return size * 8 / (fmt['tbr'] * 1000)
+    return None
+
+
+class Candidate:
+    """One way of getting a video: a single format or a video+audio pair"""
+    def __init__(self, formats, duration=None):
+        self.formats = formats
+        video = next((f for f in formats if has_video(f)), None)
+        audio = next((f for f in formats if has_audio(f)), None)
+        self.height = (video or {}).get('height') or 0
+        self.fps = (video or {}).get('fps') or 0
+        self.abr = (audio or {}).get('abr') or 0
+        sizes = [estimate_bytes(f, duration) for f in formats]
+        self.bytes = sum(sizes) if all(sizes) else None
+        self.merge = len(formats) > 1
+        if self.merge:
+            from yt_dlp.utils import get_compatible_ext
+            self.ext = get_compatible_ext(
+                vcodecs=[video.get('vcodec')], acodecs=[audio.get('acodec')],
+                vexts=[video['ext']], aexts=[audio['ext']], preferences=PREFERRED_CONTAINERS)
+        else:
+            self.ext = formats[0].get('ext')
+
+    @property
+    def quality(self):
+        return (self.height, self.fps)
+
+    @property
+    def cost(self):
+        """Estimated seconds to download (and merge) this candidate"""
+        if self.bytes is None:
+            return float('inf')
+        seconds = self.bytes / ASSUMED_BYTES_PER_SECOND
+        if self.merge:
+            seconds += self.bytes / MERGE_BYTES_PER_SECOND
+        return seconds
+
+    def to_format(self):
+        """Return the format dict to hand back to yt-dlp"""
+        if not self.merge:
+            return self.formats[0]
+        video, audio = self.formats
+        return {
+            'requested_formats': self.formats,
+            'format': f"{video.get('format')}+{audio.get('format')}",
+            'format_id': f"{video['format_id']}+{audio['format_id']}",
+            'ext': self.ext,
+            'protocol': f"{video.get('protocol')}+{audio.get('protocol')}",
+            'width': video.get('width'),
+            'height': video.get('height'),
+            'fps': video.get('fps'),
+            'vcodec': video.get('vcodec'),
+            'acodec': audio.get('acodec'),
+            'tbr': (video.get('tbr') or 0) + (audio.get('tbr') or audio.get('abr') or 0),
+            'filesize_approx': self.bytes,
+        }
+
+    def describe(self):
+        fmt = self.to_format()
+        return {
+            'format_id': fmt['format_id'],
+            'ext': fmt.get('ext'),
+            'height': self.height or None,
+            'estimated_bytes': self.bytes,
+            'merge': self.merge,
+        }
+
+
+def build_candidates(formats, duration=None, can_merge=True, containers=None):
+    """Return every single-file candidate and, if merging is possible, every video+audio pair
+
+    containers limits pairs to those whose merged container is in the list.
+    """
+    candidates = [Candidate([f], duration) for f in formats if has_video(f) and has_audio(f)]
+    if can_merge:
+        videos = [f for f in formats if has_video(f) and not has_audio(f)]
+        audios = [f for f in formats if has_audio(f) and not has_video(f)]
+        best_abr = max((f.get('abr') or 0 for f in audios), default=0)
+        audios = [f for f in audios if (f.get('abr') or 0) >= best_abr * AUDIO_QUALITY_FLOOR]
+        pairs = (Candidate([v, a], duration) for v in videos for a in audios)
+        candidates.extend(c for c in pairs if containers is None or c.ext in containers)
+    return candidates
+
+
+def choose_format(formats, preset=DEFAULT_PRESET, duration=None, can_merge=True, containers=None):
+    """Return the cheapest Candidate reaching the best quality the preset allows, or None"""
+    settings = PRESETS.get(preset, PRESETS[DEFAULT_PRESET])
+    formats = [f for f in formats if f.get('format_id')]
+    duration = duration or infer_duration(formats)
+
+    if settings.get('audio_only'):
+        audios = [Candidate([f], duration) for f in formats if has_audio(f) and not has_video(f)]
+        if not audios:
+            audios = [Candidate([f], duration) for f in formats if has_audio(f)]
+        if not audios:
+            return None
+        best_abr = max(c.abr for c in audios)
+        pool = [c for c in audios if c.abr >= best_abr * AUDIO_QUALITY_FLOOR]
+        return min(pool, key=lambda c: (c.cost, -c.abr))
+
+    candidates = build_candidates(formats, duration, can_merge and not settings.get('progressive_only'), containers)
+    if not candidates:
+        # Nothing is known about the codecs; fall back to yt-dlp's own ordering
+        return Candidate([formats[-1]], duration) if formats else None
+
+    max_height = settings.get('max_height')
+    if max_height:
+        capped = [c for c in candidates if c.height <= max_height]
+        candidates = capped or [min(candidates, key=lambda c: c.height)]
+
+    max_bytes = settings.get('max_bytes')
+    if max_bytes:
+        fitting = [c for c in candidates if c.bytes is not None and c.bytes <= max_bytes]
+        if not fitting:
+            return min(candidates, key=lambda c: c.bytes if c.bytes is not None else float('inf'))
+        candidates = fitting
+
+    best_quality = max(c.quality for c in candidates)
+    pool = [c for c in candidates if c.quality == best_quality]
+    return min(pool, key=lambda c: (c.cost, -c.abr))
+
+
+def make_format_selector(preset=DEFAULT_PRESET, can_merge=True, containers=None):
+    """Return a callable for yt-dlp's 'format' option implementing the preset
+
+    can_merge and containers describe the ffmpeg available for merging (see
+    ffmpeg_toolchain.Toolchain).
+    """
+    def format_selector(ctx):
+        formats = ctx.get('formats') or []
+        candidate = choose_format(formats, preset, can_merge=can_merge, containers=containers)
+        if candidate is not None:
+            yield candidate.to_format()
+
+    return format_selector
+
+
+def plan_formats(info, preset=DEFAULT_PRESET, can_merge=True, containers=None):
+    """Describe what the preset would download for an extracted video, or None"""
+    candidate = choose_format(info.get('formats') or [], preset, info.get('duration'), can_merge, containers)
+    return candidate.describe() if candidate is not None else None
@@ -0,0 +1,12 @@
+"""Display helpers shared by the front ends and the download engine."""
+
+
+def format_bytes(bytes_val):
+    """Format a byte count for display"""
+    if bytes_val is None or bytes_val == 0:
+        return "0 B"
+    for unit in ['B', 'KB', 'MB', 'GB']:
+        if abs(bytes_val) < 1024.0:
+            return f"{bytes_val:.1f} {unit}"
+        bytes_val /= 1024.0
+    return f"{bytes_val:.1f} TB"
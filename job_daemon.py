@@ -0,0 +1,575 @@
+"""Local background job runner with a small JSON-over-HTTP API.
+
+The daemon owns the download queue in its own process, so heavy downloading
+no longer competes with UI rendering for the GIL, and it outlives any one
+Streamlit script run or Tk window. Both front ends submit batches with
+JobDaemonClient and poll for events; job state is persisted as JSON under
+~/.youtube_downloader/daemon (or --state-dir / YTDL_DAEMON_STATE_DIR) so it
+survives restarts of the daemon, and batches cut short by a crash are resumed
+from the batch journal on startup. Only the most recent finished jobs are
+kept, and daemon.log is rotated whenever ensure_daemon() starts a daemon.
+
+Run it with ``python job_daemon.py`` (or let ensure_daemon() spawn it).
+
+Every request except /health must carry ``Authorization: Bearer <token>``,
+where the token is the per-install secret in the state directory's token file
+(created on first use, readable by the user only), and POST bodies must be
+sent as Content-Type: application/json. A web page can reach 127.0.0.1 too,
+but can neither read the token nor send either header without a CORS
+preflight the daemon never grants.
+
+API (all bodies are JSON):
+    GET  /health                      -> {"status": "ok", "pid": ...}
+    GET  /jobs                        -> {"jobs": [summary, ...]}
+    POST /jobs                        {"urls": [...], "download_path": "...", "options": {...}}
+    GET  /jobs/<job_id>?cursor=N      -> summary + events with seq > N
+    GET  /jobs/<job_id>/log?cursor=N  -> debug records with seq > N
+    POST /jobs/<job_id>/cancel
+"""
+import argparse
+import hmac
+import inspect
+import json
+import os
+import secrets
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from batch_journal import FINISHED_STATES, get_default_journal
+from download_archive import APP_DATA_DIR
+from job_manager import FINISHED_JOB_RETENTION, Job
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+DAEMON_URL_ENV = 'YTDL_DAEMON_URL'
+STATE_DIR_ENV = 'YTDL_DAEMON_STATE_DIR'
+DEFAULT_STATE_DIR = os.path.join(APP_DATA_DIR, "daemon")
+TOKEN_FILENAME = "token"
+LOG_FILENAME = "daemon.log"
+# daemon.log is moved to daemon.log.1 at the next spawn once it is this large
+LOG_MAX_BYTES = 1024 * 1024
+# download_videos() arguments the daemon sets itself rather than taking from a request
+RESERVED_OPTIONS = ('session_job', 'urls', 'download_path', 'owner', 'more_urls')
+# Batches run side by side; each batch has its own per-video concurrency
+MAX_ACTIVE_JOBS = 2
+EVENT_BUFFER_SIZE = 5000
+# Persisted summaries of finished jobs: at most this many, none older than HISTORY_RETENTION
+HISTORY_LIMIT = 200
+HISTORY_RETENTION = 30 * 24 * 60 * 60
+# Keys of a yt-dlp progress dict that are worth sending over the wire
+PROGRESS_KEYS = ('status', 'filename', 'tmpfilename', 'downloaded_bytes', 'total_bytes',
+                 'total_bytes_estimate', 'speed', 'eta', 'elapsed')
+TERMINAL_STATUSES = ('done', 'cancelled', 'interrupted')
+
+
+def default_daemon_url():
+    return os.environ.get(DAEMON_URL_ENV) or f"http://{DEFAULT_HOST}:{DEFAULT_PORT}"
+
+
+def default_state_dir():
+    return os.environ.get(STATE_DIR_ENV) or DEFAULT_STATE_DIR
+
+
+def token_path(state_dir=None):
+    return os.path.join(state_dir or default_state_dir(), TOKEN_FILENAME)
+
+
+def rotate_log(path, max_bytes=LOG_MAX_BYTES):
+    """Move path to path.1 (replacing the previous one) once it reaches max_bytes"""
+    try:
+        if os.path.getsize(path) >= max_bytes:
+            os.replace(path, path + ".1")
+    except OSError:
+        pass
+
+
+def load_token(path=None):
+    """Return the per-install API token, creating it on first use
+
+    The file is written under a temporary name and linked into place, so a
+    client and a starting daemon that race to create it agree on one token.
+    """
+    path = path or token_path()
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            token = f.read().strip()
+        if token:
+            return token
+    except FileNotFoundError:
+        pass
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        f.write(secrets.token_urlsafe(32))
+    try:
+        os.link(tmp_path, path)
+    except FileExistsError:
+        pass
+    except OSError:
+        # No hardlinks on this filesystem
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    with open(path, 'r', encoding='utf-8') as f:
+        return f.read().strip()
+
+
+def job_option_names():
+    """download_videos() keyword arguments a submitted job may set"""
+    # Imported here so the HTTP API answers immediately after startup
+    from download_core import download_videos
+    return [name for name in inspect.signature(download_videos).parameters if name not in RESERVED_OPTIONS]
+
+
+def slim_progress(d):
+    """Reduce a progress hook dict to JSON-friendly fields"""
+    slim = {key: d[key] for key in PROGRESS_KEYS if key in d}
+    title = (d.get('info_dict') or {}).get('title')
+    if title:
+        slim['info_dict'] = {'title': title}
+    return slim
+
+
+def event_to_message(event):
+    """Turn a daemon event back into the message tuple a Job would have posted"""
+    if event.get('job_id') is not None:
+        return (event['type'], event['job_id'], event['data'])
+    return (event['type'], event['data'])
+
+
+class DaemonJob(Job):
+    """A Job whose messages are recorded as numbered events for HTTP pollers"""
+    def __init__(self, urls, download_path, options, job_id=None):
+        super().__init__(session_id='daemon', job_id=job_id)
+        self.urls = list(urls)
+        self.download_path = download_path
+        self.options = dict(options or {})
+        self.status = 'queued'
+        self.downloaded_files = []
+        self.videos = {}
+        self.validation = []
+        self.throughput = None
+        self.estimate = None
+        self.on_change = None
+        self._events = deque(maxlen=EVENT_BUFFER_SIZE)
+        self._event_seq = 0
+        self._event_lock = threading.Lock()
+
+    def post(self, *message):
+        if len(message) == 3:
+            msg_type, job_id, data = message
+        else:
+            (msg_type, data), job_id = message, None
+
+        state_changed = False
+        if msg_type == 'progress':
+            data = slim_progress(data)
+        elif msg_type in ('output', 'skipped'):
+            self.downloaded_files.append(data)
+        elif msg_type == 'validation':
+            self.validation = data
+        elif msg_type == 'throughput':
+            self.throughput = data
+        elif msg_type == 'estimate':
+            self.estimate = data
+        elif msg_type == 'job':
+            self.videos[job_id] = dict(data)
+            state_changed = data.get('status') != 'queued'
+        elif msg_type == 'complete':
+            state_changed = True
+
+        with self._event_lock:
+            self._event_seq += 1
+            self._events.append({'seq': self._event_seq, 'type': msg_type, 'job_id': job_id, 'data': data})
+        if state_changed and self.on_change:
+            self.on_change(self)
+
+    def events_since(self, cursor=0):
+        with self._event_lock:
+            new_count = min(self._event_seq - cursor, len(self._events))
+            events = list(self._events)[-new_count:] if new_count > 0 else []
+            return events, self._event_seq
+
+    def summary(self):
+        return {
+            'job_id': self.job_id,
+            'status': self.status,
+            'urls': self.urls,
+            'download_path': self.download_path,
+            'options': self.options,
+            'videos': self.videos,
+            'downloaded_files': self.downloaded_files,
+            'validation': self.validation,
+            'throughput': self.throughput,
+            'estimate': self.estimate,
+            'created_at': self.created_at,
+            'finished_at': self.finished_at,
+        }
+
+
+class JobDaemon:
+    """Owns the batch queue, runs batches on a bounded pool and persists their state"""
+    def __init__(self, state_dir=None, max_active_jobs=MAX_ACTIVE_JOBS, retention=FINISHED_JOB_RETENTION):
+        self.state_dir = state_dir = state_dir or default_state_dir()
+        self.retention = retention
+        self.jobs_dir = os.path.join(state_dir, "jobs")
+        os.makedirs(self.jobs_dir, exist_ok=True)
+        self._jobs = {}
+        self._history = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_active_jobs, thread_name_prefix="DaemonBatch")
+        self._load_history()
+        self._resume_interrupted()
+
+    def _state_path(self, job_id):
+        return os.path.join(self.jobs_dir, f"{job_id}.json")
+
+    def _load_history(self):
+        """Load persisted jobs; any that were still running are marked interrupted"""
+        for name in os.listdir(self.jobs_dir):
+            if not name.endswith('.json'):
+                continue
+            try:
+                with open(os.path.join(self.jobs_dir, name), 'r', encoding='utf-8') as f:
+                    state = json.load(f)
+            except (OSError, ValueError):
+                continue
+            if state.get('status') not in TERMINAL_STATUSES:
+                state['status'] = 'interrupted'
+                self._write_state(state)
+            self._history[state['job_id']] = state
+        self._trim_history_locked()
+
+    def _trim_history_locked(self):
+        """Forget (and delete the state files of) finished jobs beyond HISTORY_LIMIT or HISTORY_RETENTION"""
+        cutoff = time.time() - HISTORY_RETENTION
+        by_age = sorted(self._history.values(),
+                        key=lambda state: state.get('finished_at') or state.get('created_at') or 0,
+                        reverse=True)
+        for index, state in enumerate(by_age):
+            finished = state.get('finished_at') or state.get('created_at') or 0
+            if index < HISTORY_LIMIT and finished >= cutoff:
+                continue
+            del self._history[state['job_id']]
+            try:
+                os.remove(self._state_path(state['job_id']))
+            except OSError:
+                pass
+
+    def _write_state(self, state):
+        path = self._state_path(state['job_id'])
+        tmp_path = path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(state, f)
+        os.replace(tmp_path, path)
+
+    def persist(self, job):
+        try:
+            self._write_state(job.summary())
+        except OSError as e:
+            job.debug(f"Could not persist job state: {e}", 'ERROR', 'daemon')
+
+    def _resume_interrupted(self):
+        """Restart batches the previous daemon process left unfinished"""
+        try:
+            batches = get_default_journal().interrupted_batches(owner='daemon')
+        except Exception as e:
+            print(f"Batch journal unavailable, not resuming: {e}")
+            return
+        for batch in batches:
+            pending = sum(1 for item in batch['items'] if item['state'] not in FINISHED_STATES)
+            print(f"Resuming {batch['batch_id']}: {pending} of {len(batch['items'])} URL(s) unfinished")
+            self.submit(batch['urls'], batch['download_path'], batch['options'], job_id=batch['batch_id'])
+
+    def submit(self, urls, download_path, options=None, job_id=None):
+        job = DaemonJob(urls, download_path, options, job_id)
+        job.on_change = self.persist
+        with self._lock:
+            self._prune_locked()
+            self._jobs[job.job_id] = job
+        self.persist(job)
+        self._executor.submit(self._run, job)
+        return job
+
+    def _run(self, job):
+        # Imported here so the HTTP API answers immediately after startup
+        from download_engine import get_default_engine
+
+        job.status = 'running'
+        self.persist(job)
+        try:
+            get_default_engine().execute(job, job.urls, job.download_path, owner='daemon', **job.options)
+        finally:
+            if not job.done:
+                job.mark_complete()
+            job.status = 'cancelled' if job.cancelled else 'done'
+            self.persist(job)
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def _prune_locked(self):
+        # Finished jobs are kept a while for pollers to read their last
+        # events; after that only their persisted summary remains
+        cutoff = time.time() - self.retention
+        for job_id, job in list(self._jobs.items()):
+            if job.status in TERMINAL_STATUSES and job.finished_at is not None and job.finished_at < cutoff:
+                self._history[job_id] = job.summary()
+                del self._jobs[job_id]
+        self._trim_history_locked()
+
+    def list_jobs(self):
+        with self._lock:
+            self._prune_locked()
+            merged = dict(self._history)
+            merged.update((job_id, job.summary()) for job_id, job in self._jobs.items())
+        return sorted(merged.values(), key=lambda state: state.get('created_at') or 0)
+
+    def job_state(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return self._history.get(job_id)
+        return job.summary()
+
+    def cancel(self, job_id):
+        job = self.get(job_id)
+        if job is not None:
+            job.cancel()
+        return job
+
+
+class DaemonRequestHandler(BaseHTTPRequestHandler):
+    """JSON routes for the JobDaemon stored on the server"""
+    server_version = "YoutubeDownloaderDaemon/1.0"
+
+    @property
+    def daemon(self):
+        return self.server.job_daemon
+
+    def log_message(self, format, *args):
+        # Polling is frequent; keep the console for errors only
+        pass
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_json(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        if not length:
+            return {}
+        return json.loads(self.rfile.read(length).decode('utf-8'))
+
+    def _authorized(self):
+        expected = f"Bearer {self.server.token}".encode('utf-8')
+        return hmac.compare_digest(self.headers.get('Authorization', '').encode('utf-8'), expected)
+
+    def _cursor(self, query):
+        try:
+            return int(query.get('cursor', ['0'])[0])
+        except ValueError:
+            return 0
+
+    def do_GET(self):
+        parsed = urlparse(self.path)
+        parts = [p for p in parsed.path.split('/') if p]
+        query = parse_qs(parsed.query)
+
+        if parts == ['health']:
+            return self._send_json(200, {'status': 'ok', 'pid': os.getpid()})
+        if not self._authorized():
+            return self._send_json(401, {'error': 'missing or wrong token'})
+        if parts == ['jobs']:
+            return self._send_json(200, {'jobs': self.daemon.list_jobs()})
+        if len(parts) == 2 and parts[0] == 'jobs':
+            state = self.daemon.job_state(parts[1])
+            if state is None:
+                return self._send_json(404, {'error': 'unknown job'})
+            job = self.daemon.get(parts[1])
+            events, cursor = job.events_since(self._cursor(query)) if job else ([], 0)
+            return self._send_json(200, dict(state, events=events, cursor=cursor))
+        if len(parts) == 3 and parts[0] == 'jobs' and parts[2] == 'log':
+            job = self.daemon.get(parts[1])
+            if job is None:
+                return self._send_json(404, {'error': 'unknown job'})
+            records, cursor = job.log.read_since(self._cursor(query))
+            return self._send_json(200, {'records': [r._asdict() for r in records], 'cursor': cursor})
+        return self._send_json(404, {'error': 'not found'})
+
+    def do_POST(self):
+        parts = [p for p in urlparse(self.path).path.split('/') if p]
+        if not self._authorized():
+            return self._send_json(401, {'error': 'missing or wrong token'})
+        content_type = self.headers.get('Content-Type', '').split(';')[0].strip().lower()
+        if content_type != 'application/json':
+            return self._send_json(415, {'error': 'Content-Type must be application/json'})
+        try:
+            payload = self._read_json()
+        except ValueError:
+            return self._send_json(400, {'error': 'invalid JSON'})
+        if not isinstance(payload, dict):
+            return self._send_json(400, {'error': 'body must be a JSON object'})
+
+        if parts == ['jobs']:
+            urls = payload.get('urls') or []
+            download_path = payload.get('download_path')
+            options = payload.get('options') or {}
+            if not urls or not download_path:
+                return self._send_json(400, {'error': 'urls and download_path are required'})
+            if not isinstance(options, dict):
+                return self._send_json(400, {'error': 'options must be a JSON object'})
+            unknown = sorted(set(options) - set(job_option_names()))
+            if unknown:
+                return self._send_json(400, {'error': f"unknown option(s): {', '.join(unknown)}"})
+            job = self.daemon.submit(urls, download_path, options)
+            return self._send_json(201, job.summary())
+        if len(parts) == 3 and parts[0] == 'jobs' and parts[2] == 'cancel':
+            job = self.daemon.cancel(parts[1])
+            if job is None:
+                return self._send_json(404, {'error': 'unknown job'})
+            return self._send_json(200, job.summary())
+        return self._send_json(404, {'error': 'not found'})
+
+
+class DaemonUnavailable(Exception):
+    """Raised when the daemon cannot be reached or started"""
+
+
+class JobDaemonClient:
+    """Minimal client for the daemon's HTTP API
+
+    The token is read from token_file, which defaults to the one in state_dir
+    (the daemon's --state-dir; YTDL_DAEMON_STATE_DIR or the default one).
+    """
+    def __init__(self, base_url=None, timeout=5, token_file=None, state_dir=None):
+        self.base_url = (base_url or default_daemon_url()).rstrip('/')
+        self.timeout = timeout
+        self.state_dir = state_dir or default_state_dir()
+        self.token_file = token_file or token_path(self.state_dir)
+        self._token = None
+
+    def _request(self, method, path, payload=None):
+        data = json.dumps(payload).encode('utf-8') if payload is not None else None
+        request = urllib.request.Request(self.base_url + path, data=data, method=method)
+        request.add_header('Content-Type', 'application/json')
+        try:
+            if self._token is None:
+                self._token = load_token(self.token_file)
+        except OSError as e:
+            raise DaemonUnavailable(f"Cannot read the daemon token at {self.token_file}: {e}") from e
+        request.add_header('Authorization', f"Bearer {self._token}")
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                return json.loads(response.read().decode('utf-8'))
+        except urllib.error.HTTPError as e:
+            try:
+                reason = json.loads(e.read().decode('utf-8')).get('error')
+            except (OSError, ValueError, AttributeError):
+                reason = None
+            raise DaemonUnavailable(f"Daemon returned HTTP {e.code} for {path}" + (f": {reason}" if reason else "")) from e
+        except (urllib.error.URLError, OSError, ValueError) as e:
+            raise DaemonUnavailable(f"Cannot reach download daemon at {self.base_url}: {e}") from e
+
+    def health(self):
+        """Return the health payload, or None if the daemon is not running"""
+        try:
+            return self._request('GET', '/health')
+        except DaemonUnavailable:
+            return None
+
+    def submit(self, urls, download_path, **options):
+        return self._request('POST', '/jobs', {'urls': list(urls), 'download_path': download_path, 'options': options})
+
+    def get_job(self, job_id, cursor=0):
+        return self._request('GET', f"/jobs/{job_id}?cursor={cursor}")
+
+    def get_log(self, job_id, cursor=0):
+        return self._request('GET', f"/jobs/{job_id}/log?cursor={cursor}")
+
+    def cancel(self, job_id):
+        return self._request('POST', f"/jobs/{job_id}/cancel", {})
+
+    def list_jobs(self):
+        return self._request('GET', '/jobs')['jobs']
+
+
+def ensure_daemon(client=None, startup_timeout=15):
+    """Return a client for a running daemon, spawning a local one if needed
+
+    The spawned daemon uses the client's state directory, so both agree on the token.
+    """
+    client = client or JobDaemonClient()
+    if client.health():
+        return client
+
+    parsed = urlparse(client.base_url)
+    if parsed.hostname not in ('127.0.0.1', 'localhost'):
+        raise DaemonUnavailable(f"Download daemon at {client.base_url} is not running")
+
+    os.makedirs(client.state_dir, exist_ok=True)
+    log_path = os.path.join(client.state_dir, LOG_FILENAME)
+    rotate_log(log_path)
+    log_file = open(log_path, 'ab')
+    subprocess.Popen(
+        [sys.executable, os.path.abspath(__file__), '--host', parsed.hostname, '--port', str(parsed.port or DEFAULT_PORT),
+         '--state-dir', client.state_dir],
+        stdout=log_file,
+        stderr=subprocess.STDOUT,
+        stdin=subprocess.DEVNULL,
+        start_new_session=True,
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+    )
+    log_file.close()
+
+    deadline = time.time() + startup_timeout
+    while time.time() < deadline:
+        if client.health():
+            return client
+        time.sleep(0.2)
+    raise DaemonUnavailable(f"Download daemon did not start within {startup_timeout}s")
+
+
+def serve(host=DEFAULT_HOST, port=DEFAULT_PORT, state_dir=None, max_active_jobs=MAX_ACTIVE_JOBS):
+    state_dir = state_dir or default_state_dir()
+    server = ThreadingHTTPServer((host, port), DaemonRequestHandler)
+    server.daemon_threads = True
+    server.token = load_token(token_path(state_dir))
+    server.job_daemon = JobDaemon(state_dir, max_active_jobs)
+    print(f"Download daemon listening on http://{host}:{port} (state in {state_dir})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Background download job runner")
+    parser.add_argument('--host', default=DEFAULT_HOST)
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--state-dir', default=None,
+                        help=f"Where job state, the token and daemon.log live (default: ${STATE_DIR_ENV} or {DEFAULT_STATE_DIR})")
+    parser.add_argument('--max-active-jobs', type=int, default=MAX_ACTIVE_JOBS)
+    args = parser.parse_args(argv)
+    serve(args.host, args.port, args.state_dir, args.max_active_jobs)
+
+
+if __name__ == "__main__":
+    main()
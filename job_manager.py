@@ -0,0 +1,139 @@
+"""Per-session download jobs for multi-user deployments.
+
+Every batch a user starts becomes a Job with its own progress queue, cancel
+token, debug log and completion state. The JobManager is a process-wide
+registry of jobs keyed by job id and by the session that owns them, so
+concurrent sessions never drain each other's events or cancel each other's
+downloads.
+"""
+import queue
+import threading
+import time
+import uuid
+
+from debug_log import DebugLog
+
+# Finished jobs are kept this long so a reconnecting session can still read them
+FINISHED_JOB_RETENTION = 60 * 60
+
+
+def new_session_id():
+    """Return a random id for a UI session"""
+    return uuid.uuid4().hex
+
+
+class Job:
+    """One download batch: progress channel, cancel token, log and completion state"""
+    def __init__(self, session_id=None, job_id=None):
+        self.job_id = job_id or f"batch-{uuid.uuid4().hex[:8]}"
+        self.session_id = session_id
+        self.queue = queue.Queue()
+        self.cancel_event = threading.Event()
+        self.completed = threading.Event()
+        self.log = DebugLog()
+        self.thread = None
+        self.created_at = time.time()
+        self.finished_at = None
+
+    def __repr__(self):
+        return f"Job({self.job_id!r}, session={self.session_id!r}, done={self.done})"
+
+    @property
+    def done(self):
+        return self.completed.is_set()
+
+    @property
+    def cancelled(self):
+        return self.cancel_event.is_set()
+
+    def post(self, *message):
+        """Send a message tuple to whoever is displaying this job"""
+        self.queue.put(message, block=False)
+
+    def debug(self, message, level='DEBUG', source='app'):
+        """Record a debug message in this job's log; it is formatted only when read"""
+        return self.log.append(message, level, source)
+
+    def cancel(self):
+        self.cancel_event.set()
+
+    def mark_complete(self):
+        """Record completion and tell the UI explicitly"""
+        self.finished_at = time.time()
+        self.completed.set()
+        self.post('complete', None)
+
+    def drain(self):
+        """Return every message currently queued for this job"""
+        messages = []
+        while True:
+            try:
+                messages.append(self.queue.get_nowait())
+            except queue.Empty:
+                return messages
+
+
+class JobManager:
+    """Thread-safe registry of jobs keyed by job id and owning session"""
+    def __init__(self, retention=FINISHED_JOB_RETENTION):
+        self.retention = retention
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def create_job(self, session_id=None, job_id=None):
+        """Register a new job for a session, dropping that session's finished jobs
+
+        Pass the id of an interrupted batch as job_id to resume it.
+        """
+        return self.register(Job(session_id, job_id))
+
+    def register(self, job):
+        """Track a job created elsewhere (a Job subclass, for instance)"""
+        with self._lock:
+            self._prune_locked(job.session_id)
+            self._jobs[job.job_id] = job
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def jobs_for_session(self, session_id):
+        with self._lock:
+            return [job for job in self._jobs.values() if job.session_id == session_id]
+
+    def active_jobs(self):
+        with self._lock:
+            return [job for job in self._jobs.values() if not job.done]
+
+    def start(self, job, target, *args, **kwargs):
+        """Run target(job, *args, **kwargs) on a daemon thread; the job completes when it returns"""
+        def run():
+            try:
+                target(job, *args, **kwargs)
+            finally:
+                if not job.done:
+                    job.mark_complete()
+
+        job.thread = threading.Thread(target=run, daemon=True, name=f"DownloadThread-{job.job_id}")
+        job.thread.start()
+        return job.thread
+
+    def cancel(self, job_id):
+        job = self.get(job_id)
+        if job is not None:
+            job.cancel()
+        return job
+
+    def cancel_session(self, session_id):
+        """Cancel every running job owned by a session"""
+        jobs = [job for job in self.jobs_for_session(session_id) if not job.done]
+        for job in jobs:
+            job.cancel()
+        return jobs
+
+    def _prune_locked(self, session_id=None):
+        cutoff = time.time() - self.retention
+        for job_id, job in list(self._jobs.items()):
+            if job.done and (job.session_id == session_id or job.finished_at < cutoff):
+                del self._jobs[job_id]
@@ -0,0 +1,237 @@
+"""Structural validation of downloaded media files without decoding them.
+
+MP4/M4A files are checked by walking their box headers, WebM/MKV files by
+walking their EBML element headers. Only headers are read (through mmap, so
+the media payload is never copied), which makes a check cost a few page
+faults per file however large it is. The validator catches what a magic
+number check cannot: truncated files whose boxes claim more bytes than the
+file has, MP4s without a ``moov`` index, unmerged streams and files with no
+tracks.
+"""
+import mmap
+import os
+import struct
+from concurrent.futures import ThreadPoolExecutor
+
+MIN_MEDIA_SIZE = 1024
+DEFAULT_MAX_WORKERS = 4
+# Top-level MP4 boxes a valid file may contain
+MP4_TOP_LEVEL_BOXES = {b'ftyp', b'moov', b'mdat', b'moof', b'mfra', b'free', b'skip', b'wide', b'uuid', b'meta', b'styp', b'sidx', b'ssix', b'prft', b'emsg', b'pdin'}
+EBML_MAGIC = b'\x1a\x45\xdf\xa3'
+EBML_DOCTYPE = 0x4282
+MKV_SEGMENT = 0x18538067
+MKV_TRACKS = 0x1654AE6B
+MKV_TRACK_ENTRY = 0xAE
+MKV_CLUSTER = 0x1F43B675
+
+
+class ValidationResult:
+    """Outcome of validating one file"""
+    def __init__(self, path, valid, container='unknown', size=0, tracks=None, message='', problems=None):
+        self.path = path
+        self.valid = valid
+        self.container = container
+        self.size = size
+        self.tracks = tracks
+        self.message = message
+        self.problems = problems or []
+
+    def __repr__(self):
+        return f"ValidationResult({os.path.basename(self.path)!r}, valid={self.valid}, {self.message!r})"
+
+    def to_dict(self):
+        return {
+            'path': self.path,
+            'valid': self.valid,
+            'container': self.container,
+            'size': self.size,
+            'tracks': self.tracks,
+            'message': self.message,
+            'problems': self.problems,
+        }
+
+
+def _iter_mp4_boxes(data, start, end):
+    """Yield (type, header_start, payload_start, box_end) for boxes in data[start:end]
+
+    box_end may lie beyond end when the file is truncated; the walk stops there.
+    """
+    offset = start
+    while offset + 8 <= end:
+        size, box_type = struct.unpack_from('>I4s', data, offset)
+        header_size = 8
+        if size == 1:
+            if offset + 16 > end:
+                yield box_type, offset, end, offset + 16
+                return
+            size = struct.unpack_from('>Q', data, offset + 8)[0]
+            header_size = 16
+        elif size == 0:
+            # The box extends to the end of its parent
+            size = end - offset
+        if size < header_size:
+            yield box_type, offset, offset + header_size, None
+            return
+        yield box_type, offset, offset + header_size, offset + size
+        offset += size
+
+
+def validate_mp4(data, size):
+    """Check box structure, moov/mdat presence and track count of an ISO BMFF file"""
+    problems = []
+    seen = {}
+    tracks = 0
+    for box_type, box_start, payload_start, box_end in _iter_mp4_boxes(data, 0, size):
+        if box_end is None:
+            problems.append(f"invalid size for '{box_type.decode('latin-1')}' box at offset {box_start}")
+            break
+        if box_type not in MP4_TOP_LEVEL_BOXES:
+            problems.append(f"unexpected top-level box {box_type!r} at offset {box_start}")
+            break
+        if box_end > size:
+            problems.append(f"'{box_type.decode()}' box declares {box_end - box_start} bytes but only {size - box_start} are present (truncated)")
+        seen[box_type] = seen.get(box_type, 0) + 1
+        if box_type == b'moov':
+            for child_type, _, _, child_end in _iter_mp4_boxes(data, payload_start, min(box_end, size)):
+                if child_end is None:
+                    problems.append("invalid box inside 'moov'")
+                    break
+                if child_type == b'trak':
+                    tracks += 1
+        if box_end > size:
+            break
+
+    if not seen:
+        return 'mp4', None, ["no MP4 boxes found"]
+    if b'ftyp' not in seen and b'styp' not in seen:
+        problems.append("missing 'ftyp' box")
+    if b'moov' not in seen:
+        problems.append("missing 'moov' box (index not written; download or merge did not finish)")
+        tracks = None
+    elif tracks == 0:
+        problems.append("'moov' box has no tracks")
+    if b'mdat' not in seen:
+        problems.append("missing 'mdat' box (no media data)")
+    return 'mp4', tracks, problems
+
+
+def _read_vint(data, offset, end, keep_marker=False):
+    """Read an EBML variable-length integer; returns (value, length, unknown_size)"""
+    if offset >= end:
+        raise ValueError("unexpected end of data")
+    first = data[offset]
+    length = 1
+    mask = 0x80
+    while length <= 8 and not first & mask:
+        mask >>= 1
+        length += 1
+    if length > 8 or offset + length > end:
+        raise ValueError(f"invalid variable-length integer at offset {offset}")
+    value = first if keep_marker else first & (mask - 1)
+    for i in range(1, length):
+        value = (value << 8) | data[offset + i]
+    unknown = not keep_marker and value == (1 << (7 * length)) - 1
+    return value, length, unknown
+
+
+def _iter_ebml_elements(data, start, end, file_size):
+    """Yield (element_id, element_start, payload_start, payload_end or None for unknown size)"""
+    offset = start
+    while offset < end:
+        element_id, id_length, _ = _read_vint(data, offset, file_size, keep_marker=True)
+        payload_size, size_length, unknown = _read_vint(data, offset + id_length, file_size)
+        payload_start = offset + id_length + size_length
+        if unknown:
+            yield element_id, offset, payload_start, None
+            return
+        yield element_id, offset, payload_start, payload_start + payload_size
+        offset = payload_start + payload_size
+
+
+def validate_ebml(data, size):
+    """Check EBML header, Segment size, Tracks and Clusters of a WebM/Matroska file"""
+    problems = []
+    container = 'mkv'
+    tracks = None
+    has_segment = False
+    has_clusters = False
+    try:
+        elements = _iter_ebml_elements(data, 0, size, size)
+        header_id, _, header_start, header_end = next(elements)
+        if header_end is None or header_end > size:
+            return container, None, ["EBML header is truncated"]
+        for child_id, _, child_start, child_end in _iter_ebml_elements(data, header_start, header_end, size):
+            if child_id == EBML_DOCTYPE and child_end is not None:
+                doctype = bytes(data[child_start:child_end]).rstrip(b'\0').decode('ascii', 'replace')
+                container = 'webm' if doctype == 'webm' else 'mkv'
+
+        for element_id, element_start, payload_start, payload_end in elements:
+            if element_id != MKV_SEGMENT:
+                continue
+            has_segment = True
+            if payload_end is not None and payload_end > size:
+                problems.append(f"Segment declares {payload_end - payload_start} bytes but only {size - payload_start} are present (truncated)")
+            segment_end = min(payload_end, size) if payload_end is not None else size
+            for child_id, child_start_offset, child_start, child_end in _iter_ebml_elements(data, payload_start, segment_end, size):
+                if child_id == MKV_TRACKS and child_end is not None:
+                    tracks = sum(
+                        1 for entry_id, _, _, _ in _iter_ebml_elements(data, child_start, min(child_end, size), size)
+                        if entry_id == MKV_TRACK_ENTRY
+                    )
+                elif child_id == MKV_CLUSTER:
+                    has_clusters = True
+                    if child_end is None:
+                        # Live-style cluster without a size; nothing more to walk cheaply
+                        break
+                    if child_end > size:
+                        problems.append(f"Cluster at offset {child_start_offset} is truncated")
+                        break
+            break
+    except StopIteration:
+        return container, None, ["empty EBML stream"]
+    except ValueError as e:
+        problems.append(str(e))
+
+    if not has_segment:
+        problems.append("missing Segment element")
+    if tracks is None:
+        problems.append("missing Tracks element")
+    elif tracks == 0:
+        problems.append("Tracks element has no tracks")
+    if has_segment and not has_clusters:
+        problems.append("no Cluster elements (no media data)")
+    return container, tracks, problems
+
+
+def validate_file(filepath):
+    """Validate one media file and return a ValidationResult"""
+    try:
+        size = os.path.getsize(filepath)
+    except OSError as e:
+        return ValidationResult(filepath, False, message=f"File does not exist: {e}")
+    if size < MIN_MEDIA_SIZE:
+        return ValidationResult(filepath, False, size=size, message=f"File too small: {size} bytes")
+
+    try:
+        with open(filepath, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            if data[:4] == EBML_MAGIC:
+                container, tracks, problems = validate_ebml(data, size)
+            elif data[4:8] in MP4_TOP_LEVEL_BOXES:
+                container, tracks, problems = validate_mp4(data, size)
+            else:
+                return ValidationResult(filepath, False, size=size, message=f"Unknown format, header: {data[:12].hex()}")
+    except (OSError, ValueError) as e:
+        return ValidationResult(filepath, False, size=size, message=f"Error checking file: {e}")
+
+    if problems:
+        return ValidationResult(filepath, False, container, size, tracks, f"Invalid {container.upper()}: {problems[0]}", problems)
+    return ValidationResult(filepath, True, container, size, tracks, f"Valid {container.upper()} file, {tracks} track(s) ({size} bytes)")
+
+
+def validate_files(filepaths, max_workers=DEFAULT_MAX_WORKERS):
+    """Validate files in a thread pool; results are returned in input order"""
+    filepaths = list(filepaths)
+    if len(filepaths) <= 1:
+        return [validate_file(path) for path in filepaths]
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(filepaths)), thread_name_prefix="MediaValidator") as pool:
+        return list(pool.map(validate_file, filepaths))
@@ -0,0 +1,215 @@
+"""Cache for yt-dlp metadata extraction.
+
+An in-process LRU with TTL-based expiry, optionally backed by JSON files on
+disk so the Tk app, the Streamlit app and restarts of either can reuse an
+extraction. URL previews and the actual download go through
+extract_info_cached(), so a video that was just probed is not extracted again.
+"""
+import copy
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from download_archive import APP_DATA_DIR, parse_video_id
+
+# Signed stream URLs in YouTube metadata expire after a few hours, so cached
+# extractions are only trusted for a fraction of that
+DEFAULT_TTL = 30 * 60
+DEFAULT_MAX_ENTRIES = 256
+DEFAULT_CACHE_DIR = os.path.join(APP_DATA_DIR, "metadata_cache")
+# Fields yt-dlp copies from the format(s) it selected onto the info dict. Left
+# in a cached entry, requested_formats in particular would be downloaded on
+# replay whatever format the downloading instance selects.
+SELECTED_FORMAT_FIELDS = (
+    'requested_formats', 'requested_downloads', 'requested_subtitles',
+    'format_id', 'format', 'format_note', 'url', 'manifest_url', 'ext', 'protocol',
+    'width', 'height', 'resolution', 'fps', 'dynamic_range', 'aspect_ratio', 'stretched_ratio',
+    'vcodec', 'acodec', 'vbr', 'abr', 'tbr', 'asr', 'audio_channels', 'audio_ext', 'video_ext',
+    'filesize', 'filesize_approx', 'container', 'quality', 'preference', 'source_preference',
+    'http_headers', 'downloader_options', 'fragments', 'fragment_base_url', 'has_drm',
+)
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def cache_key(url):
+    """Return the cache key for a URL, or None if it should not be cached
+
+    Only single videos are cached; keying on the video id lets watch, short
+    and mobile links to the same video share one entry. Playlists and
+    channels are not cached because extracting them fully is the expensive
+    part that the download itself has to repeat anyway.
+    """
+    parsed = parse_video_id(url)
+    if parsed is None:
+        return None
+    return f"{parsed[0]}:{parsed[1]}"
+
+
+class MetadataCache:
+    """Thread-safe LRU of info dicts with TTL expiry and an optional disk store"""
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, ttl=DEFAULT_TTL, disk_dir=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.disk_dir = disk_dir
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, hashlib.sha1(key.encode()).hexdigest() + ".json")
+
+    def _is_fresh(self, stored_at):
+        return time.time() - stored_at < self.ttl
+
+    def get(self, url):
+        """Return a private copy of the cached info dict for url, or None"""
+        key = cache_key(url)
+        if key is None:
+            return None
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if self._is_fresh(entry[0]):
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return copy.deepcopy(entry[1])
+                del self._entries[key]
+
+        info = self._load_from_disk(key)
+        with self._lock:
+            if info is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._store(key, info[0], info[1])
+        return copy.deepcopy(info[1])
+
+    def put(self, url, info):
+        """Cache a JSON-serializable (sanitized) info dict for url"""
+        key = cache_key(url)
+        if key is None or not info:
+            return
+        stored_at = time.time()
+        with self._lock:
+            self._store(key, stored_at, info)
+        self._save_to_disk(key, stored_at, info)
+
+    def invalidate(self, url):
+        key = cache_key(url)
+        if key is None:
+            return
+        with self._lock:
+            self._entries.pop(key, None)
+        if self.disk_dir:
+            try:
+                os.remove(self._disk_path(key))
+            except OSError:
+                pass
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def _store(self, key, stored_at, info):
+        # Called with the lock held
+        self._entries[key] = (stored_at, info)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _load_from_disk(self, key):
+        if not self.disk_dir:
+            return None
+        path = self._disk_path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                payload = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if not self._is_fresh(payload.get('stored_at', 0)):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return None
+        return payload['stored_at'], payload['info']
+
+    def _save_to_disk(self, key, stored_at, info):
+        if not self.disk_dir:
+            return
+        path = self._disk_path(key)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'stored_at': stored_at, 'info': info}, f)
+            os.replace(tmp_path, path)
+        except (OSError, TypeError, ValueError):
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+
+
+def strip_format_selection(info):
+    """Drop what format selection added to info, so replaying it selects formats again
+
+    Info dicts without a formats list describe their only format at the top
+    level and are returned unchanged.
+    """
+    if info and info.get('formats'):
+        for field in SELECTED_FORMAT_FIELDS:
+            info.pop(field, None)
+    return info
+
+
+def cacheable_info(ydl, info):
+    """JSON-serializable copy of an extraction, as stored in the cache"""
+    return strip_format_selection(ydl.sanitize_info(info, remove_private_keys=True))
+
+
+def extract_info_cached(ydl, url, cache=None, download=False):
+    """Extract metadata for url through the cache, optionally downloading it
+
+    A cached extraction is handed back to yt-dlp with process_ie_result(),
+    the same way yt-dlp replays --load-info-json. The cache holds no format
+    selection, so the formats downloaded follow the options of the
+    YoutubeDL instance doing the download, not those of whoever extracted.
+    """
+    cache = cache if cache is not None else get_default_cache()
+    info = cache.get(url)
+    if info is None:
+        if cache_key(url) is None:
+            return ydl.extract_info(url, download=download)
+        info = ydl.extract_info(url, download=False)
+        if not info:
+            return info
+        cache.put(url, cacheable_info(ydl, info))
+        if not download:
+            return info
+        info = cacheable_info(ydl, info)
+    if download:
+        # Entries cached by older versions may still carry a format selection
+        return ydl.process_ie_result(strip_format_selection(info), download=True)
+    return info
+
+
+def get_default_cache():
+    """Return the process-wide cache, persisted under the user's home directory"""
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = MetadataCache(disk_dir=DEFAULT_CACHE_DIR)
+        return _default_cache
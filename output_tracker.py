@@ -0,0 +1,125 @@
+"""Track the files a batch produces without rescanning the download directory.
+
+OutputTracker learns every output from yt-dlp itself: progress hooks report
+each downloaded stream, postprocessor hooks report merged and converted
+files, and post hooks report the final file of each video. Finding out what
+a batch wrote therefore costs one entry per file produced, however many
+files the directory already holds.
+
+DirectorySnapshot is the optional fallback for when the directory itself
+has to be inspected (debug mode): one os.scandir pass whose entries are
+cached per directory and reused while the directory's own
+mtime is unchanged.
+"""
+import os
+import threading
+
+from download_archive import get_output_path, iter_video_infos
+
+_snapshots = {}
+_snapshots_lock = threading.Lock()
+
+
+class OutputTracker:
+    """Thread-safe record of the files written by one batch, fed by yt-dlp hooks"""
+    def __init__(self):
+        self._outputs = {}
+        self._streams = {}
+        self._lock = threading.Lock()
+
+    def progress_hook(self, d, job_id=None):
+        """yt-dlp progress hook: remember each stream that finished downloading"""
+        if d.get('status') == 'finished' and d.get('filename'):
+            with self._lock:
+                self._streams[os.path.abspath(d['filename'])] = job_id
+
+    def postprocessor_hook(self, d, job_id=None):
+        """yt-dlp postprocessor hook: remember files produced by merging or converting"""
+        if d.get('status') == 'finished':
+            filepath = (d.get('info_dict') or {}).get('filepath')
+            if filepath:
+                with self._lock:
+                    self._streams[os.path.abspath(filepath)] = job_id
+
+    def post_hook(self, filepath, job_id=None):
+        """yt-dlp post hook: called with the final file of each video"""
+        self.add_output(filepath, job_id)
+
+    def add_output(self, filepath, job_id=None):
+        with self._lock:
+            self._outputs[os.path.abspath(filepath)] = job_id
+
+    def add_info(self, info, job_id=None):
+        """Record the final files named in an extract_info() result"""
+        for video in iter_video_infos(info):
+            filepath = get_output_path(video)
+            if filepath:
+                self.add_output(filepath, job_id)
+
+    def outputs(self, job_id=None, existing_only=True):
+        """Return final output paths in the order they were produced
+
+        Streams that were merged away are not included. If the batch never
+        reported a final file (for example because post-processing failed),
+        the finished streams that are still on disk are returned instead.
+        """
+        with self._lock:
+            outputs = [path for path, owner in self._outputs.items() if job_id is None or owner == job_id]
+            if not outputs:
+                outputs = [path for path, owner in self._streams.items() if job_id is None or owner == job_id]
+        if existing_only:
+            outputs = [path for path in outputs if os.path.isfile(path)]
+        return outputs
+
+
+class DirectorySnapshot:
+    """One scandir pass over a directory: name -> (size, mtime)"""
+    def __init__(self, path):
+        self.path = path
+        self.dir_mtime_ns = os.stat(path).st_mtime_ns
+        self.entries = {}
+        with os.scandir(path) as it:
+            for entry in it:
+                try:
+                    if entry.is_file():
+                        st = entry.stat()
+                        self.entries[entry.name] = (st.st_size, st.st_mtime)
+                except OSError:
+                    continue
+
+    def __len__(self):
+        return len(self.entries)
+
+    def is_current(self):
+        """True if no file has been added, removed or renamed since the scan"""
+        try:
+            return os.stat(self.path).st_mtime_ns == self.dir_mtime_ns
+        except OSError:
+            return False
+
+    def diff(self, newer):
+        """Return (added, changed, removed) names between this snapshot and a newer one"""
+        added = [name for name in newer.entries if name not in self.entries]
+        removed = [name for name in self.entries if name not in newer.entries]
+        changed = [
+            name for name, stat in newer.entries.items()
+            if name in self.entries and self.entries[name] != stat
+        ]
+        return added, changed, removed
+
+
+def get_snapshot(path):
+    """Return a snapshot of path, reusing the cached one while the directory is unchanged
+
+    Appending to an existing file does not change the directory's mtime, so
+    a reused snapshot can have stale sizes for files being written in place.
+    """
+    path = os.path.abspath(path)
+    with _snapshots_lock:
+        snapshot = _snapshots.get(path)
+    if snapshot is not None and snapshot.is_current():
+        return snapshot
+    snapshot = DirectorySnapshot(path)
+    with _snapshots_lock:
+        _snapshots[path] = snapshot
+    return snapshot
@@ -0,0 +1,154 @@
+"""Cached health checks for download directories.
+
+Checking that a directory is usable means creating it if needed and writing
+a test file into it. The Streamlit page renders the path selector on every
+rerun, several times per second while a download runs, so the checks are
+cached per directory: a directory is write-tested once and trusted until the
+entry expires (CHECK_TTL) or a failure invalidates it. A failed check is
+kept only for FAILED_CHECK_TTL, so a directory the user has just mounted or
+fixed is accepted on the next rerun. Free space comes from
+shutil.disk_usage(), which costs no writes and is refreshed separately,
+more often.
+
+check_capacity() is the admission check before a batch starts: it refuses
+a batch whose estimated size does not fit in the directory's free space.
+"""
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+from formatting import format_bytes
+
+CHECK_TTL = 300.0
+# Long enough to absorb a burst of reruns, short enough that fixes show up at once
+FAILED_CHECK_TTL = 2.0
+FREE_SPACE_TTL = 5.0
+# Space kept free on top of a batch's estimated size
+DEFAULT_RESERVE_BYTES = 256 * 1024 * 1024
+
+_default_service = None
+_default_service_lock = threading.Lock()
+
+
+class PathHealth:
+    """Result of checking one directory"""
+    def __init__(self, path, ok, message, free_bytes=None, total_bytes=None):
+        self.path = path
+        self.ok = ok
+        self.message = message
+        self.free_bytes = free_bytes
+        self.total_bytes = total_bytes
+        self.checked_at = time.monotonic()
+        self.space_checked_at = self.checked_at
+
+    def to_dict(self):
+        return {
+            'path': self.path,
+            'ok': self.ok,
+            'message': self.message,
+            'free_bytes': self.free_bytes,
+            'total_bytes': self.total_bytes,
+        }
+
+
+def check_path(path, create=True):
+    """Create (if asked) and write-test a directory; returns a PathHealth"""
+    path = os.path.abspath(os.path.expanduser(path))
+    created = False
+    if not os.path.exists(path):
+        if not create:
+            return PathHealth(path, False, f"❌ Directory does not exist: {path}")
+        try:
+            os.makedirs(path, exist_ok=True)
+            created = True
+        except PermissionError:
+            return PathHealth(path, False, f"❌ Permission denied: Cannot create directory {path}")
+        except OSError as e:
+            return PathHealth(path, False, f"❌ Cannot create directory: {e}")
+
+    if not os.path.isdir(path):
+        return PathHealth(path, False, f"❌ Path is not a directory: {path}")
+
+    # A uniquely named test file, so concurrent sessions do not collide
+    try:
+        with tempfile.NamedTemporaryFile(dir=path, prefix=".ytdl_write_test_", suffix=".tmp") as f:
+            f.write(b"test")
+    except PermissionError:
+        return PathHealth(path, False, f"❌ Permission denied: Cannot write to {path}")
+    except OSError as e:
+        return PathHealth(path, False, f"❌ Cannot write to directory: {e}")
+
+    try:
+        usage = shutil.disk_usage(path)
+    except OSError as e:
+        return PathHealth(path, False, f"❌ Cannot read free space: {e}")
+    message = f"✅ Created directory: {path}" if created else f"✅ Directory is writable: {path}"
+    return PathHealth(path, True, message, usage.free, usage.total)
+
+
+class PathHealthService:
+    """Thread-safe cache of PathHealth results, shared by all sessions of the process"""
+    def __init__(self, ttl=CHECK_TTL, free_space_ttl=FREE_SPACE_TTL, failed_ttl=FAILED_CHECK_TTL):
+        self.ttl = ttl
+        self.failed_ttl = failed_ttl
+        self.free_space_ttl = free_space_ttl
+        self._results = {}
+        self._lock = threading.Lock()
+
+    def check(self, path, create=True):
+        """Return the cached PathHealth for path, write-testing it only when the entry is missing or expired"""
+        path = os.path.abspath(os.path.expanduser(path))
+        now = time.monotonic()
+        with self._lock:
+            health = self._results.get(path)
+        if health is None or now - health.checked_at > (self.ttl if health.ok else self.failed_ttl):
+            health = check_path(path, create)
+            with self._lock:
+                self._results[path] = health
+        elif health.ok and now - health.space_checked_at > self.free_space_ttl:
+            self._refresh_space(health)
+        return health
+
+    def _refresh_space(self, health):
+        try:
+            usage = shutil.disk_usage(health.path)
+        except OSError:
+            self.invalidate(health.path)
+            return
+        health.free_bytes, health.total_bytes = usage.free, usage.total
+        health.space_checked_at = time.monotonic()
+
+    def invalidate(self, path=None):
+        """Forget the result for path (or all paths) so the next check tests it again"""
+        with self._lock:
+            if path is None:
+                self._results.clear()
+            else:
+                self._results.pop(os.path.abspath(os.path.expanduser(path)), None)
+
+    def check_capacity(self, path, needed_bytes, reserve_bytes=DEFAULT_RESERVE_BYTES):
+        """Return (ok, message): whether a batch of needed_bytes fits in path
+
+        Free space is read fresh, since it is about to be consumed.
+        """
+        health = self.check(path)
+        if not health.ok:
+            return False, health.message
+        self._refresh_space(health)
+        if health.free_bytes is None:
+            return True, health.message
+        if needed_bytes and needed_bytes + reserve_bytes > health.free_bytes:
+            return False, (f"❌ Not enough disk space in {health.path}: the batch needs about "
+                           f"{format_bytes(needed_bytes)} but only {format_bytes(health.free_bytes)} is free")
+        return True, f"✅ {format_bytes(health.free_bytes)} free in {health.path}"
+
+
+def get_path_health():
+    """Return the process-wide PathHealthService"""
+    global _default_service
+    with _default_service_lock:
+        if _default_service is None:
+            _default_service = PathHealthService()
+        return _default_service
@@ -0,0 +1,163 @@
+"""Lazy expansion of playlist and channel URLs into single-video URLs.
+
+Handing a channel URL to yt-dlp resolves every video of it before the first
+one is downloaded. expand_url() instead asks yt-dlp for the unprocessed
+playlist result, whose entries are fetched page by page as they are
+iterated, and yields one flat entry (URL, id, title, duration) at a time,
+so each video can be scheduled while later pages are still unknown.
+
+PlaylistFilters applies item ranges and duration/date limits to the flat
+entries, before any video is extracted. Flat entries often lack an upload
+date; those are checked again at download time through match_filter().
+"""
+import itertools
+from datetime import datetime, timezone
+
+import yt_dlp
+
+from download_archive import parse_video_id
+
+# Path fragments of YouTube URLs that name a collection rather than a video
+COLLECTION_PATTERNS = ('youtube.com/playlist', 'youtube.com/channel/', 'youtube.com/c/', 'youtube.com/@', 'youtube.com/user/')
+# Playlists inside playlists (channel tabs) are followed this deep
+MAX_NESTING = 2
+# Collections of one batch expanded at the same time
+DEFAULT_EXPANSION_WORKERS = 2
+
+EXPANSION_YDL_OPTS = {
+    'quiet': True,
+    'no_warnings': True,
+    'skip_download': True,
+    'lazy_playlist': True,
+    'socket_timeout': 15,
+}
+
+
+def is_collection_url(url):
+    """True for playlist and channel URLs that should be expanded lazily"""
+    if parse_video_id(url) is not None:
+        return False
+    lowered = url.lower()
+    return any(pattern in lowered for pattern in COLLECTION_PATTERNS)
+
+
+def _parse_date(value):
+    """'YYYYMMDD' or 'YYYY-MM-DD' -> 'YYYYMMDD', or None"""
+    if not value:
+        return None
+    value = str(value).replace('-', '')
+    datetime.strptime(value, '%Y%m%d')
+    return value
+
+
+def _entry_date(entry):
+    if entry.get('upload_date'):
+        return entry['upload_date']
+    timestamp = entry.get('timestamp') or entry.get('release_timestamp')
+    if timestamp:
+        return datetime.fromtimestamp(timestamp, timezone.utc).strftime('%Y%m%d')
+    return None
+
+
+class PlaylistFilters:
+    """Item range and duration/date limits for expanded entries
+
+    start and end are 1-based positions in each playlist (end inclusive);
+    durations are in seconds; dates are 'YYYYMMDD' strings, both inclusive.
+    """
+    def __init__(self, start=1, end=None, min_duration=None, max_duration=None, date_after=None, date_before=None):
+        self.start = max(1, int(start or 1))
+        self.end = int(end) if end else None
+        self.min_duration = min_duration or None
+        self.max_duration = max_duration or None
+        self.date_after = _parse_date(date_after)
+        self.date_before = _parse_date(date_before)
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**(data or {}))
+
+    def to_dict(self):
+        return {
+            'start': self.start,
+            'end': self.end,
+            'min_duration': self.min_duration,
+            'max_duration': self.max_duration,
+            'date_after': self.date_after,
+            'date_before': self.date_before,
+        }
+
+    @property
+    def has_limits(self):
+        """True if entries are checked for duration or date (the range applies anyway)"""
+        return bool(self.min_duration or self.max_duration or self.date_after or self.date_before)
+
+    def rejects(self, entry):
+        """Return why a (flat or full) entry is filtered out, or None; missing fields pass"""
+        duration = entry.get('duration')
+        if duration is not None:
+            if self.min_duration and duration < self.min_duration:
+                return f"shorter than {self.min_duration}s"
+            if self.max_duration and duration > self.max_duration:
+                return f"longer than {self.max_duration}s"
+        date = _entry_date(entry)
+        if date is not None:
+            if self.date_after and date < self.date_after:
+                return f"uploaded before {self.date_after}"
+            if self.date_before and date > self.date_before:
+                return f"uploaded after {self.date_before}"
+        return None
+
+    def match_filter(self, info, *, incomplete=False):
+        """yt-dlp match_filter checking the limits against fully extracted videos"""
+        reason = self.rejects(info)
+        if reason:
+            return f"{info.get('title') or info.get('id')} is {reason}"
+        return None
+
+
+def _iter_entries(ydl, result, filters, stop_event, depth):
+    entries = result.get('entries') or []
+    for entry in itertools.islice(entries, filters.start - 1, filters.end):
+        if stop_event is not None and stop_event.is_set():
+            return
+        if not entry:
+            continue
+        url = entry.get('url') or entry.get('webpage_url')
+        if not url:
+            continue
+        if entry.get('_type') in ('url', 'url_transparent') and parse_video_id(url) is None and is_collection_url(url):
+            # A playlist of playlists, such as a channel's tabs
+            if depth < MAX_NESTING:
+                nested = ydl.extract_info(url, download=False, process=False)
+                if nested:
+                    yield from _iter_entries(ydl, nested, filters, stop_event, depth + 1)
+            continue
+        if filters.rejects(entry):
+            continue
+        yield {
+            'url': url,
+            'id': entry.get('id'),
+            'title': entry.get('title'),
+            'duration': entry.get('duration'),
+        }
+
+
+def expand_url(url, filters=None, stop_event=None):
+    """Yield flat entries of a playlist or channel lazily, page by page"""
+    filters = filters or PlaylistFilters()
+    with yt_dlp.YoutubeDL(EXPANSION_YDL_OPTS) as ydl:
+        result = ydl.extract_info(url, download=False, process=False)
+        # Channel URLs may first redirect to one of their tabs
+        for _ in range(MAX_NESTING):
+            if not result or result.get('_type') not in ('url', 'url_transparent') or parse_video_id(result.get('url', '')):
+                break
+            result = ydl.extract_info(result['url'], download=False, process=False)
+        if not result:
+            return
+        if result.get('_type') not in ('playlist', 'multi_video'):
+            # Not a collection after all; the URL is downloaded as it is
+            yield {'url': url, 'id': result.get('id'), 'title': result.get('title'), 'duration': result.get('duration')}
+            return
+        yield from _iter_entries(ydl, result, filters, stop_event, 0)
+
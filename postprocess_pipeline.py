@@ -0,0 +1,131 @@
+"""Post-processing (merging, remuxing, fixups) as its own pipeline stage.
+
+yt-dlp runs post-processors inside process_info(), so a download worker
+that has fetched a video's streams sits idle while ffmpeg merges them, and
+the next URL waits for it. DeferredPostProcessingYDL records that work
+instead of running it; PostProcessPipeline runs it afterwards on a separate,
+bounded pool, so the download worker moves on to the next URL while ffmpeg
+works. Each pool worker drives one ffmpeg process at a time, so the pool
+size bounds how many ffmpeg processes run at once. The pipeline takes over
+the YoutubeDL and closes it once its queued work is done, since the
+post-processors still use its options, cookies and network handlers.
+
+The work itself stays a stream copy: format_presets only pairs streams into
+a container that can hold both codecs, and yt-dlp's merger and fixups copy
+streams (``-c copy``) rather than re-encoding them.
+"""
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import yt_dlp
+
+DEFAULT_POSTPROCESS_WORKERS = max(1, min(4, (os.cpu_count() or 2) // 2))
+
+
+class DeferredPostProcessingYDL(yt_dlp.YoutubeDL):
+    """YoutubeDL that queues each video's post-processing instead of running it
+
+    Post hooks are held back as well, since they must see the final file;
+    run_post_processing() runs both for one queued video.
+    """
+    def __init__(self, params=None, auto_init=True):
+        super().__init__(params, auto_init)
+        self.deferred_post_hooks, self._post_hooks = self._post_hooks, []
+        self.pending = []
+
+    def post_process(self, filename, info, files_to_move=None):
+        self.pending.append((filename, info, dict(files_to_move or {})))
+        return info
+
+    def run_post_processing(self, filename, info, files_to_move):
+        """Post-process one video and update its info dict in place"""
+        result = super().post_process(filename, info, files_to_move)
+        if result is not info:
+            info.clear()
+            info.update(result)
+        for hook in self.deferred_post_hooks:
+            hook(info['filepath'])
+
+
+class PostProcessPipeline:
+    """Bounded pool running the post-processing queued by DeferredPostProcessingYDL instances"""
+    def __init__(self, max_workers=DEFAULT_POSTPROCESS_WORKERS):
+        self.max_workers = max(1, int(max_workers))
+        self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="PostProcess")
+        self._cond = threading.Condition()
+        self._active_groups = 0
+        self.videos = 0
+        self.busy_seconds = 0.0
+
+    def submit(self, ydl, on_done=None):
+        """Queue everything ydl deferred; returns the number of videos queued
+
+        on_done(errors) is called on a pool thread once all of them are
+        finished, with the exceptions raised while post-processing (if none
+        were queued it is called right away). ydl belongs to the pipeline
+        from here on and is closed before on_done is called.
+        """
+        tasks, ydl.pending = ydl.pending, []
+        if not tasks:
+            ydl.close()
+            if on_done:
+                on_done([])
+            return 0
+
+        remaining = [len(tasks)]
+        errors = []
+        lock = threading.Lock()
+
+        def run(task):
+            started = time.monotonic()
+            try:
+                ydl.run_post_processing(*task)
+            except Exception as e:
+                with lock:
+                    errors.append(e)
+            finally:
+                with lock:
+                    remaining[0] -= 1
+                    last = remaining[0] == 0
+                with self._cond:
+                    self.videos += 1
+                    self.busy_seconds += time.monotonic() - started
+            if last:
+                try:
+                    try:
+                        ydl.close()
+                    except Exception:
+                        # Saving cookies failed; the videos themselves are done
+                        pass
+                    if on_done:
+                        on_done(errors)
+                finally:
+                    with self._cond:
+                        self._active_groups -= 1
+                        self._cond.notify_all()
+
+        with self._cond:
+            self._active_groups += 1
+        for task in tasks:
+            self._pool.submit(run, task)
+        return len(tasks)
+
+    def pending(self):
+        """Number of submitted groups still being post-processed"""
+        with self._cond:
+            return self._active_groups
+
+    def join(self):
+        """Wait until every submitted group is finished"""
+        with self._cond:
+            while self._active_groups:
+                self._cond.wait()
+
+    def shutdown(self):
+        self._pool.shutdown(wait=True)
+
+    def stats(self):
+        with self._cond:
+            return {'workers': self.max_workers, 'videos': self.videos, 'busy_seconds': round(self.busy_seconds, 2)}
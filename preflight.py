@@ -0,0 +1,246 @@
+"""Pre-flight size estimation and disk-space admission for a batch.
+
+run_preflight() extracts the metadata of every URL on a worker pool
+(through the metadata cache, so the download reuses the extraction) and asks
+format_presets what each preset would fetch. The sum of those sizes is the
+batch estimate shown to the user. A batch runs it next to its downloads and
+hands each item to its DiskAdmission as soon as it is estimated.
+
+DiskAdmission uses the per-URL estimates it has so far to decide, as the
+scheduler picks each job, whether it can start now (a URL not estimated yet
+is admitted as unknown): the bytes it will write plus what the
+running jobs have reserved must fit in the free space (less a reserve) and
+in the batch's quota. A job that would fit once others finish stays queued;
+one that could never fit is rejected instead of filling the disk half-way.
+The scheduler asks with its lock held, so admit() only uses the free space
+read when the admission was made and again each time a job ends.
+
+Only single-video URLs are estimated; playlists and channels count as
+unknown, since resolving them fully is what this stage avoids.
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import yt_dlp
+
+from format_presets import DEFAULT_PRESET, plan_formats, preset_names
+from formatting import format_bytes
+from ffmpeg_toolchain import get_toolchain
+from metadata_cache import cache_key, extract_info_cached
+from path_health import DEFAULT_RESERVE_BYTES, get_path_health
+
+DEFAULT_PREFLIGHT_WORKERS = 8
+# Separate streams and the merged file are on disk together until the merge ends
+MERGE_SPACE_FACTOR = 2
+
+PREFLIGHT_YDL_OPTS = {
+    'quiet': True,
+    'no_warnings': True,
+    'skip_download': True,
+    'noplaylist': True,
+    'socket_timeout': 15,
+}
+
+
+class PreflightItem:
+    """What is known about one URL before downloading it"""
+    def __init__(self, url, info=None, error=None, toolchain=None):
+        self.url = url
+        self.error = error
+        self.plans = {}
+        self.title = self.uploader = self.duration = self.thumbnail = None
+        if info:
+            toolchain = toolchain or get_toolchain()
+            self.title = info.get('title', 'Unknown')
+            self.uploader = info.get('uploader') or info.get('channel') or 'Unknown'
+            self.duration = info.get('duration_string') or '--:--'
+            self.thumbnail = info.get('thumbnail')
+            # What each preset would fetch, so switching presets needs no new extraction
+            self.plans = {
+                name: plan_formats(info, name, toolchain.can_merge, toolchain.merge_containers())
+                for name in preset_names()
+            }
+
+    def estimated_bytes(self, preset=DEFAULT_PRESET):
+        """Size of the preset's formats, or None if unknown"""
+        plan = self.plans.get(preset)
+        return plan['estimated_bytes'] if plan else None
+
+    def peak_bytes(self, preset=DEFAULT_PRESET):
+        """Most disk space the download occupies at once, or None if unknown"""
+        plan = self.plans.get(preset)
+        if not plan or not plan['estimated_bytes']:
+            return None
+        return plan['estimated_bytes'] * (MERGE_SPACE_FACTOR if plan['merge'] else 1)
+
+    def to_preview(self):
+        """Dict shown in the URL list of the Streamlit page"""
+        return {
+            'title': self.title,
+            'uploader': self.uploader,
+            'duration': self.duration,
+            'thumbnail': self.thumbnail,
+            'plans': self.plans,
+        }
+
+
+class BatchEstimate:
+    """Pre-flight results for a batch"""
+    def __init__(self, items, preset=DEFAULT_PRESET):
+        self.items = items
+        self.preset = preset
+
+    @property
+    def total_bytes(self):
+        return sum(item.estimated_bytes(self.preset) or 0 for item in self.items)
+
+    @property
+    def peak_bytes(self):
+        return {item.url: item.peak_bytes(self.preset) for item in self.items}
+
+    @property
+    def unknown(self):
+        return sum(1 for item in self.items if item.estimated_bytes(self.preset) is None)
+
+    def describe(self):
+        text = f"about {format_bytes(self.total_bytes)} for {len(self.items) - self.unknown} video(s)"
+        if self.unknown:
+            text += f", {self.unknown} URL(s) of unknown size"
+        return text
+
+    def to_dict(self):
+        return {
+            'preset': self.preset,
+            'total_bytes': self.total_bytes,
+            'known': len(self.items) - self.unknown,
+            'unknown': self.unknown,
+            'urls': {item.url: item.estimated_bytes(self.preset) for item in self.items},
+        }
+
+
+def preflight_url(url, ydl=None):
+    """Extract (cached) metadata for a single-video URL and return a PreflightItem"""
+    if cache_key(url) is None:
+        return PreflightItem(url)
+    try:
+        if ydl is None:
+            with yt_dlp.YoutubeDL(PREFLIGHT_YDL_OPTS) as ydl:
+                info = extract_info_cached(ydl, url)
+        else:
+            info = extract_info_cached(ydl, url)
+    except Exception as e:
+        return PreflightItem(url, error=str(e))
+    return PreflightItem(url, info)
+
+
+def run_preflight(urls, preset=DEFAULT_PRESET, max_workers=DEFAULT_PREFLIGHT_WORKERS, on_item=None, stop_event=None):
+    """Pre-flight all URLs on a worker pool; returns a BatchEstimate in input order
+
+    on_item(item) is called on a pool thread as each PreflightItem is ready.
+    Once stop_event is set, URLs not started yet are left unknown.
+    """
+    urls = list(dict.fromkeys(urls))
+    if not urls:
+        return BatchEstimate([], preset)
+    local = threading.local()
+    ydls = []
+    ydls_lock = threading.Lock()
+
+    def worker(url):
+        if stop_event is not None and stop_event.is_set():
+            return PreflightItem(url)
+        # One YoutubeDL per pool thread, reused for every URL it handles
+        if not hasattr(local, 'ydl'):
+            local.ydl = yt_dlp.YoutubeDL(PREFLIGHT_YDL_OPTS)
+            with ydls_lock:
+                ydls.append(local.ydl)
+        item = preflight_url(url, local.ydl)
+        if on_item:
+            on_item(item)
+        return item
+
+    try:
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(urls)), thread_name_prefix="Preflight") as pool:
+            items = list(pool.map(worker, urls))
+    finally:
+        for ydl in ydls:
+            ydl.close()
+    return BatchEstimate(items, preset)
+
+
+class DiskAdmission:
+    """Scheduler admission that keeps a batch within free disk space and a quota
+
+    peak_bytes maps URLs to the space their download needs (None or missing
+    for unknown, which is admitted); set_estimate() adds to it while the
+    batch runs. quota_bytes caps what the batch may
+    write in total; None means no quota. measure(job) returns the bytes a
+    finished job actually wrote (its reservation is counted otherwise).
+    on_wait(job, reason) is called the first time a job has to wait.
+    admit() never touches the disk: free space is read by refresh(), on
+    creation and from release().
+    """
+    def __init__(self, path, peak_bytes, quota_bytes=None, reserve_bytes=DEFAULT_RESERVE_BYTES, measure=None, on_wait=None):
+        self.path = path
+        self.peak_bytes = dict(peak_bytes)
+        self.quota_bytes = quota_bytes or None
+        self.reserve_bytes = reserve_bytes
+        self.measure = measure
+        self.on_wait = on_wait
+        self.reserved = {}
+        self.used_bytes = 0
+        self._waiting = set()
+        self._lock = threading.Lock()
+        self.free_bytes = None
+        self.refresh()
+
+    def refresh(self):
+        """Read the directory's free space (through path_health's cache); may block on a slow disk"""
+        health = get_path_health().check(self.path)
+        with self._lock:
+            self.free_bytes = health.free_bytes
+
+    def set_estimate(self, url, peak_bytes):
+        """Record the space url needs, for jobs not admitted yet"""
+        with self._lock:
+            self.peak_bytes[url] = peak_bytes
+
+    def admit(self, job):
+        needed = self.peak_bytes.get(job.url) or 0
+        with self._lock:
+            in_flight = sum(self.reserved.values())
+            if self.quota_bytes is not None and self.used_bytes + in_flight + needed > self.quota_bytes:
+                if self.used_bytes + needed > self.quota_bytes:
+                    job.error = (f"Batch quota of {format_bytes(self.quota_bytes)} reached "
+                                 f"({format_bytes(self.used_bytes)} used, needs {format_bytes(needed)})")
+                    return 'reject'
+                return self._wait(job, "waiting for running downloads to stay within the batch quota")
+            if needed and self.free_bytes is not None:
+                available = self.free_bytes - self.reserve_bytes
+                if needed > available:
+                    if not in_flight:
+                        job.error = (f"Not enough disk space: needs about {format_bytes(needed)}, "
+                                     f"{format_bytes(max(available, 0))} available in {self.path}")
+                        return 'reject'
+                    return self._wait(job, "waiting for disk space held by running downloads")
+                if needed + in_flight > available:
+                    return self._wait(job, "waiting for disk space held by running downloads")
+            self.reserved[job.job_id] = needed
+            self._waiting.discard(job.job_id)
+            return 'admit'
+
+    def _wait(self, job, reason):
+        # Called with the lock held
+        if job.job_id not in self._waiting:
+            self._waiting.add(job.job_id)
+            if self.on_wait:
+                self.on_wait(job, reason)
+        return 'wait'
+
+    def release(self, job):
+        """Drop a job's reservation, count what it wrote against the quota and read the free space again"""
+        used = self.measure(job) if self.measure else None
+        with self._lock:
+            reserved = self.reserved.pop(job.job_id, 0)
+            self.used_bytes += reserved if used is None else used
+        self.refresh()
@@ -0,0 +1,120 @@
+"""Coalescing, rate-limited pipeline for yt-dlp progress hook events.
+
+yt-dlp calls progress hooks for every chunk it writes, which at high speeds
+is far more often than any UI can redraw. ProgressCoalescer sits between the
+hooks and the UI channel: per file it forwards at most ``max_rate`` events
+per second, always the newest one, and passes state changes (finished,
+error, ...) straight through. An event that arrives too soon is held back
+and sent when the file's interval ends unless a newer one replaces it, so
+the last update before a stall is never lost.
+"""
+import threading
+import time
+
+DEFAULT_MAX_RATE = 4.0
+
+
+class ProgressCoalescer:
+    """Forward the latest progress event per file at a bounded rate.
+
+    ``emit(job_id, d)`` delivers an event downstream. Held events are sent
+    by a background thread; close() sends what is still held and stops it.
+    With ``full_fidelity`` every event is forwarded, which is meant for
+    debugging.
+    """
+    def __init__(self, emit, max_rate=DEFAULT_MAX_RATE, full_fidelity=False):
+        self.emit = emit
+        self.min_interval = 1.0 / max_rate if max_rate and max_rate > 0 else 0.0
+        self.full_fidelity = full_fidelity
+        self._last_emit = {}
+        # key -> (due, job_id, d): the newest event of a file waiting for its interval to end
+        self._pending = {}
+        # Events are emitted with the lock held, so a held event can never
+        # overtake the state change that superseded it
+        self._cond = threading.Condition()
+        self._flusher = None
+        self._closed = False
+        self.received = 0
+        self.emitted = 0
+        self.coalesced = 0
+
+    def __call__(self, d, job_id=None):
+        self.push(job_id, d)
+
+    def push(self, job_id, d):
+        """Offer one hook event; returns True if it was forwarded at once"""
+        key = (job_id, d.get('filename') or d.get('tmpfilename'))
+        now = time.monotonic()
+        with self._cond:
+            self.received += 1
+            if d.get('status') == 'downloading' and not self.full_fidelity and not self._closed:
+                due = self._last_emit.get(key, float('-inf')) + self.min_interval
+                if now < due:
+                    # Sent when the interval ends, unless a newer event replaces it first
+                    if key in self._pending:
+                        self.coalesced += 1
+                    self._pending[key] = (due, job_id, d)
+                    self._start_flusher()
+                    self._cond.notify()
+                    return False
+                self._last_emit[key] = now
+            else:
+                # State changes always go through, supersede a held event and reset the file's clock
+                self._last_emit.pop(key, None)
+            if self._pending.pop(key, None) is not None:
+                self.coalesced += 1
+            self._emit(job_id, d)
+        return True
+
+    def close(self):
+        """Send every held event now and stop the background thread"""
+        with self._cond:
+            self._closed = True
+            for job_id, d in [entry[1:] for entry in self._pending.values()]:
+                self._emit(job_id, d)
+            self._pending.clear()
+            self._cond.notify()
+            flusher = self._flusher
+        if flusher is not None:
+            flusher.join()
+
+    def _emit(self, job_id, d):
+        # Called with the lock held
+        try:
+            self.emit(job_id, d)
+        except Exception:
+            return
+        self.emitted += 1
+
+    def _start_flusher(self):
+        # Called with the lock held
+        if self._flusher is None:
+            self._flusher = threading.Thread(target=self._flush_loop, daemon=True, name="ProgressFlush")
+            self._flusher.start()
+
+    def _flush_loop(self):
+        with self._cond:
+            while not self._closed:
+                if not self._pending:
+                    self._cond.wait()
+                    continue
+                now = time.monotonic()
+                next_due = None
+                for key, (due, job_id, d) in list(self._pending.items()):
+                    if due <= now:
+                        del self._pending[key]
+                        self._last_emit[key] = now
+                        self._emit(job_id, d)
+                    elif next_due is None or due < next_due:
+                        next_due = due
+                if next_due is not None:
+                    self._cond.wait(next_due - now)
+
+    def stats(self):
+        """Return the event counters as a dict"""
+        with self._cond:
+            return {
+                'received': self.received,
+                'emitted': self.emitted,
+                'coalesced': self.coalesced,
+            }
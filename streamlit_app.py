@@ -1,29 +1,58 @@
 import streamlit as st
 import os
-import time
-import yt_dlp
-import stat
-import sys
-from pathlib import Path
+import re
 import tempfile
 import zipfile
-from io import BytesIO
-import json
 from datetime import datetime
-import queue
-import threading
-import hashlib
-import subprocess
-
-# Global queue for thread-safe communication
-PROGRESS_QUEUE = queue.Queue()
-# Global flag to stop downloads
-STOP_DOWNLOAD = threading.Event()
-# Global debug list (thread-safe)
-DEBUG_INFO = []
-DEBUG_LOCK = threading.Lock()
-# File-based completion flag
-COMPLETION_FLAG_FILE = "/tmp/streamlit_download_complete.flag"
+from collections import deque
+from download_scheduler import DEFAULT_MAX_CONCURRENT, DEFAULT_PER_HOST_LIMIT
+from metadata_cache import cache_key
+from job_manager import new_session_id
+from download_engine import DownloadEngine
+from formatting import format_bytes
+from path_health import get_path_health
+from preflight import run_preflight
+from job_daemon import JobDaemonClient, DaemonUnavailable, ensure_daemon, event_to_message, TERMINAL_STATUSES
+from debug_log import LogRecord
+from batch_journal import get_default_journal
+from content_index import DEFAULT_DEDUPE_MODE
+from throughput_profiles import DEFAULT_PROFILE, profile_label, profile_names
+from format_presets import DEFAULT_PRESET, preset_label, preset_names
+from url_canonical import dedupe_urls, split_urls
+from bandwidth_governor import BANDWIDTH_LIMIT_ENV, get_default_governor
+
+@st.cache_resource
+def get_engine():
+    """Download engine and its job registry, shared by every session and every rerun
+    
+    Streamlit re-executes this script on each rerun, so plain module globals
+    would be recreated and a running download would talk to a dead queue.
+    Each job carries its own progress queue, cancel token and debug log, so
+    sessions never see or stop each other's downloads.
+    """
+    return DownloadEngine()
+
+ENGINE = get_engine()
+JOB_MANAGER = ENGINE.job_manager
+# Number of debug lines shown in the sidebar
+DEBUG_VIEW_LINES = 50
+# Seconds between refreshes of the progress panels while downloading
+PROGRESS_REFRESH_INTERVAL = 0.5
+# ZIP export: media is already compressed, so it is stored rather than deflated
+ZIP_STORED_EXTENSIONS = {'.mp4', '.m4a', '.m4v', '.webm', '.mkv', '.mov', '.mp3', '.opus', '.ogg', '.aac', '.flac', '.jpg', '.jpeg', '.png', '.webp'}
+ZIP_CHUNK_SIZE = 1024 * 1024
+# Above this total size the ZIP is written to disk instead of served through the browser
+ZIP_INLINE_LIMIT = 1024 * 1024 * 1024
+# Streamlit holds a served download in memory, so larger exports are split
+# into ZIP parts of at most this size (a single bigger file gets a part of its own)
+ZIP_PART_MAX_SIZE = 200 * 1024 * 1024
+# Sidebar choices for handling downloads whose content is already on disk
+DEDUPE_MODE_LABELS = {
+    'hardlink': "🔗 Replace with a hardlink",
+    'delete': "🗑️ Delete the new copy",
+    'report': "📝 Only report",
+    None: "🚫 Don't check",
+}
 
 # Initialize session state
 if 'download_status' not in st.session_state:
@@ -34,8 +63,8 @@ if 'download_complete' not in st.session_state:
     st.session_state.download_complete = False
 if 'downloaded_files' not in st.session_state:
     st.session_state.downloaded_files = []
-if 'current_download' not in st.session_state:
-    st.session_state.current_download = {}
+if 'active_downloads' not in st.session_state:
+    st.session_state.active_downloads = {}
 if 'download_progress' not in st.session_state:
     st.session_state.download_progress = {}
 if 'total_videos' not in st.session_state:
@@ -44,37 +73,71 @@ if 'completed_videos' not in st.session_state:
     st.session_state.completed_videos = 0
 if 'last_update' not in st.session_state:
     st.session_state.last_update = None
+if 'session_id' not in st.session_state:
+    st.session_state.session_id = new_session_id()
+if 'client_id' not in st.session_state:
+    # Journaled batches belong to the browser that started them. Its id lives in
+    # the page URL, so it survives reloads and server restarts but is not shared
+    client_id = st.query_params.get('client', '')
+    st.session_state.client_id = client_id if re.fullmatch(r'[0-9a-f]{32}', client_id) else new_session_id()
+if st.query_params.get('client') != st.session_state.client_id:
+    st.query_params['client'] = st.session_state.client_id
+if 'job_id' not in st.session_state:
+    st.session_state.job_id = None
+if 'daemon_job_id' not in st.session_state:
+    st.session_state.daemon_job_id = None
+if 'daemon_cursor' not in st.session_state:
+    st.session_state.daemon_cursor = 0
+if 'url_previews' not in st.session_state:
+    st.session_state.url_previews = {}
+if 'debug_cursor' not in st.session_state:
+    st.session_state.debug_cursor = 0
+if 'debug_lines' not in st.session_state:
+    st.session_state.debug_lines = deque(maxlen=DEBUG_VIEW_LINES)
 
-def add_debug_info(message):
-    """Add debug information with timestamp - thread safe"""
-    timestamp = datetime.now().strftime("%H:%M:%S.%f")[:-3]
-    debug_msg = f"[{timestamp}] DEBUG: {message}"
-    
-    # Thread-safe debug logging
-    with DEBUG_LOCK:
-        DEBUG_INFO.append(debug_msg)
-        # Keep only last 100 debug messages to prevent memory issues
-        if len(DEBUG_INFO) > 100:
-            DEBUG_INFO.pop(0)
-    
-    # Send to queue for UI update
-    try:
-        PROGRESS_QUEUE.put(('debug', debug_msg), block=False)
-    except:
-        pass
+def batch_owner():
+    """Journal owner of the batches this browser starts"""
+    return f"app:{st.session_state.client_id}"
+
+def get_session_job():
+    """Return the job of the current session, if it still exists"""
+    if st.session_state.job_id is None:
+        return None
+    return JOB_MANAGER.get(st.session_state.job_id)
+
+def add_debug_info(message, level='DEBUG', source='app'):
+    """Add a structured debug record to the current session's job - UI thread only
     
-    # Also print to console
-    print(debug_msg)
+    Download threads log through their own job with job.debug().
+    """
+    job = get_session_job()
+    if job is not None:
+        job.debug(message, level, source)
+    else:
+        # Also print to console
+        print(f"{level} {source}: {message}")
 
-def get_debug_info():
-    """Get debug information thread-safely"""
-    with DEBUG_LOCK:
-        return DEBUG_INFO.copy()
+def get_new_debug_info():
+    """Return formatted debug lines logged since this session last looked"""
+    job = get_session_job()
+    if job is not None:
+        records, st.session_state.debug_cursor = job.log.read_since(st.session_state.debug_cursor)
+        st.session_state.debug_lines.extend(record.format() for record in records)
+    elif st.session_state.daemon_job_id:
+        try:
+            response = JobDaemonClient().get_log(st.session_state.daemon_job_id, st.session_state.debug_cursor)
+        except DaemonUnavailable:
+            return st.session_state.debug_lines
+        st.session_state.debug_cursor = response['cursor']
+        st.session_state.debug_lines.extend(LogRecord(**record).format() for record in response['records'])
+    return st.session_state.debug_lines
 
 def clear_debug_info():
     """Clear debug information thread-safely"""
-    with DEBUG_LOCK:
-        DEBUG_INFO.clear()
+    job = get_session_job()
+    if job is not None:
+        job.log.clear()
+    st.session_state.debug_lines.clear()
 
 def add_status_message(message):
     """Add a timestamped status message"""
@@ -83,465 +146,347 @@ def add_status_message(message):
     st.session_state.download_status.append(full_message)
     st.session_state.last_update = datetime.now()
 
-def monitor_file_changes(download_path, filename_pattern=None):
-    """Monitor file changes in download directory"""
-    try:
-        files_before = set(os.listdir(download_path))
-        add_debug_info(f"Files in directory before: {len(files_before)} files")
-        
-        for f in files_before:
-            path = os.path.join(download_path, f)
-            if os.path.isfile(path):
-                size = os.path.getsize(path)
-                add_debug_info(f"Existing file: {f} ({size} bytes)")
-        
-        return files_before
-    except Exception as e:
-        add_debug_info(f"Error monitoring directory: {e}")
-        return set()
-
-def check_file_integrity(filepath):
-    """Check if a file appears to be a valid video"""
-    try:
-        if not os.path.exists(filepath):
-            return False, "File does not exist"
-        
-        size = os.path.getsize(filepath)
-        if size < 1024:
-            return False, f"File too small: {size} bytes"
-        
-        # Check file header for common video formats
-        with open(filepath, 'rb') as f:
-            header = f.read(12)
-            
-        # MP4 file signature check
-        if b'ftyp' in header:
-            return True, f"Valid MP4 file ({size} bytes)"
-        elif header.startswith(b'\x00\x00\x00'):
-            return True, f"Possible MP4 file ({size} bytes)"
-        else:
-            return False, f"Unknown format, header: {header.hex()}"
-            
-    except Exception as e:
-        return False, f"Error checking file: {e}"
-
-class StreamlitLogger:
-    """Logger for yt-dlp that works with Streamlit"""
-    def debug(self, msg):
-        if not msg.startswith('[debug] '):
-            msg = f"[debug] {msg.strip()}"
-        add_debug_info(f"yt-dlp: {msg}")
-        try:
-            PROGRESS_QUEUE.put(('log', msg), block=False)
-        except:
-            pass
-
-    def info(self, msg):
-        add_debug_info(f"yt-dlp INFO: {msg.strip()}")
-        try:
-            PROGRESS_QUEUE.put(('log', f"ℹ️ {msg.strip()}"), block=False)
-        except:
-            pass
-
-    def warning(self, msg):
-        add_debug_info(f"yt-dlp WARNING: {msg.strip()}")
-        try:
-            PROGRESS_QUEUE.put(('log', f"⚠️ WARNING: {msg.strip()}"), block=False)
-        except:
-            pass
-
-    def error(self, msg):
-        add_debug_info(f"yt-dlp ERROR: {msg.strip()}")
-        try:
-            PROGRESS_QUEUE.put(('log', f"❌ ERROR: {msg.strip()}"), block=False)
-        except:
-            pass
+def process_progress_queue(session_job):
+    """Process messages from the background download workers of this session's job"""
+    return process_progress_messages(session_job.drain())
 
-def ytdlp_progress_hook(d):
-    """Enhanced progress hook for yt-dlp downloads with detailed debugging"""
-    try:
-        add_debug_info(f"Progress hook called with status: {d.get('status', 'unknown')}")
-        add_debug_info(f"Progress data keys: {list(d.keys())}")
-        
-        # Log all progress data for debugging
-        for key, value in d.items():
-            if key not in ['info_dict']:  # Skip large nested data
-                add_debug_info(f"Progress {key}: {value}")
-        
-        # Put progress data in queue for main thread to process
-        PROGRESS_QUEUE.put(('progress', d), block=False)
-    except Exception as e:
-        add_debug_info(f"Progress hook error: {e}")
-        print(f"Progress hook error: {e}")
+def process_progress_messages(messages):
+    """Apply job messages to the session state
 
-def process_progress_queue():
-    """Process messages from the background download thread"""
-    processed_any = False
+    The messages come either from an in-app job's queue or from the events
+    of a job running in the background daemon.
+    """
+    processed_any = bool(messages)
     completion_detected = False
-    
-    while True:
+
+    for item in messages:
         try:
-            item = PROGRESS_QUEUE.get_nowait()
-            processed_any = True
-            
-            if isinstance(item, tuple) and len(item) == 2:
+            # Job-scoped messages carry the job id as the middle element
+            if isinstance(item, tuple) and len(item) == 3:
+                msg_type, job_id, data = item
+            elif isinstance(item, tuple) and len(item) == 2:
                 msg_type, data = item
+                job_id = None
+            else:
+                continue
                 
-                if msg_type == 'log':
-                    timestamp = datetime.now().strftime("%H:%M:%S")
-                    st.session_state.download_status.append(f"[{timestamp}] {data}")
-                    st.session_state.last_update = datetime.now()
+            if msg_type == 'log':
+                timestamp = datetime.now().strftime("%H:%M:%S")
+                st.session_state.download_status.append(f"[{timestamp}] {data}")
+                st.session_state.last_update = datetime.now()
+            
+            elif msg_type == 'complete':
+                # Handle download completion
+                add_debug_info("Completion signal received from download thread")
+                completion_detected = True
+                st.session_state.is_downloading = False
+                st.session_state.download_complete = True
+                st.session_state.active_downloads = {}
                 
-                elif msg_type == 'complete':
-                    # Handle download completion
-                    add_debug_info("Completion signal received from download thread")
-                    print("🎉 COMPLETION SIGNAL RECEIVED - Setting completion flags")
-                    completion_detected = True
-                    st.session_state.is_downloading = False
-                    st.session_state.download_complete = True
-                    st.session_state.current_download = {}
-                    STOP_DOWNLOAD.clear()  # Reset stop flag
+                # Final status message
+                timestamp = datetime.now().strftime("%H:%M:%S")
+                st.session_state.download_status.append(f"[{timestamp}] 🎉 **DOWNLOAD SESSION COMPLETED**")
+                st.session_state.last_update = datetime.now()
+            
+            elif msg_type == 'job':
+                # Scheduler lifecycle events: started / finished / failed / cancelled
+                status = data.get('status')
+                if status == 'started':
+                    st.session_state.active_downloads[job_id] = {
+                        'filename': data.get('url', 'Unknown'),
+                        'status': 'preparing'
+                    }
+                elif status in ('finished', 'failed', 'cancelled'):
+                    st.session_state.active_downloads.pop(job_id, None)
+                    if status == 'finished':
+                        st.session_state.completed_videos += 1
+                st.session_state.last_update = datetime.now()
+            
+            elif msg_type == 'progress_stats':
+                st.session_state.progress_stats = data
+            
+            elif msg_type == 'output':
+                # Final file of a video, reported once merging and post-processing are done
+                if data not in st.session_state.downloaded_files:
+                    st.session_state.downloaded_files.append(data)
+            
+            elif msg_type == 'validation':
+                # Structural check of every output file, keyed by path
+                st.session_state.validation_results = {result['path']: result for result in data}
+            
+            elif msg_type == 'throughput':
+                st.session_state.throughput = data
+            
+            elif msg_type == 'bandwidth':
+                # Bandwidth shares, reported as downloads start and finish
+                st.session_state.bandwidth = data
+            
+            elif msg_type == 'estimate':
+                # Pre-flight size of the batch
+                st.session_state.batch_estimate = data
+            
+            elif msg_type == 'expanded':
+                # A playlist or channel was paged through; its entries are now counted
+                st.session_state.total_videos = data['total']
+            
+            elif msg_type == 'dedupe':
+                # Deleted duplicates are replaced by the file that holds the same content
+                st.session_state.dedupe_stats = data
+                replaced = {d['path']: d['original'] for d in data['duplicates'] if d['action'] == 'deleted'}
+                st.session_state.downloaded_files = list(dict.fromkeys(
+                    replaced.get(path, path) for path in st.session_state.downloaded_files
+                ))
+            
+            elif msg_type == 'skipped':
+                # Video already in the download archive - reuse the existing file
+                filename = os.path.basename(data)
+                st.session_state.downloaded_files.append(data)
+                st.session_state.download_progress[filename] = {
+                    'percent': 100,
+                    'status': 'completed'
+                }
+                timestamp = datetime.now().strftime("%H:%M:%S")
+                st.session_state.download_status.append(f"[{timestamp}] ⏭️ Already downloaded: {filename}")
+                st.session_state.last_update = datetime.now()
+            
+            elif msg_type == 'progress':
+                d = data
+                if d.get('status') == 'downloading':
+                    # Extract progress information
+                    filename = d.get('filename') or d.get('info_dict', {}).get('title', 'Unknown')
+                    filename = os.path.basename(filename)
                     
-                    # Final status message
-                    timestamp = datetime.now().strftime("%H:%M:%S")
-                    st.session_state.download_status.append(f"[{timestamp}] 🎉 **DOWNLOAD SESSION COMPLETED**")
-                    st.session_state.last_update = datetime.now()
+                    # Get progress metrics
+                    downloaded_bytes = d.get('downloaded_bytes', 0)
+                    total_bytes = d.get('total_bytes') or d.get('total_bytes_estimate', 0)
+                    speed = d.get('speed', 0)
+                    eta = d.get('eta', 0)
                     
-                    # Force immediate UI refresh
-                    print(f"🎉 UI STATE: is_downloading={st.session_state.is_downloading}, download_complete={st.session_state.download_complete}")
-                
-                elif msg_type == 'progress':
-                    d = data
-                    if d.get('status') == 'downloading':
-                        # Extract progress information
-                        filename = d.get('filename') or d.get('info_dict', {}).get('title', 'Unknown')
-                        filename = os.path.basename(filename)
-                        
-                        # Get progress metrics
-                        downloaded_bytes = d.get('downloaded_bytes', 0)
-                        total_bytes = d.get('total_bytes') or d.get('total_bytes_estimate', 0)
-                        speed = d.get('speed', 0)
-                        eta = d.get('eta', 0)
-                        
-                        # Calculate percentage
-                        if total_bytes > 0:
-                            percent = (downloaded_bytes / total_bytes) * 100
-                        else:
-                            percent = 0
-                        
-                        # Format file sizes
-                        def format_bytes(bytes_val):
-                            if bytes_val is None or bytes_val == 0:
-                                return "0 B"
-                            for unit in ['B', 'KB', 'MB', 'GB']:
-                                if bytes_val < 1024.0:
-                                    return f"{bytes_val:.1f} {unit}"
-                                bytes_val /= 1024.0
-                            return f"{bytes_val:.1f} TB"
-                        
-                        # Format speed
-                        speed_str = format_bytes(speed) + "/s" if speed else "0 B/s"
-                        
-                        # Format ETA
-                        if eta:
-                            eta_str = f"{eta//60:02d}:{eta%60:02d}"
-                        else:
-                            eta_str = "--:--"
-                        
-                        # Update session state with current download info
-                        st.session_state.current_download = {
-                            'filename': filename,
-                            'percent': percent,
-                            'downloaded': format_bytes(downloaded_bytes),
-                            'total': format_bytes(total_bytes),
-                            'speed': speed_str,
-                            'eta': eta_str,
-                            'status': 'downloading',
-                            'last_update': datetime.now()
-                        }
-                        
-                        # Store progress for this specific file
-                        st.session_state.download_progress[filename] = {
-                            'percent': percent,
-                            'downloaded': downloaded_bytes,
-                            'total': total_bytes,
-                            'speed': speed,
-                            'status': 'downloading'
-                        }
-                        
-                        st.session_state.last_update = datetime.now()
-                        
-                        # Add periodic progress messages (every 5%)
-                        if percent > 0 and int(percent) % 5 == 0 and int(percent) != getattr(st.session_state, 'last_percent', -1):
-                            st.session_state.last_percent = int(percent)
-                            timestamp = datetime.now().strftime("%H:%M:%S")
-                            st.session_state.download_status.append(f"[{timestamp}] 🔄 {filename}: {percent:.1f}% ({format_bytes(downloaded_bytes)}/{format_bytes(total_bytes)}) at {speed_str}")
+                    # Calculate percentage
+                    if total_bytes > 0:
+                        percent = (downloaded_bytes / total_bytes) * 100
+                    else:
+                        percent = 0
                     
-                    elif d.get('status') == 'finished':
-                        filename = d.get('filename') or d.get('info_dict', {}).get('title', 'Unknown')
-                        full_filename = filename
-                        filename = os.path.basename(filename)
-                        
-                        # Update progress
-                        st.session_state.download_progress[filename] = {
-                            'percent': 100,
-                            'status': 'completed'
-                        }
-                        
-                        # Add to completed files
-                        st.session_state.downloaded_files.append(full_filename)
-                        st.session_state.completed_videos += 1
-                        
-                        # Update current download status
-                        st.session_state.current_download = {
-                            'filename': filename,
-                            'percent': 100,
-                            'status': 'completed'
-                        }
-                        
-                        # Log completion
-                        timestamp = datetime.now().strftime("%H:%M:%S")
-                        st.session_state.download_status.append(f"[{timestamp}] ✅ Completed: {filename}")
-                        st.session_state.last_update = datetime.now()
+                    # Format speed
+                    speed_str = format_bytes(speed) + "/s" if speed else "0 B/s"
                     
-                    elif d.get('status') == 'preparing':
-                        filename = d.get('filename') or d.get('info_dict', {}).get('title', 'Unknown')
-                        filename = os.path.basename(filename)
-                        
-                        st.session_state.current_download = {
-                            'filename': filename,
-                            'status': 'preparing'
-                        }
-                        
-                        timestamp = datetime.now().strftime("%H:%M:%S")
-                        st.session_state.download_status.append(f"[{timestamp}] 🔄 Preparing: {filename}")
-                        st.session_state.last_update = datetime.now()
-                
-                elif msg_type == 'debug':
-                    # Debug messages are already handled by add_debug_info
-                    pass
-                
-        except queue.Empty:
-            break
-        except Exception as e:
-            add_debug_info(f"Error processing queue: {e}")
-            break
-    
-    return processed_any, completion_detected
-
-def setup_ffmpeg():
-    """Setup ffmpeg path if bundled"""
-    ffmpeg_executable_path = None
-    
-    if getattr(sys, 'frozen', False):
-        # Running as PyInstaller bundle
-        bundle_dir = sys._MEIPASS
-        
-        # Platform-specific ffmpeg naming
-        if sys.platform == "win32":
-            ffmpeg_name = "ffmpeg.exe"
-            ffprobe_name = "ffprobe.exe"
-        else:
-            ffmpeg_name = "ffmpeg"
-            ffprobe_name = "ffprobe"
-
-        potential_ffmpeg_path = os.path.join(bundle_dir, ffmpeg_name)
-        potential_ffprobe_path = os.path.join(bundle_dir, ffprobe_name)
-
-        if os.path.exists(potential_ffmpeg_path):
-            try:
-                current_mode = os.stat(potential_ffmpeg_path).st_mode
-                if not (current_mode & stat.S_IXUSR):
-                    os.chmod(potential_ffmpeg_path, current_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
-                ffmpeg_executable_path = potential_ffmpeg_path
-            except Exception as e:
-                st.session_state.download_status.append(f"ERROR: Could not set permissions for {ffmpeg_name}: {e}")
-    
-    return ffmpeg_executable_path
-
-def download_videos(urls, download_path):
-    """Download videos using yt-dlp with extensive debugging - NO SESSION STATE ACCESS"""
-    try:
-        add_debug_info(f"Starting download_videos function")
-        add_debug_info(f"URLs to download: {urls}")
-        add_debug_info(f"Download path: {download_path}")
-        
-        # Monitor initial directory state
-        initial_files = monitor_file_changes(download_path)
-        
-        # Simple yt-dlp configuration for debugging
-        ydl_opts = {
-            'format': 'best[height<=480]/best',  # Very conservative for testing
-            'merge_output_format': 'mp4',
-            'outtmpl': os.path.join(download_path, '%(title)s.%(ext)s'),
-            'logger': StreamlitLogger(),
-            'progress_hooks': [ytdlp_progress_hook],
-            'ignoreerrors': True,
-            'retries': 1,  # Only 1 retry for faster debugging
-            'socket_timeout': 15,  # Shorter timeout
-            'noplaylist': False,
-            'extract_flat': False,
-            'continue_dl': True,
-            'overwrites': False,
-            'verbose': True,
-            'quiet': False,
-            'no_warnings': False,
-        }
-        
-        add_debug_info(f"yt-dlp options configured")
-        
-        # Setup ffmpeg
-        ffmpeg_executable_path = setup_ffmpeg()
-        if ffmpeg_executable_path:
-            ydl_opts['ffmpeg_location'] = ffmpeg_executable_path
-            add_debug_info(f"ffmpeg configured at: {ffmpeg_executable_path}")
-            PROGRESS_QUEUE.put(('log', f"🔧 Using ffmpeg: {ffmpeg_executable_path}"), block=False)
-        else:
-            add_debug_info("ffmpeg not found")
-            PROGRESS_QUEUE.put(('log', f"⚠️ Warning: ffmpeg not found"), block=False)
-        
-        PROGRESS_QUEUE.put(('log', f"🚀 **Starting download of {len(urls)} video(s)**"), block=False)
-        
-        # Create yt-dlp instance
-        add_debug_info("Creating yt-dlp instance")
-        
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            add_debug_info("yt-dlp instance created successfully")
-            
-            for i, url_to_download in enumerate(urls):
-                if STOP_DOWNLOAD.is_set():
-                    add_debug_info("Download stopped by user")
-                    break
+                    # Format ETA
+                    if eta:
+                        eta_str = f"{eta//60:02d}:{eta%60:02d}"
+                    else:
+                        eta_str = "--:--"
+                    
+                    # Update session state with this job's download info
+                    st.session_state.active_downloads[job_id] = {
+                        'filename': filename,
+                        'percent': percent,
+                        'downloaded': format_bytes(downloaded_bytes),
+                        'total': format_bytes(total_bytes),
+                        'speed': speed_str,
+                        'eta': eta_str,
+                        'status': 'downloading',
+                        'last_update': datetime.now()
+                    }
                     
-                add_debug_info(f"Processing URL {i+1}/{len(urls)}: {url_to_download}")
-                PROGRESS_QUEUE.put(('log', f"📺 **Video {i+1}/{len(urls)}**: Starting {url_to_download}"), block=False)
+                    # Store progress for this specific file
+                    st.session_state.download_progress[filename] = {
+                        'percent': percent,
+                        'downloaded': downloaded_bytes,
+                        'total': total_bytes,
+                        'speed': speed,
+                        'status': 'downloading'
+                    }
+                    
+                    st.session_state.last_update = datetime.now()
+                    
+                    # Add periodic progress messages (every 5%), tracked per file
+                    last_percents = st.session_state.setdefault('last_percent', {})
+                    if percent > 0 and int(percent) % 5 == 0 and int(percent) != last_percents.get(filename, -1):
+                        last_percents[filename] = int(percent)
+                        timestamp = datetime.now().strftime("%H:%M:%S")
+                        st.session_state.download_status.append(f"[{timestamp}] 🔄 {filename}: {percent:.1f}% ({format_bytes(downloaded_bytes)}/{format_bytes(total_bytes)}) at {speed_str}")
                 
-                try:
-                    add_debug_info("Starting yt-dlp.download()")
-                    download_start_time = datetime.now()
+                elif d.get('status') == 'finished':
+                    filename = d.get('filename') or d.get('info_dict', {}).get('title', 'Unknown')
+                    filename = os.path.basename(filename)
                     
-                    # Try download with timeout mechanism
-                    ydl.download([url_to_download])
+                    # Update progress
+                    st.session_state.download_progress[filename] = {
+                        'percent': 100,
+                        'status': 'completed'
+                    }
                     
-                    download_end_time = datetime.now()
-                    download_duration = (download_end_time - download_start_time).total_seconds()
-                    add_debug_info(f"Download completed in {download_duration:.2f} seconds")
+                    # Update this job's download status
+                    st.session_state.active_downloads[job_id] = {
+                        'filename': filename,
+                        'percent': 100,
+                        'status': 'completed'
+                    }
                     
-                    PROGRESS_QUEUE.put(('log', f"✅ Completed: {url_to_download}"), block=False)
+                    # Log completion
+                    timestamp = datetime.now().strftime("%H:%M:%S")
+                    st.session_state.download_status.append(f"[{timestamp}] ✅ Completed: {filename}")
+                    st.session_state.last_update = datetime.now()
+                
+                elif d.get('status') == 'preparing':
+                    filename = d.get('filename') or d.get('info_dict', {}).get('title', 'Unknown')
+                    filename = os.path.basename(filename)
                     
-                except yt_dlp.utils.DownloadError as e:
-                    error_msg = str(e)
-                    add_debug_info(f"yt-dlp DownloadError: {error_msg}")
-                    PROGRESS_QUEUE.put(('log', f"❌ Download error: {error_msg}"), block=False)
+                    st.session_state.active_downloads[job_id] = {
+                        'filename': filename,
+                        'status': 'preparing'
+                    }
                     
-                except Exception as e:
-                    add_debug_info(f"Unexpected error during download: {str(e)}")
-                    PROGRESS_QUEUE.put(('log', f"❌ Unexpected error: {str(e)}"), block=False)
-        
-        # Final file analysis
-        add_debug_info("Performing final file analysis...")
-        try:
-            final_files = set(os.listdir(download_path))
-            all_new_files = final_files - initial_files
-            add_debug_info(f"All files created during session: {list(all_new_files)}")
-            
-            valid_downloads = []
-            for filename in all_new_files:
-                if filename.endswith('.mp4'):
-                    file_path = os.path.join(download_path, filename)
-                    is_valid, message = check_file_integrity(file_path)
-                    add_debug_info(f"Final check for {filename}: {message}")
-                    if is_valid:
-                        valid_downloads.append(filename)
-            
-            success_count = len(valid_downloads)
-            total_count = len(urls)
+                    timestamp = datetime.now().strftime("%H:%M:%S")
+                    st.session_state.download_status.append(f"[{timestamp}] 🔄 Preparing: {filename}")
+                    st.session_state.last_update = datetime.now()
             
-            add_debug_info(f"Final summary: {success_count}/{total_count} successful downloads")
+        except Exception as e:
+            add_debug_info(f"Error processing queue: {e}", 'ERROR')
+
+    return processed_any, completion_detected
+
+class _ZipChunkSink:
+    """Write-only, non-seekable sink that hands zip output back to a generator"""
+    def __init__(self):
+        self._chunks = []
+        self._offset = 0
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._offset += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._offset
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        chunks, self._chunks = self._chunks, []
+        return chunks
+
+def iter_zip_chunks(file_paths, chunk_size=ZIP_CHUNK_SIZE):
+    """Yield a ZIP archive of the given files chunk by chunk
+    
+    Files are read and emitted in chunk_size pieces, so memory use does not
+    depend on the size of the batch. Already-compressed media is stored.
+    """
+    sink = _ZipChunkSink()
+    seen_names = set()
+    with zipfile.ZipFile(sink, 'w', allowZip64=True) as zip_file:
+        for file_path in file_paths:
+            arcname = os.path.basename(file_path)
+            if arcname in seen_names or not os.path.isfile(file_path):
+                continue
+            seen_names.add(arcname)
             
-            if success_count > 0:
-                PROGRESS_QUEUE.put(('log', f"🎉 **{success_count}/{total_count} video(s) downloaded successfully!**"), block=False)
-                PROGRESS_QUEUE.put(('log', f"📁 Downloaded files: {', '.join(valid_downloads)}"), block=False)
+            zinfo = zipfile.ZipInfo.from_file(file_path, arcname)
+            if os.path.splitext(arcname)[1].lower() in ZIP_STORED_EXTENSIONS:
+                zinfo.compress_type = zipfile.ZIP_STORED
             else:
-                PROGRESS_QUEUE.put(('log', f"❌ **No videos were downloaded successfully**"), block=False)
-                
-        except Exception as e:
-            add_debug_info(f"Error during file analysis: {e}")
+                zinfo.compress_type = zipfile.ZIP_DEFLATED
             
-        # Handle permission errors
-        if not os.access(download_path, os.W_OK):
-            PROGRESS_QUEUE.put(('log', f"❌ Permission denied: Cannot write to {download_path}"), block=False)
-        
-    except Exception as e:
-        add_debug_info(f"Critical error in download_videos: {str(e)}")
-        PROGRESS_QUEUE.put(('log', f"❌ Critical error: {str(e)}"), block=False)
-    finally:
-        add_debug_info("download_videos function completed")
-        # Mark download as complete - send multiple times to ensure delivery
-        try:
-            PROGRESS_QUEUE.put(('complete', None), block=False)
-            PROGRESS_QUEUE.put(('complete', None), block=False)  # Send twice for reliability
-            print("🎉 COMPLETION SIGNAL SENT TO QUEUE")
-        except Exception as e:
-            print(f"❌ Error sending completion signal: {e}")
-            add_debug_info(f"Error sending completion signal: {e}")
-        
-        # Create file-based completion flag as backup
-        try:
-            with open(COMPLETION_FLAG_FILE, 'w') as f:
-                f.write(f"completed_{datetime.now().isoformat()}")
-            print("📁 COMPLETION FLAG FILE CREATED")
-        except Exception as e:
-            print(f"❌ Error creating completion flag file: {e}")
+            with open(file_path, 'rb') as src, zip_file.open(zinfo, 'w') as dst:
+                while True:
+                    chunk = src.read(chunk_size)
+                    if not chunk:
+                        break
+                    dst.write(chunk)
+                    yield from sink.drain()
+            yield from sink.drain()
+    # The central directory is written when the archive is closed
+    yield from sink.drain()
 
-def create_zip_download():
-    """Create a zip file of all downloaded videos for download"""
-    if not st.session_state.downloaded_files:
+def create_zip_download(file_paths):
+    """Build a ZIP of the given files in a temporary file and return it opened for reading
+    
+    The file is unlinked once open where the platform allows it, so it goes
+    away with the reader.
+    """
+    if not file_paths:
         return None
-        
-    zip_buffer = BytesIO()
-    with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
-        for file_path in st.session_state.downloaded_files:
-            if os.path.exists(file_path):
-                zip_file.write(file_path, os.path.basename(file_path))
     
-    zip_buffer.seek(0)
-    return zip_buffer.getvalue()
+    fd, zip_path = tempfile.mkstemp(prefix="youtube_downloads_", suffix=".zip")
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            for chunk in iter_zip_chunks(file_paths):
+                f.write(chunk)
+        zip_file = open(zip_path, 'rb')
+    except Exception:
+        os.remove(zip_path)
+        raise
+    try:
+        os.remove(zip_path)
+    except OSError:
+        pass
+    return zip_file
+
+def save_zip_archive(file_paths, zip_path):
+    """Stream a ZIP of the given files straight to zip_path"""
+    tmp_path = zip_path + ".part"
+    with open(tmp_path, 'wb') as f:
+        for chunk in iter_zip_chunks(file_paths):
+            f.write(chunk)
+    os.replace(tmp_path, zip_path)
+    return zip_path
+
+def split_zip_parts(file_paths, max_bytes=ZIP_PART_MAX_SIZE):
+    """Group files, in order, into lists whose total size stays within max_bytes"""
+    parts = []
+    part, part_bytes = [], 0
+    for file_path in file_paths:
+        size = os.path.getsize(file_path)
+        if part and part_bytes + size > max_bytes:
+            parts.append(part)
+            part, part_bytes = [], 0
+        part.append(file_path)
+        part_bytes += size
+    if part:
+        parts.append(part)
+    return parts
+
+def read_zip_download(file_paths):
+    """Deferred data source for st.download_button: build the ZIP on click
+    
+    Streamlit copies whatever the callable returns into memory, so the
+    archive is read back here and its temporary file closed (and with it
+    removed) right away; split_zip_parts() keeps that one copy small.
+    """
+    zip_file = create_zip_download(file_paths)
+    if zip_file is None:
+        return b""
+    with zip_file:
+        return zip_file.read()
+
+def describe_plan(plan):
+    """One-line summary of the format a preset picked for a video"""
+    if not plan:
+        return "no matching format"
+    parts = [f"{plan['height']}p" if plan['height'] else "audio", plan['ext'] or '?']
+    if plan['estimated_bytes']:
+        parts.append(f"~{format_bytes(plan['estimated_bytes'])}")
+    parts.append("merged" if plan['merge'] else "single file")
+    return f"format {plan['format_id']}: " + ", ".join(parts)
 
 def validate_download_path(path):
-    """Validate and fix download path permissions"""
+    """Validate a download path, creating it if needed (cached across reruns, see path_health)"""
     try:
-        # Expand user paths like ~/Downloads
-        path = os.path.expanduser(path)
-        
-        # Check if path exists
-        if not os.path.exists(path):
-            try:
-                os.makedirs(path, exist_ok=True)
-                return path, f"✅ Created directory: {path}"
-            except PermissionError:
-                return None, f"❌ Permission denied: Cannot create directory {path}"
-            except Exception as e:
-                return None, f"❌ Cannot create directory: {e}"
-        
-        # Check if it's a directory
-        if not os.path.isdir(path):
-            return None, f"❌ Path is not a directory: {path}"
-        
-        # Test write permissions by creating a temporary file
-        test_file = os.path.join(path, ".streamlit_write_test.tmp")
-        try:
-            with open(test_file, 'w') as f:
-                f.write("test")
-            os.remove(test_file)
-            return path, f"✅ Directory is writable: {path}"
-        except PermissionError:
-            return None, f"❌ Permission denied: Cannot write to {path}"
-        except Exception as e:
-            return None, f"❌ Cannot write to directory: {e}"
-            
+        health = get_path_health().check(path)
     except Exception as e:
         return None, f"❌ Path validation error: {e}"
+    return (health.path if health.ok else None), health.message
+
+def estimate_batch_bytes(urls, preset):
+    """Sum the previewed size estimates of urls for a preset; URLs without a preview count as 0"""
+    total = 0
+    for url in urls:
+        plan = (st.session_state.url_previews.get(url) or {}).get('plans', {}).get(preset)
+        if plan and plan['estimated_bytes']:
+            total += plan['estimated_bytes']
+    return total
 
 def get_safe_download_paths():
     """Get a list of safe download paths to try"""
@@ -579,6 +524,232 @@ def is_running_on_streamlit_cloud():
     return os.path.expanduser("~") == "/home/appuser"
 
 
+def download_thread_exited(session_job):
+    """True if this session's download is gone without signalling completion"""
+    if not st.session_state.is_downloading:
+        return False
+    if session_job is None:
+        # The job was pruned or the server restarted under us
+        return True
+    thread = session_job.thread
+    return thread is not None and not thread.is_alive() and session_job.queue.empty()
+
+def poll_daemon_job():
+    """Fetch new events of this session's daemon job; returns True once it has completed"""
+    try:
+        state = JobDaemonClient().get_job(st.session_state.daemon_job_id, st.session_state.daemon_cursor)
+    except DaemonUnavailable as e:
+        add_status_message(f"❌ Lost contact with the download daemon: {e}")
+        return True
+    st.session_state.daemon_cursor = state['cursor']
+    processed_any, completion_detected = process_progress_messages([event_to_message(event) for event in state['events']])
+    return completion_detected or state['status'] in TERMINAL_STATUSES
+
+def poll_session_job():
+    """Drain this session's job queue; returns True once the job has completed"""
+    if st.session_state.daemon_job_id:
+        return poll_daemon_job()
+    session_job = get_session_job()
+    completion_detected = False
+    if session_job is not None:
+        processed_any, completion_detected = process_progress_queue(session_job)
+    if not completion_detected and download_thread_exited(session_job):
+        add_debug_info("Download thread exited without a completion signal", 'WARNING')
+        completion_detected = True
+    return completion_detected
+
+def finish_download_session():
+    """Switch the session from downloading to complete"""
+    add_debug_info("Completion detected, updating UI state")
+    st.session_state.is_downloading = False
+    st.session_state.download_complete = True
+    st.session_state.active_downloads = {}
+
+def reset_download_state(total_videos):
+    """Clear the progress of the previous batch and mark the session as downloading"""
+    st.session_state.is_downloading = True
+    st.session_state.download_status = []
+    st.session_state.downloaded_files = []
+    st.session_state.download_complete = False
+    st.session_state.active_downloads = {}
+    st.session_state.download_progress = {}
+    st.session_state.last_percent = {}
+    st.session_state.progress_stats = None
+    st.session_state.validation_results = {}
+    st.session_state.dedupe_stats = None
+    st.session_state.throughput = None
+    st.session_state.bandwidth = None
+    st.session_state.batch_estimate = None
+    st.session_state.total_videos = total_videos
+    st.session_state.completed_videos = 0
+    
+    st.session_state.debug_cursor = 0
+    st.session_state.debug_lines.clear()
+    st.session_state.job_id = None
+    st.session_state.daemon_job_id = None
+    st.session_state.daemon_cursor = 0
+
+def start_in_app_job(urls, download_path, options, job_id=None):
+    """Run a batch on a thread of this server; job_id resumes an interrupted batch"""
+    add_debug_info(f"Starting new download session with {len(urls)} URLs")
+    add_debug_info(f"Download path: {download_path}")
+    
+    # Each batch gets a fresh job with its own queue, cancel token and log,
+    # run by the engine on a thread owned by the job
+    session_job = ENGINE.submit(urls, download_path, session_id=st.session_state.session_id, job_id=job_id,
+                                owner=batch_owner(), **options)
+    st.session_state.job_id = session_job.job_id
+    add_debug_info(f"Download thread started: {session_job.thread.name}")
+    return session_job
+
+def render_interrupted_batches():
+    """Offer to resume batches that this browser started and a previous run of this app left unfinished"""
+    try:
+        batches = get_default_journal().interrupted_batches(owner=batch_owner())
+    except Exception as e:
+        add_debug_info(f"Batch journal unavailable: {e}", 'ERROR')
+        return
+    
+    for batch in batches:
+        items = batch['items']
+        finished = sum(1 for item in items if item['state'] == 'done')
+        with st.container(border=True):
+            st.warning(f"♻️ **Interrupted batch** `{batch['batch_id']}`: {finished}/{len(items)} video(s) finished")
+            partial = [item for item in items if item['state'] == 'downloading' and item['bytes_done']]
+            for item in partial:
+                st.caption(f"⏸️ {item['url']} stopped at {format_bytes(item['bytes_done'])} / {format_bytes(item['total_bytes'])}")
+            resume_col, discard_col = st.columns(2)
+            if resume_col.button("▶️ Resume", key=f"resume_{batch['batch_id']}", use_container_width=True):
+                reset_download_state(len(items))
+                start_in_app_job(batch['urls'], batch['download_path'], batch['options'], job_id=batch['batch_id'])
+                st.rerun()
+            if discard_col.button("🗑️ Discard", key=f"discard_{batch['batch_id']}", use_container_width=True):
+                get_default_journal().finish_batch(batch['batch_id'], 'discarded')
+                st.rerun()
+
+def render_download_stats():
+    """Sidebar download statistics"""
+    if st.session_state.is_downloading or st.session_state.download_complete:
+        st.markdown("---")
+        st.subheader("📊 Download Stats")
+
+        # Show download status indicator
+        if st.session_state.is_downloading:
+            st.error("🔴 **DOWNLOADING ACTIVE**")
+            if st.session_state.last_update:
+                time_diff = (datetime.now() - st.session_state.last_update).total_seconds()
+                st.caption(f"Last update: {time_diff:.1f}s ago")
+
+        # Overall progress
+        if st.session_state.total_videos > 0:
+            overall_progress = st.session_state.completed_videos / st.session_state.total_videos
+            st.progress(overall_progress, f"Overall: {st.session_state.completed_videos}/{st.session_state.total_videos}")
+
+        # Progress event pipeline counters from the last batch
+        progress_stats = st.session_state.get('progress_stats')
+        if progress_stats:
+            st.caption(
+                f"📨 Progress events: {progress_stats['emitted']}/{progress_stats['received']} shown, "
+                f"{progress_stats['coalesced']} superseded by newer ones"
+            )
+
+        estimate = st.session_state.get('batch_estimate')
+        if estimate and estimate['known']:
+            unknown_note = f", {estimate['unknown']} of unknown size" if estimate['unknown'] else ""
+            st.caption(f"📏 Estimated batch size: {format_bytes(estimate['total_bytes'])}{unknown_note}")
+        # Live for batches running in this process; the daemon reports as its downloads start and finish
+        if st.session_state.is_downloading and st.session_state.job_id:
+            bandwidth = get_default_governor().stats(st.session_state.job_id)
+        else:
+            bandwidth = st.session_state.get('bandwidth')
+        if bandwidth and (st.session_state.is_downloading or bandwidth['total_bytes_per_second']):
+            limit = bandwidth['group_rate_limit'] or bandwidth['rate_limit']
+            limit_note = f", limit {format_bytes(limit)}/s" if limit else ""
+            st.caption(f"📶 {format_bytes(bandwidth['bytes_per_second'])}/s for this batch "
+                       f"({bandwidth['active']} active), {format_bytes(bandwidth['total_bytes_per_second'])}/s in total{limit_note}")
+        throughput = st.session_state.get('throughput')
+        if throughput and throughput['bytes']:
+            st.caption(f"🚀 {format_bytes(throughput['bytes_per_second'])}/s average over {throughput['seconds']:.0f}s ({throughput['profile']} profile)")
+
+        dedupe_stats = st.session_state.get('dedupe_stats')
+        if dedupe_stats and dedupe_stats['duplicates']:
+            st.caption(f"♻️ Duplicates: {len(dedupe_stats['duplicates'])} found, {format_bytes(dedupe_stats['saved_bytes'])} saved")
+
+        # Progress of each active file
+        for job_id, current in st.session_state.active_downloads.items():
+            if current.get('status') == 'downloading':
+                st.progress(current.get('percent', 0) / 100, f"{job_id}: {current.get('percent', 0):.1f}%")
+                st.caption(f"📁 {current.get('filename', 'Unknown')}")
+                st.caption(f"📊 {current.get('downloaded', '0 B')} / {current.get('total', 'Unknown')}")
+                st.caption(f"🚀 {current.get('speed', '0 B/s')} | ⏱️ ETA: {current.get('eta', '--:--')}")
+            elif current.get('status') == 'preparing':
+                st.info(f"🔄 {job_id}: Preparing download...")
+                st.caption(f"📺 {current.get('filename', 'Unknown')}")
+
+def render_download_status():
+    """Live download status panel
+    
+    While downloading this runs as a fragment every PROGRESS_REFRESH_INTERVAL
+    seconds: it drains the progress queue and redraws only this panel. The
+    whole app reruns once, when the download thread signals completion.
+    """
+    if st.session_state.is_downloading and poll_session_job():
+        finish_download_session()
+        st.rerun()
+    
+    # Show active download indicator
+    if st.session_state.is_downloading:
+        st.error("🔴 **DOWNLOAD IN PROGRESS**")
+        if st.session_state.active_downloads:
+            st.info(f"⏳ **Currently Downloading** ({len(st.session_state.active_downloads)} active)")
+
+        for job_id, current in st.session_state.active_downloads.items():
+            if current.get('status') == 'downloading':
+                # Progress bar
+                progress_val = current.get('percent', 0) / 100
+                st.progress(progress_val, f"{job_id}: {current.get('percent', 0):.1f}%")
+
+                # File info
+                st.caption(f"📁 **File**: {current.get('filename', 'Unknown')}")
+                st.caption(f"📊 **Progress**: {current.get('downloaded', '0 B')} / {current.get('total', 'Unknown')}")
+                st.caption(f"🚀 **Speed**: {current.get('speed', '0 B/s')} | ⏱️ **ETA**: {current.get('eta', '--:--')}")
+            elif current.get('status') == 'preparing':
+                st.info(f"🔄 **Preparing Download** ({job_id})")
+                st.caption(f"📺 Getting info for: {current.get('filename', 'Unknown')}")
+
+        if st.session_state.active_downloads:
+            st.markdown("---")
+
+    # Status log
+    if st.session_state.download_status:
+        # Show recent status messages (last 20)
+        recent_status = st.session_state.download_status[-20:]
+
+        # Create scrollable text area for status
+        status_text = "\n".join(recent_status)
+        st.text_area(
+            "Status Log",
+            value=status_text,
+            height=300,
+            disabled=True
+        )
+
+    # Individual file progress (if downloading multiple files)
+    if st.session_state.download_progress:
+        st.markdown("---")
+        st.subheader("📁 File Progress")
+
+        for filename, progress in st.session_state.download_progress.items():
+            status_icon = "✅" if progress['status'] == 'completed' else "❌" if progress['status'] == 'error' else "⏳"
+            st.caption(f"{status_icon} {filename}")
+            if progress['status'] == 'downloading':
+                st.progress(progress['percent'] / 100, f"{progress['percent']:.1f}%")
+            elif progress['status'] == 'completed':
+                st.progress(1.0, "100% ✅")
+            else:  # error
+                st.progress(0.0, "Failed ❌")
+
+
 def main():
     st.set_page_config(
         page_title="YouTube Video Downloader",
@@ -589,37 +760,11 @@ def main():
     st.title("📺 YouTube Video Downloader")
     st.markdown("---")
     
-    # Process any pending messages from download thread
-    processed_any, completion_detected = process_progress_queue()
-    
-    # Check for file-based completion flag
-    if not completion_detected and st.session_state.is_downloading:
-        if os.path.exists(COMPLETION_FLAG_FILE):
-            print("📁 COMPLETION FLAG FILE DETECTED - Download complete!")
-            completion_detected = True
-            try:
-                os.remove(COMPLETION_FLAG_FILE)
-                print("📁 Completion flag file removed")
-            except:
-                pass
+    # Process any pending messages from this session's download job
+    if st.session_state.is_downloading and poll_session_job():
+        finish_download_session()
     
-    # Fallback completion detection - if no activity for 3 seconds and we think we're downloading
-    if st.session_state.is_downloading and st.session_state.last_update:
-        time_since_update = (datetime.now() - st.session_state.last_update).total_seconds()
-        if time_since_update > 3.0:  # 3 seconds of no activity
-            print(f"🕐 FALLBACK: No activity for {time_since_update:.1f}s, assuming download complete")
-            completion_detected = True
-            st.session_state.download_status.append(f"[{datetime.now().strftime('%H:%M:%S')}] 🕐 Download completed (timeout detection)")
-    
-    if completion_detected:
-        print("🚀 MAIN UI: Completion detected, updating state")
-        st.session_state.is_downloading = False
-        st.session_state.download_complete = True
-        st.session_state.current_download = {}
-        STOP_DOWNLOAD.clear()  # Reset stop flag
-        print(f"🚀 MAIN UI STATE UPDATED: is_downloading={st.session_state.is_downloading}")
-        # Force immediate rerun to update UI
-        st.rerun()
+    refresh_interval = PROGRESS_REFRESH_INTERVAL if st.session_state.is_downloading else None
     
     # Sidebar for settings and debugging
     with st.sidebar:
@@ -687,62 +832,143 @@ def main():
                     else:
                         st.error(message)
             
-            st.info(f"📁 Current download path: `{download_path}`")
+            free_bytes = get_path_health().check(download_path).free_bytes
+            free_note = f" ({format_bytes(free_bytes)} free)" if free_bytes is not None else ""
+            st.info(f"📁 Current download path: `{download_path}`{free_note}")
+
+        # Concurrency settings
+        st.subheader("⚡ Concurrency")
+        max_concurrent = st.number_input(
+            "Max concurrent videos",
+            min_value=1,
+            max_value=16,
+            value=DEFAULT_MAX_CONCURRENT,
+            disabled=st.session_state.is_downloading,
+            help="How many videos are downloaded at the same time"
+        )
+        per_host_limit = st.number_input(
+            "Max concurrent videos per host",
+            min_value=1,
+            max_value=16,
+            value=DEFAULT_PER_HOST_LIMIT,
+            disabled=st.session_state.is_downloading,
+            help="Limits parallel downloads from the same site (youtu.be and youtube.com count as one host)"
+        )
+
+        use_archive = st.checkbox(
+            "⏭️ Skip already downloaded videos",
+            value=True,
+            disabled=st.session_state.is_downloading,
+            help="Consult the persistent download archive and skip videos whose files are still on disk"
+        )
+
+        format_preset = st.selectbox(
+            "🎞️ Quality preset",
+            preset_names(),
+            index=preset_names().index(DEFAULT_PRESET),
+            format_func=preset_label,
+            disabled=st.session_state.is_downloading,
+            help="Which formats to fetch; among formats of equal quality the one with the fewest bytes, and no merge if possible, is chosen"
+        )
+
+        quota_gb = st.number_input(
+            "💾 Batch size limit (GB, 0 = none)",
+            min_value=0.0,
+            value=0.0,
+            step=1.0,
+            disabled=st.session_state.is_downloading,
+            help="Videos whose estimated size would take the batch over this limit are not downloaded; videos also wait while the disk is too full"
+        )
+
+        with st.expander("📚 Playlists & channels"):
+            playlist_start = st.number_input("First item", min_value=1, value=1, step=1,
+                                             disabled=st.session_state.is_downloading)
+            playlist_end = st.number_input("Last item (0 = all)", min_value=0, value=0, step=1,
+                                           disabled=st.session_state.is_downloading)
+            min_minutes = st.number_input("Shortest video (minutes, 0 = any)", min_value=0, value=0, step=1,
+                                          disabled=st.session_state.is_downloading)
+            max_minutes = st.number_input("Longest video (minutes, 0 = any)", min_value=0, value=0, step=1,
+                                          disabled=st.session_state.is_downloading)
+            date_after = st.date_input("Uploaded on or after", value=None,
+                                       disabled=st.session_state.is_downloading,
+                                       help="Videos whose upload date is unknown until they are extracted are checked before downloading")
+            playlist_filters = {
+                'start': playlist_start,
+                'end': playlist_end or None,
+                'min_duration': min_minutes * 60 or None,
+                'max_duration': max_minutes * 60 or None,
+                'date_after': date_after.strftime('%Y%m%d') if date_after else None,
+            }
+
+        with st.expander("📶 Bandwidth"):
+            # The server-wide limit is the operator's to set, not any visitor's
+            server_rate = get_default_governor().rate
+            st.caption(f"All downloads on this server: {format_bytes(server_rate) + '/s' if server_rate else 'no limit'} "
+                       f"(set with `{BANDWIDTH_LIMIT_ENV}`)")
+            session_rate_mb = st.number_input("This batch (MB/s, 0 = none)", min_value=0.0, value=0.0, step=0.5,
+                                              disabled=st.session_state.is_downloading)
+            video_rate_mb = st.number_input("Each video (MB/s, 0 = none)", min_value=0.0, value=0.0, step=0.5,
+                                            disabled=st.session_state.is_downloading)
+
+        throughput_profile = st.selectbox(
+            "🚀 Throughput profile",
+            profile_names(),
+            index=profile_names().index(DEFAULT_PROFILE),
+            format_func=profile_label,
+            disabled=st.session_state.is_downloading,
+            help="Parallel fragment downloads, HTTP chunk and buffer sizes, or handing transfers to aria2c; speeds up DASH/HLS videos on high-latency links"
+        )
+
+        dedupe_modes = list(DEDUPE_MODE_LABELS)
+        dedupe_mode = st.selectbox(
+            "♻️ Duplicate downloads",
+            dedupe_modes,
+            index=dedupe_modes.index(DEFAULT_DEDUPE_MODE),
+            format_func=DEDUPE_MODE_LABELS.get,
+            disabled=st.session_state.is_downloading,
+            help="What to do when a downloaded file has the same content as a file already in the download folder"
+        )
+
+        use_daemon = st.checkbox(
+            "🛰️ Run in background daemon",
+            value=False,
+            disabled=st.session_state.is_downloading,
+            help="Hand the batch to the local download daemon (job_daemon.py), which keeps downloading in its own process even if this page is closed"
+        )
 
         # Debug mode toggle
-        debug_mode = st.checkbox("🐛 Debug Mode", value=True, help="Show detailed debugging information")
+        debug_mode = st.checkbox("🐛 Debug Mode", value=False, help="Show detailed debugging information and log every progress event")
         
         # Stop download button
         if st.session_state.is_downloading:
             if st.button("🛑 Stop Download", type="secondary"):
-                STOP_DOWNLOAD.set()
+                if st.session_state.daemon_job_id:
+                    try:
+                        JobDaemonClient().cancel(st.session_state.daemon_job_id)
+                    except DaemonUnavailable as e:
+                        st.error(f"❌ {e}")
+                else:
+                    JOB_MANAGER.cancel(st.session_state.job_id)
                 st.warning("Stopping download...")
                 st.rerun()
         
-        # Download Statistics
-        if st.session_state.is_downloading or st.session_state.download_complete:
-            st.markdown("---")
-            st.subheader("📊 Download Stats")
-            
-            # Show download status indicator
-            if st.session_state.is_downloading:
-                st.error("🔴 **DOWNLOADING ACTIVE**")
-                if st.session_state.last_update:
-                    time_diff = (datetime.now() - st.session_state.last_update).total_seconds()
-                    st.caption(f"Last update: {time_diff:.1f}s ago")
-            
-            # Overall progress
-            if st.session_state.total_videos > 0:
-                overall_progress = st.session_state.completed_videos / st.session_state.total_videos
-                st.progress(overall_progress, f"Overall: {st.session_state.completed_videos}/{st.session_state.total_videos}")
-            
-            # Current file progress
-            if st.session_state.current_download:
-                current = st.session_state.current_download
-                if current.get('status') == 'downloading':
-                    st.progress(current.get('percent', 0) / 100, f"Current: {current.get('percent', 0):.1f}%")
-                    st.caption(f"📁 {current.get('filename', 'Unknown')}")
-                    st.caption(f"📊 {current.get('downloaded', '0 B')} / {current.get('total', 'Unknown')}")
-                    st.caption(f"🚀 {current.get('speed', '0 B/s')} | ⏱️ ETA: {current.get('eta', '--:--')}")
-                elif current.get('status') == 'preparing':
-                    st.info("🔄 Preparing download...")
-                    st.caption(f"📺 {current.get('filename', 'Unknown')}")
+        # Download Statistics - refreshed on their own while downloading
+        st.fragment(render_download_stats, run_every=refresh_interval)()
         
         # Debug information
         if debug_mode:
             st.markdown("---")
             st.subheader("🐛 Debug Info")
             
-            # Get debug info from global thread-safe storage
-            debug_info = get_debug_info()
+            # Only records added since the last render are fetched
+            debug_info = get_new_debug_info()
             if debug_info:
-                debug_text = "\n".join(debug_info[-50:])  # Last 50 debug messages
+                debug_text = "\n".join(debug_info)  # Last DEBUG_VIEW_LINES debug messages
                 st.text_area(
                     "Debug Log",
                     value=debug_text,
                     height=200,
-                    disabled=True,
-                    key="debug_log"
+                    disabled=True
                 )
             else:
                 st.info("No debug information yet")
@@ -755,6 +981,9 @@ def main():
     col1, col2 = st.columns([2, 1])
     
     with col1:
+        if not st.session_state.is_downloading:
+            render_interrupted_batches()
+        
         st.header("📝 Enter YouTube URL(s)")
         
         # URL input
@@ -767,9 +996,11 @@ def main():
         
         # Parse URLs
         urls = []
+        duplicate_urls = []
         if urls_input:
-            # Split by both commas and newlines, then clean up
-            raw_urls = [url.strip() for url in urls_input.replace(',', '\n').split('\n')]
+            # Split by commas and newlines, then map every link to one canonical
+            # URL per video, so the same video pasted twice is fetched once
+            raw_urls, duplicate_urls = dedupe_urls(split_urls(urls_input))
             # More flexible URL validation - check for common YouTube patterns
             urls = []
             invalid_urls = []
@@ -794,9 +1025,35 @@ def main():
         if urls_input:
             if urls:
                 st.success(f"✅ Found {len(urls)} valid YouTube URL(s)")
+                if duplicate_urls:
+                    st.info(f"♻️ {len(duplicate_urls)} duplicate URL(s) point to videos already in the list and will be skipped")
                 with st.expander("📋 URLs to download"):
                     for i, url in enumerate(urls, 1):
-                        st.write(f"{i}. {url}")
+                        preview = st.session_state.url_previews.get(url)
+                        if preview:
+                            st.write(f"{i}. **{preview['title']}** - {preview['uploader']} ({preview['duration']})")
+                            st.caption(url)
+                            if 'plans' in preview:
+                                st.caption(f"🎞️ {describe_plan(preview['plans'].get(format_preset))}")
+                        else:
+                            st.write(f"{i}. {url}")
+                    
+                    previewed = [url for url in urls if url in st.session_state.url_previews]
+                    if previewed:
+                        st.caption(f"📏 Estimated size: {format_bytes(estimate_batch_bytes(urls, format_preset))} "
+                                   f"for {len(previewed)} of {len(urls)} URL(s)")
+                    
+                    # Metadata is cached, so the download reuses this extraction
+                    previewable = [url for url in urls if cache_key(url) and url not in st.session_state.url_previews]
+                    if previewable and st.button("🔍 Preview details and size", disabled=st.session_state.is_downloading):
+                        with st.spinner(f"Fetching details for {len(previewable)} video(s)..."):
+                            estimate = run_preflight(previewable, format_preset)
+                        for item in estimate.items:
+                            if item.error:
+                                add_debug_info(f"Preview failed for {item.url}: {item.error}")
+                            elif item.title is not None:
+                                st.session_state.url_previews[item.url] = item.to_preview()
+                        st.rerun()
             
             if invalid_urls:
                 st.warning(f"⚠️ Found {len(invalid_urls)} invalid URL(s)")
@@ -823,103 +1080,47 @@ def main():
             use_container_width=True
         ):
             if urls and download_path:
-                # Reset state
-                st.session_state.is_downloading = True
-                st.session_state.download_status = []
-                st.session_state.downloaded_files = []
-                st.session_state.download_complete = False
-                st.session_state.current_download = {}
-                st.session_state.download_progress = {}
-                st.session_state.total_videos = len(urls)
-                st.session_state.completed_videos = 0
-                
-                # Clear debug info and queue
-                clear_debug_info()
-                while not PROGRESS_QUEUE.empty():
-                    try:
-                        PROGRESS_QUEUE.get_nowait()
-                    except queue.Empty:
-                        break
+                # Refuse up front a batch the disk cannot hold
+                capacity_ok, capacity_message = get_path_health().check_capacity(
+                    download_path, estimate_batch_bytes(urls, format_preset))
+                if not capacity_ok:
+                    st.error(capacity_message)
+                else:
+                    reset_download_state(len(urls))
+                    options = {
+                        'max_concurrent': max_concurrent,
+                        'per_host_limit': per_host_limit,
+                        'use_archive': use_archive,
+                        'debug': debug_mode,
+                        'dedupe_mode': dedupe_mode,
+                        'throughput_profile': throughput_profile,
+                        'format_preset': format_preset,
+                        'quota_bytes': int(quota_gb * 1024 ** 3) or None,
+                        'rate_limit': int(video_rate_mb * 1024 ** 2) or None,
+                        'session_rate_limit': int(session_rate_mb * 1024 ** 2) or None,
+                        'playlist_filters': playlist_filters,
+                    }
                 
-                STOP_DOWNLOAD.clear()
-                
-                add_debug_info(f"Starting new download session with {len(urls)} URLs")
-                add_debug_info(f"Download path: {download_path}")
-                
-                # Remove any existing completion flag
-                try:
-                    if os.path.exists(COMPLETION_FLAG_FILE):
-                        os.remove(COMPLETION_FLAG_FILE)
-                        print("📁 Removed existing completion flag file")
-                except:
-                    pass
-                
-                # Start download in a thread
-                download_thread = threading.Thread(
-                    target=download_videos,
-                    args=(urls, download_path),
-                    daemon=True,
-                    name="DownloadThread"
-                )
-                download_thread.start()
-                add_debug_info(f"Download thread started: {download_thread.name}")
-                # Force immediate refresh
-                st.rerun()
+                    if use_daemon:
+                        # The daemon owns the batch; this session only polls its events
+                        try:
+                            client = ensure_daemon()
+                            remote_job = client.submit(urls, download_path, **options)
+                            st.session_state.daemon_job_id = remote_job['job_id']
+                            add_debug_info(f"Submitted {len(urls)} URLs to the download daemon as {remote_job['job_id']}")
+                        except DaemonUnavailable as e:
+                            st.session_state.is_downloading = False
+                            add_status_message(f"❌ Could not start the download daemon: {e}")
+                    else:
+                        start_in_app_job(urls, download_path, options)
+                    # Force immediate refresh
+                    st.rerun()
     
     with col2:
         st.header("📊 Download Status")
         
-        # Show active download indicator
-        if st.session_state.is_downloading:
-            st.error("🔴 **DOWNLOAD IN PROGRESS**")
-            if st.session_state.current_download:
-                current = st.session_state.current_download
-                if current.get('status') == 'downloading':
-                    st.info("⏳ **Currently Downloading**")
-                    
-                    # Progress bar
-                    progress_val = current.get('percent', 0) / 100
-                    st.progress(progress_val, f"{current.get('percent', 0):.1f}%")
-                    
-                    # File info
-                    st.caption(f"📁 **File**: {current.get('filename', 'Unknown')}")
-                    st.caption(f"📊 **Progress**: {current.get('downloaded', '0 B')} / {current.get('total', 'Unknown')}")
-                    st.caption(f"🚀 **Speed**: {current.get('speed', '0 B/s')} | ⏱️ **ETA**: {current.get('eta', '--:--')}")
-                elif current.get('status') == 'preparing':
-                    st.info("🔄 **Preparing Download**")
-                    st.caption(f"📺 Getting info for: {current.get('filename', 'Unknown')}")
-                
-                st.markdown("---")
-        
-        # Status log
-        if st.session_state.download_status:
-            # Show recent status messages (last 20)
-            recent_status = st.session_state.download_status[-20:]
-            
-            # Create scrollable text area for status
-            status_text = "\n".join(recent_status)
-            st.text_area(
-                "Status Log",
-                value=status_text,
-                height=300,
-                disabled=True,
-                key="status_log"
-            )
-        
-        # Individual file progress (if downloading multiple files)
-        if st.session_state.download_progress:
-            st.markdown("---")
-            st.subheader("📁 File Progress")
-            
-            for filename, progress in st.session_state.download_progress.items():
-                status_icon = "✅" if progress['status'] == 'completed' else "❌" if progress['status'] == 'error' else "⏳"
-                st.caption(f"{status_icon} {filename}")
-                if progress['status'] == 'downloading':
-                    st.progress(progress['percent'] / 100, f"{progress['percent']:.1f}%")
-                elif progress['status'] == 'completed':
-                    st.progress(1.0, "100% ✅")
-                else:  # error
-                    st.progress(0.0, "Failed ❌")
+        # Live status panel - drains the progress queue on its own while downloading
+        st.fragment(render_download_status, run_every=refresh_interval)()
         
         # Download completed actions
         if st.session_state.download_complete and st.session_state.downloaded_files:
@@ -931,38 +1132,56 @@ def main():
             with st.expander("📁 Downloaded Files"):
                 for file_path in st.session_state.downloaded_files:
                     filename = os.path.basename(file_path)
-                    file_size = ""
-                    if os.path.exists(file_path):
-                        size_bytes = os.path.getsize(file_path)
-                        for unit in ['B', 'KB', 'MB', 'GB']:
-                            if size_bytes < 1024.0:
-                                file_size = f" ({size_bytes:.1f} {unit})"
-                                break
-                            size_bytes /= 1024.0
-                    st.write(f"✅ {filename}{file_size}")
+                    file_size = f" ({format_bytes(os.path.getsize(file_path))})" if os.path.exists(file_path) else ""
+                    validation = st.session_state.get('validation_results', {}).get(file_path)
+                    if validation and not validation['valid']:
+                        st.write(f"⚠️ {filename}{file_size}")
+                        st.caption(validation['message'])
+                    else:
+                        st.write(f"✅ {filename}{file_size}")
             
-            # Create zip download
-            if st.button("📦 Download All as ZIP", type="secondary"):
-                zip_data = create_zip_download()
-                if zip_data:
+            # Create zip download - the archive is only built when requested
+            zip_files = [f for f in st.session_state.downloaded_files if os.path.isfile(f)]
+            zip_total = sum(os.path.getsize(f) for f in zip_files)
+            
+            if zip_total > ZIP_INLINE_LIMIT and not is_running_on_streamlit_cloud():
+                st.info(f"📦 The batch is {format_bytes(zip_total)} - too large to serve through the browser. The ZIP will be written next to your downloads instead.")
+                if st.button("💾 Save All as ZIP", type="secondary"):
+                    zip_path = os.path.join(download_path, f"youtube_downloads_{datetime.now().strftime('%Y%m%d_%H%M%S')}.zip")
+                    try:
+                        save_zip_archive(zip_files, zip_path)
+                        st.success(f"✅ ZIP saved to `{zip_path}`")
+                    except Exception as e:
+                        st.error(f"❌ Could not write ZIP: {e}")
+            elif zip_files:
+                zip_parts = split_zip_parts(zip_files)
+                if len(zip_parts) == 1:
                     st.download_button(
-                        label="⬇️ Download ZIP File",
-                        data=zip_data,
+                        label="📦 Download All as ZIP",
+                        data=lambda: read_zip_download(zip_files),
                         file_name="youtube_downloads.zip",
-                        mime="application/zip"
+                        mime="application/zip",
+                        type="secondary"
                     )
-    
-    # Auto-refresh while downloading
-    if st.session_state.is_downloading:
-        time.sleep(0.5)  # Slower refresh for stability
-        st.rerun()
+                else:
+                    st.caption(f"📦 The batch is split into {len(zip_parts)} ZIP parts of at most {format_bytes(ZIP_PART_MAX_SIZE)} each (larger single files get a part of their own).")
+                    for number, part in enumerate(zip_parts, 1):
+                        part_bytes = sum(os.path.getsize(f) for f in part)
+                        st.download_button(
+                            label=f"📦 Download Part {number}/{len(zip_parts)} ({len(part)} file(s), {format_bytes(part_bytes)})",
+                            data=lambda part=part: read_zip_download(part),
+                            file_name=f"youtube_downloads_part{number}.zip",
+                            mime="application/zip",
+                            type="secondary",
+                            key=f"zip_part_{number}"
+                        )
     
     # Footer
     st.markdown("---")
     st.markdown(
         "💡 **Tips:** "
         "• Enter multiple URLs separated by commas or new lines "
-        "• Videos are downloaded in MP4 format with best quality "
+        "• Pick a quality preset; equal-quality formats are chosen by size "
         "• Watch real-time progress in the status panel "
         "• Use Debug Mode for detailed troubleshooting "
         "• Use Stop Download button if needed"
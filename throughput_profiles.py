@@ -0,0 +1,87 @@
+"""Named yt-dlp transfer settings, selectable per batch.
+
+DASH and HLS videos are split into many small fragments; yt-dlp fetches
+them one at a time unless told otherwise, so on high-latency links a
+download spends most of its time waiting for round trips. A profile sets
+how many fragments are fetched in parallel, how large the HTTP range
+requests and read buffer are, and optionally hands the transfer to an
+external downloader. The chosen profile is recorded with the batch results
+so different profiles can be compared.
+"""
+import shutil
+
+DEFAULT_PROFILE = 'balanced'
+
+PROFILES = {
+    'standard': {
+        'label': "Standard (one fragment at a time)",
+        'options': {},
+    },
+    'balanced': {
+        'label': "Balanced (4 parallel fragments)",
+        'options': {
+            'concurrent_fragment_downloads': 4,
+            'http_chunk_size': 10 * 1024 * 1024,
+            'buffersize': 64 * 1024,
+        },
+    },
+    'max': {
+        'label': "Maximum (8 parallel fragments, large buffers)",
+        'options': {
+            'concurrent_fragment_downloads': 8,
+            'http_chunk_size': 20 * 1024 * 1024,
+            'buffersize': 256 * 1024,
+        },
+    },
+    'aria2c': {
+        'label': "aria2c (external downloader, 8 connections)",
+        'options': {
+            'concurrent_fragment_downloads': 8,
+            'external_downloader': {'default': 'aria2c'},
+            'external_downloader_args': {'aria2c': ['-x', '8', '-s', '8', '-k', '1M']},
+        },
+        'requires': 'aria2c',
+        'fallback': 'max',
+    },
+}
+
+
+def profile_names():
+    return list(PROFILES)
+
+
+def profile_label(name):
+    return PROFILES[name]['label']
+
+
+def resolve_profile(name):
+    """Return (profile name actually used, note) for a requested profile
+
+    Profiles needing an external program fall back when it is not installed.
+    """
+    if name not in PROFILES:
+        return DEFAULT_PROFILE, f"Unknown throughput profile {name!r}, using {DEFAULT_PROFILE!r}"
+    requires = PROFILES[name].get('requires')
+    if requires and shutil.which(requires) is None:
+        fallback = PROFILES[name]['fallback']
+        return fallback, f"{requires} not found on PATH, using the {fallback!r} profile"
+    return name, None
+
+
+def apply_profile(ydl_opts, name):
+    """Add a profile's settings to ydl_opts in place
+
+    Returns a JSON-friendly description of what was applied, for job results.
+    """
+    resolved, note = resolve_profile(name)
+    options = PROFILES[resolved]['options']
+    ydl_opts.update(options)
+    return {
+        'requested': name,
+        'profile': resolved,
+        'note': note,
+        'concurrent_fragments': options.get('concurrent_fragment_downloads', 1),
+        'http_chunk_size': options.get('http_chunk_size'),
+        'buffersize': options.get('buffersize'),
+        'external_downloader': (options.get('external_downloader') or {}).get('default'),
+    }
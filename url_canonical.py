@@ -0,0 +1,85 @@
+"""Canonical forms of video, playlist and channel URLs, and batch deduplication.
+
+The same video reaches a batch as a watch link, a youtu.be short link, a
+mobile or Shorts link, with a start time, a playlist context or a share
+tracker appended. canonicalize_url() maps all of these to one URL
+(https://www.youtube.com/watch?v=ID), playlists to
+https://www.youtube.com/playlist?list=ID, and strips tracking parameters
+from everything else, so dedupe_urls() can drop the repeats before the
+batch reaches the scheduler. Both apps parse their URL input through
+split_urls() and dedupe_urls().
+"""
+import re
+from urllib.parse import parse_qsl, urlencode, urlparse, urlunparse
+
+from download_archive import YOUTUBE_HOSTS, parse_video_id
+
+# Query parameters that only say where a link was shared from
+TRACKING_PARAMS = {'si', 'feature', 'pp', 'fbclid', 'gclid', 'igshid', 'ab_channel', 'embeds_referring_euri', 'source_ve_path'}
+TRACKING_PREFIXES = ('utm_',)
+YOUTUBE_PLAYLIST_ID_RE = re.compile(r'^[0-9A-Za-z_-]{2,}$')
+URL_SEPARATORS_RE = re.compile(r'[\s,]+')
+
+
+def _with_scheme(url):
+    # 'youtu.be/ID' and 'www.youtube.com/...' are pasted without a scheme
+    url = url.strip()
+    if url and '://' not in url:
+        url = f"https://{url}"
+    return url
+
+
+def _is_tracking(name):
+    return name in TRACKING_PARAMS or name.startswith(TRACKING_PREFIXES)
+
+
+def parse_playlist_id(url):
+    """Return the list id of a YouTube playlist URL (not of a watch URL with &list=), or None"""
+    parsed = urlparse(_with_scheme(url))
+    if (parsed.hostname or '').lower() not in YOUTUBE_HOSTS or parsed.path.rstrip('/') != '/playlist':
+        return None
+    playlist_id = dict(parse_qsl(parsed.query)).get('list')
+    if playlist_id and YOUTUBE_PLAYLIST_ID_RE.match(playlist_id):
+        return playlist_id
+    return None
+
+
+def canonicalize_url(url):
+    """Return the canonical form of a URL; unknown URLs only lose tracking parameters"""
+    url = _with_scheme(url)
+    parsed_id = parse_video_id(url)
+    if parsed_id is not None:
+        return f"https://www.youtube.com/watch?v={parsed_id[1]}"
+    playlist_id = parse_playlist_id(url)
+    if playlist_id is not None:
+        return f"https://www.youtube.com/playlist?list={playlist_id}"
+
+    parsed = urlparse(url)
+    host = (parsed.hostname or '').lower()
+    netloc = parsed.netloc.lower() if not parsed.username else parsed.netloc
+    path = parsed.path
+    if host in YOUTUBE_HOSTS:
+        # Channels and their tabs: one host, no trailing slash
+        netloc = 'www.youtube.com'
+        path = path.rstrip('/') or '/'
+    query = urlencode([(name, value) for name, value in parse_qsl(parsed.query, keep_blank_values=True) if not _is_tracking(name)])
+    # The fragment is kept: yt-dlp smuggles data through it in playlist entries
+    return urlunparse((parsed.scheme.lower(), netloc, path, parsed.params, query, parsed.fragment))
+
+
+def split_urls(text):
+    """Split pasted text on commas, newlines and spaces into non-empty URLs"""
+    return [url for url in URL_SEPARATORS_RE.split(text or '') if url]
+
+
+def dedupe_urls(urls):
+    """Return (canonical URLs in first-seen order, [(url, canonical URL) of each dropped repeat])"""
+    unique = {}
+    duplicates = []
+    for url in urls:
+        canonical = canonicalize_url(url)
+        if canonical in unique:
+            duplicates.append((url, canonical))
+        else:
+            unique[canonical] = url
+    return list(unique), duplicates
@@ -1,57 +1,26 @@
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
 import threading
+import queue
 import os
-import yt_dlp # Changed from subprocess to direct library import
-import sys # To detect if running as a bundle
-import stat # For chmod constants
-
-# Helper for yt-dlp logging
-class YtdlpLogger:
-    def __init__(self, app_logger_func):
-        self.app_logger_func = app_logger_func
-
-    def debug(self, msg):
-        # yt-dlp can be very verbose in debug, pass through for now
-        if msg.startswith('[debug] '):
-            self.app_logger_func(msg.strip())
-        else:
-            self.app_logger_func(f"[debug] {msg.strip()}")
-
-    def info(self, msg):
-        self.app_logger_func(msg.strip())
-
-    def warning(self, msg):
-        self.app_logger_func(f"WARNING: {msg.strip()}")
-
-    def error(self, msg):
-        self.app_logger_func(f"ERROR: {msg.strip()}")
-
-# Helper for yt-dlp progress hooks
-def ytdlp_progress_hook(d, app_logger_func):
-    if d['status'] == 'downloading':
-        # filename = d.get('filename') or d.get('info_dict', {}).get('title', 'N/A')
-        # total_bytes_str = d.get('_total_bytes_str', 'N/A')
-        # speed_str = d.get('_speed_str', 'N/A')
-        # eta_str = d.get('_eta_str', 'N/A')
-        # percent_str = d.get('_percent_str', 'N/A').strip()
-        # app_logger_func(f"Downloading {filename}: {percent_str} of {total_bytes_str} at {speed_str}, ETA {eta_str}")
-        # The logger itself will print detailed download progress, so this can be minimal
-        pass
-    elif d['status'] == 'finished':
-        filename = d.get('filename') or d.get('info_dict', {}).get('title', 'N/A')
-        app_logger_func(f"Finished downloading: {filename}")
-        if d.get('total_bytes') is not None:
-             app_logger_func(f"Total size: {d.get('_total_bytes_str', 'N/A')}")
-    elif d['status'] == 'error':
-        filename = d.get('filename') or d.get('info_dict', {}).get('title', 'N/A')
-        app_logger_func(f"Error downloading {filename}. Check logs for details.")
+from throughput_profiles import DEFAULT_PROFILE, profile_names
+from format_presets import DEFAULT_PRESET, preset_names
+from download_engine import get_default_engine
+from bandwidth_governor import get_default_governor
+from url_canonical import dedupe_urls, split_urls
+from job_daemon import DaemonUnavailable, ensure_daemon, JobDaemonClient, TERMINAL_STATUSES
+
+# How often the Tk app polls a daemon job for new events
+DAEMON_POLL_INTERVAL_MS = 500
+# How often the Tk main loop picks up messages posted by download threads
+UI_POLL_INTERVAL_MS = 100
 
 class YouTubeDownloaderApp:
     def __init__(self, root):
         self.root = root
         self.root.title("YouTube Video Downloader")
-        self.root.geometry("600x400")
+        self.root.geometry("640x560")
+        self.root.minsize(600, 480)
 
         # Style
         style = ttk.Style()
@@ -67,22 +36,78 @@ class YouTubeDownloaderApp:
         self.url_entry = ttk.Entry(input_frame, width=60)
         self.url_entry.pack(side=tk.LEFT, expand=True, fill="x", padx=5)
 
-        # Frame for download options (initially just path)
+        # Frame for download options, one row per group so nothing is clipped
         options_frame = ttk.LabelFrame(root, text="Download Options", padding=(10, 5))
         options_frame.pack(padx=10, pady=5, fill="x")
-
-        self.path_label = ttk.Label(options_frame, text="Download Path:")
+        path_row = ttk.Frame(options_frame)
+        path_row.pack(fill="x")
+        format_row = ttk.Frame(options_frame)
+        format_row.pack(fill="x")
+        bandwidth_row = ttk.Frame(options_frame)
+        bandwidth_row.pack(fill="x")
+        flags_row = ttk.Frame(options_frame)
+        flags_row.pack(fill="x")
+
+        self.path_label = ttk.Label(path_row, text="Download Path:")
         self.path_label.pack(side=tk.LEFT, padx=5, pady=5)
 
         self.download_path_var = tk.StringVar()
         self.download_path_var.set(os.path.join(os.path.expanduser("~"), "Downloads")) # Default to ~/Downloads
 
-        self.path_entry = ttk.Entry(options_frame, textvariable=self.download_path_var, width=50)
+        self.path_entry = ttk.Entry(path_row, textvariable=self.download_path_var, width=50)
         self.path_entry.pack(side=tk.LEFT, expand=True, fill="x", padx=5, pady=5)
 
-        self.browse_button = ttk.Button(options_frame, text="Browse...", command=self.browse_download_path)
+        self.browse_button = ttk.Button(path_row, text="Browse...", command=self.browse_download_path)
         self.browse_button.pack(side=tk.LEFT, padx=5, pady=5)
 
+        self.format_preset_label = ttk.Label(format_row, text="Quality:")
+        self.format_preset_label.pack(side=tk.LEFT, padx=(5, 0), pady=5)
+        self.format_preset_var = tk.StringVar(value=DEFAULT_PRESET)
+        self.format_preset_combo = ttk.Combobox(format_row, textvariable=self.format_preset_var, values=preset_names(), state="readonly", width=11)
+        self.format_preset_combo.pack(side=tk.LEFT, padx=5, pady=5)
+
+        self.throughput_profile_label = ttk.Label(format_row, text="Profile:")
+        self.throughput_profile_label.pack(side=tk.LEFT, padx=(5, 0), pady=5)
+        self.throughput_profile_var = tk.StringVar(value=DEFAULT_PROFILE)
+        self.throughput_profile_combo = ttk.Combobox(format_row, textvariable=self.throughput_profile_var, values=profile_names(), state="readonly", width=10)
+        self.throughput_profile_combo.pack(side=tk.LEFT, padx=5, pady=5)
+
+        # Total bandwidth for all downloads, in MB/s (0 = no limit); changes apply to running downloads
+        self.bandwidth_limit_var = tk.DoubleVar(value=(get_default_governor().rate or 0) / 1024 ** 2)
+        self.bandwidth_limit_label = ttk.Label(bandwidth_row, text="Max MB/s:")
+        self.bandwidth_limit_label.pack(side=tk.LEFT, padx=(5, 0), pady=5)
+        self.bandwidth_limit_spin = ttk.Spinbox(bandwidth_row, textvariable=self.bandwidth_limit_var, from_=0, to=1000, increment=0.5, width=5, command=self.apply_bandwidth_limit)
+        self.bandwidth_limit_spin.bind("<Return>", lambda event: self.apply_bandwidth_limit())
+        self.bandwidth_limit_spin.pack(side=tk.LEFT, padx=5, pady=5)
+
+        # Caps of each batch and of each video, in MB/s (0 = no limit); read when a batch starts
+        self.batch_rate_var = tk.DoubleVar(value=0)
+        self.batch_rate_label = ttk.Label(bandwidth_row, text="Batch MB/s:")
+        self.batch_rate_label.pack(side=tk.LEFT, padx=(5, 0), pady=5)
+        self.batch_rate_spin = ttk.Spinbox(bandwidth_row, textvariable=self.batch_rate_var, from_=0, to=1000, increment=0.5, width=5)
+        self.batch_rate_spin.pack(side=tk.LEFT, padx=5, pady=5)
+
+        self.video_rate_var = tk.DoubleVar(value=0)
+        self.video_rate_label = ttk.Label(bandwidth_row, text="Video MB/s:")
+        self.video_rate_label.pack(side=tk.LEFT, padx=(5, 0), pady=5)
+        self.video_rate_spin = ttk.Spinbox(bandwidth_row, textvariable=self.video_rate_var, from_=0, to=1000, increment=0.5, width=5)
+        self.video_rate_spin.pack(side=tk.LEFT, padx=5, pady=5)
+
+        self.skip_archived_var = tk.BooleanVar(value=True)
+        self.skip_archived_check = ttk.Checkbutton(flags_row, text="Skip already downloaded", variable=self.skip_archived_var)
+        self.skip_archived_check.pack(side=tk.LEFT, padx=5, pady=5)
+
+        self.hardlink_duplicates_var = tk.BooleanVar(value=True)
+        self.hardlink_duplicates_check = ttk.Checkbutton(flags_row, text="Hardlink duplicates", variable=self.hardlink_duplicates_var)
+        self.hardlink_duplicates_check.pack(side=tk.LEFT, padx=5, pady=5)
+
+        self.use_daemon_var = tk.BooleanVar(value=False)
+        self.use_daemon_check = ttk.Checkbutton(flags_row, text="Run in background daemon", variable=self.use_daemon_var)
+        self.use_daemon_check.pack(side=tk.LEFT, padx=5, pady=5)
+        self.daemon_job_id = None
+        self.daemon_cursor = 0
+        self.local_job = None
+
         # Download button
         self.download_button = ttk.Button(root, text="Download Videos", command=self.start_download_thread)
         self.download_button.pack(pady=10)
@@ -99,6 +124,11 @@ class YouTubeDownloaderApp:
         scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
         self.status_text['yscrollcommand'] = scrollbar.set
 
+        # Tk is not thread-safe: engine and daemon threads only put
+        # (msg_type, data) here, and the main loop shows them
+        self.ui_queue = queue.Queue()
+        self.root.after(UI_POLL_INTERVAL_MS, self.process_ui_queue)
+
     def browse_download_path(self):
         directory = filedialog.askdirectory()
         if directory:
@@ -117,10 +147,13 @@ class YouTubeDownloaderApp:
             messagebox.showwarning("Input Error", "Please enter at least one YouTube URL.")
             return
 
-        urls = [url.strip() for url in urls_string.split(',') if url.strip()]
+        # The same video pasted as different links is downloaded once
+        urls, duplicates = dedupe_urls(split_urls(urls_string))
         if not urls:
             messagebox.showwarning("Input Error", "No valid URLs provided.")
             return
+        for url, canonical in duplicates:
+            self.log_status(f"Skipping duplicate URL: {url} (same as {canonical})")
         
         download_path = self.download_path_var.get()
         if not os.path.isdir(download_path):
@@ -130,104 +163,142 @@ class YouTubeDownloaderApp:
         self.download_button.config(state=tk.DISABLED)
         self.log_status(f"Starting download of {len(urls)} video(s)...")
         
-        # Run download in a separate thread to keep GUI responsive
-        download_thread = threading.Thread(target=self.download_videos, args=(urls, download_path), daemon=True)
-        download_thread.start()
-
-    def download_videos(self, urls, download_path):
-        # Prepare yt-dlp options
-        # The YtdlpLogger and ytdlp_progress_hook are defined globally in this script
-        # and receive self.log_status as the app_logger_func argument.
-        ffmpeg_executable_path = None
-        # ffprobe_executable_path = None # yt-dlp usually finds ffprobe relative to ffmpeg
-
-        if getattr(sys, 'frozen', False) and hasattr(sys, '_MEIPASS'):
-            # Application is running as a PyInstaller bundle
-            meipass_path = sys._MEIPASS
-            self.log_status(f"INFO: Running as bundle. MEIPASS (bundle root): {meipass_path}")
-            
-            ffmpeg_name = 'ffmpeg'
-            ffprobe_name = 'ffprobe' # yt-dlp expects this name
-
-            potential_ffmpeg_path = os.path.join(meipass_path, ffmpeg_name)
-            potential_ffprobe_path = os.path.join(meipass_path, ffprobe_name)
-
-            self.log_status(f"INFO: Checking for bundled ffmpeg at: {potential_ffmpeg_path}")
-            if os.path.exists(potential_ffmpeg_path):
-                self.log_status(f"INFO: Found {ffmpeg_name} at {potential_ffmpeg_path}")
-                try:
-                    current_mode = os.stat(potential_ffmpeg_path).st_mode
-                    if not (current_mode & stat.S_IXUSR):
-                        self.log_status(f"INFO: Attempting to make {ffmpeg_name} executable...")
-                        os.chmod(potential_ffmpeg_path, current_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
-                    if os.access(potential_ffmpeg_path, os.X_OK):
-                        ffmpeg_executable_path = potential_ffmpeg_path
-                        self.log_status(f"INFO: {ffmpeg_name} is executable.")
-                    else:
-                        self.log_status(f"WARNING: {ffmpeg_name} at {potential_ffmpeg_path} is NOT executable even after chmod.")
-                except Exception as e:
-                    self.log_status(f"ERROR: Could not check/set permissions for {ffmpeg_name}: {e}")
-            else:
-                self.log_status(f"WARNING: Bundled {ffmpeg_name} NOT found at {potential_ffmpeg_path}")
-
-            # Check for ffprobe as well, for logging, though yt-dlp mainly uses ffmpeg_location
-            self.log_status(f"INFO: Checking for bundled ffprobe at: {potential_ffprobe_path}")
-            if os.path.exists(potential_ffprobe_path):
-                self.log_status(f"INFO: Found {ffprobe_name} at {potential_ffprobe_path}")
-                try:
-                    current_mode = os.stat(potential_ffprobe_path).st_mode
-                    if not (current_mode & stat.S_IXUSR):
-                        self.log_status(f"INFO: Attempting to make {ffprobe_name} executable...")
-                        os.chmod(potential_ffprobe_path, current_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
-                    if not os.access(potential_ffprobe_path, os.X_OK):
-                         self.log_status(f"WARNING: {ffprobe_name} at {potential_ffprobe_path} is NOT executable even after chmod.")
-                except Exception as e:
-                    self.log_status(f"ERROR: Could not check/set permissions for {ffprobe_name}: {e}")
-            else:
-                self.log_status(f"WARNING: Bundled {ffprobe_name} NOT found at {potential_ffprobe_path}")
+        # Options are read here, on the main thread; the download threads only get their values
+        options = self.batch_options()
+        if self.use_daemon_var.get():
+            # Starting the daemon can take seconds, so it happens off the main thread
+            threading.Thread(target=self.submit_to_daemon, args=(urls, download_path, options), daemon=True).start()
         else:
-            self.log_status("INFO: Running as script. yt-dlp will search for ffmpeg/ffprobe in system PATH.")
-
-        ydl_opts = {
-            'format': 'bestvideo[ext=mp4]+bestaudio[ext=m4a]/best[ext=mp4]/best',
-            'merge_output_format': 'mp4',
-            'outtmpl': os.path.join(download_path, '%(title)s.%(ext)s'),
-            'logger': YtdlpLogger(self.log_status),
-            'progress_hooks': [lambda d: ytdlp_progress_hook(d, self.log_status)],
-            'noplaylist': False,
-            'ignoreerrors': True,
-            # 'verbose': True, # Uncomment for more detailed yt-dlp output
+            self.download_videos(urls, download_path, options)
+
+    def batch_options(self):
+        """download_videos() options from the widgets (main thread only)"""
+        return {
+            'use_archive': self.skip_archived_var.get(),
+            'dedupe_mode': self.dedupe_mode(),
+            'throughput_profile': self.throughput_profile_var.get(),
+            'format_preset': self.format_preset_var.get(),
+            'global_rate_limit': self.bandwidth_limit(),
+            'session_rate_limit': self.rate_limit(self.batch_rate_var) or None,
+            'rate_limit': self.rate_limit(self.video_rate_var) or None,
         }
 
-        if ffmpeg_executable_path:
-            ydl_opts['ffmpeg_location'] = ffmpeg_executable_path
-            self.log_status(f"INFO: Setting ffmpeg_location in yt-dlp options to: {ffmpeg_executable_path}")
-        else:
-            self.log_status("WARNING: ffmpeg_location not set. yt-dlp will rely on system PATH or internal fallbacks.")
+    def process_ui_queue(self):
+        """Show what download threads posted; reschedules itself for the life of the window"""
+        while True:
+            try:
+                msg_type, data = self.ui_queue.get_nowait()
+            except queue.Empty:
+                break
+            if msg_type == 'daemon_submitted':
+                self.daemon_job_id = data
+                self.daemon_cursor = 0
+                self.log_status(f"Submitted to download daemon as {self.daemon_job_id}")
+                self.root.after(DAEMON_POLL_INTERVAL_MS, self.poll_daemon_job)
+            elif msg_type == 'daemon_failed':
+                self.log_status(f"Could not use the download daemon: {data}")
+                self.download_button.config(state=tk.NORMAL)
+            elif msg_type == 'complete':
+                self.finish_batch(self.local_job.result)
+                self.local_job = None
+            else:
+                self.show_message(msg_type, data)
+        self.root.after(UI_POLL_INTERVAL_MS, self.process_ui_queue)
+
+    def submit_to_daemon(self, urls, download_path, options):
+        """Hand the batch to the background daemon, starting it if needed (runs on its own thread)"""
+        try:
+            client = ensure_daemon()
+            job = client.submit(urls, download_path, **options)
+        except DaemonUnavailable as e:
+            self.ui_queue.put(('daemon_failed', str(e)))
+            return
+        self.ui_queue.put(('daemon_submitted', job['job_id']))
 
+    def poll_daemon_job(self):
+        """Show new events of the daemon job; reschedules itself until the job is done"""
         try:
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                for i, url_to_download in enumerate(urls):
-                    self.log_status(f"--- Starting download for: {url_to_download} ({i+1}/{len(urls)}) ---")
-                    try:
-                        # The download method expects a list of URLs
-                        ydl.download([url_to_download])
-                        self.log_status(f"--- Finished processing: {url_to_download} ---")
-                    except yt_dlp.utils.DownloadError as e:
-                        # This exception is often caught by yt-dlp's own error handling and logger
-                        self.log_status(f"DownloadError for {url_to_download}: {e}")
-                    except Exception as e:
-                        self.log_status(f"An unexpected error occurred with {url_to_download}: {str(e)}")
-            
-            self.log_status("All downloads attempted.")
-            messagebox.showinfo("Download Process Complete", "All specified videos have been processed. Check status for details.")
-
-        except Exception as e:
-            # This would catch errors in yt_dlp.YoutubeDL instantiation itself
-            self.log_status(f"An critical error occurred with yt-dlp setup: {str(e)}")
-            messagebox.showerror("yt-dlp Error", f"A critical error occurred with yt-dlp: {str(e)}\nEnsure yt-dlp is correctly installed ('pip install -r requirements.txt').")
-        finally:
+            state = JobDaemonClient().get_job(self.daemon_job_id, self.daemon_cursor)
+        except DaemonUnavailable as e:
+            self.log_status(f"Lost contact with the download daemon: {e}")
             self.download_button.config(state=tk.NORMAL)
+            return
+        self.daemon_cursor = state['cursor']
+        for event in state['events']:
+            self.show_message(event['type'], event['data'])
+        if state['status'] in TERMINAL_STATUSES:
+            self.finish_batch(throughput=state.get('throughput'))
+            return
+        self.root.after(DAEMON_POLL_INTERVAL_MS, self.poll_daemon_job)
+
+    def show_message(self, msg_type, data):
+        """Log a message of a batch, whether it runs in this process or in the daemon"""
+        if msg_type == 'log':
+            self.log_status(data.replace('**', ''))
+        elif msg_type == 'skipped':
+            self.log_status(f"Skipping, already downloaded: {os.path.basename(data)}")
+        elif msg_type == 'validation':
+            self.log_validation(data)
+        elif msg_type == 'dedupe':
+            self.log_dedupe(data)
+        elif msg_type == 'progress' and data.get('status') == 'finished':
+            self.log_status(f"Finished downloading {os.path.basename(data.get('filename', ''))}")
+
+    def rate_limit(self, var):
+        """A MB/s field as bytes per second, 0 for no limit"""
+        try:
+            return max(0, int(var.get() * 1024 ** 2))
+        except (tk.TclError, ValueError):
+            return 0
+
+    def bandwidth_limit(self):
+        """Total bandwidth limit in bytes per second, 0 for none"""
+        return self.rate_limit(self.bandwidth_limit_var)
+
+    def apply_bandwidth_limit(self):
+        get_default_governor().set_rate(self.bandwidth_limit())
+
+    def dedupe_mode(self):
+        return 'hardlink' if self.hardlink_duplicates_var.get() else None
+
+    def log_dedupe(self, report):
+        """Report duplicates replaced by hardlinks"""
+        for duplicate in report['duplicates']:
+            if duplicate['action'] != 'already linked':
+                self.log_status(f"Duplicate of {os.path.basename(duplicate['original'])}: {os.path.basename(duplicate['path'])} ({duplicate['action']})")
+        if report['saved_bytes']:
+            self.log_status(f"Saved {report['saved_bytes'] / (1024 * 1024):.1f} MB by hardlinking duplicates")
+
+    def log_validation(self, results):
+        """Report the structural check of downloaded files"""
+        for result in results:
+            status = "OK" if result['valid'] else "WARNING"
+            self.log_status(f"{status}: {os.path.basename(result['path'])}: {result['message']}")
+
+    def download_videos(self, urls, download_path, options):
+        """Run the batch in this process through the shared download engine
+
+        The engine calls on_message on its own threads, so messages only go
+        to the UI queue; the main loop reads the result once 'complete' arrives.
+        """
+        self.local_job = get_default_engine().submit(
+            urls, download_path,
+            on_message=lambda msg_type, job_id, data: self.ui_queue.put((msg_type, data)),
+            queue_messages=False,
+            owner='tk',
+            **options
+        )
+
+    def finish_batch(self, result=None, throughput=None):
+        """Report the end of a batch and its throughput, and allow the next one"""
+        self.log_status(f"All downloads attempted: {result.describe()}" if result is not None else "All downloads attempted.")
+        throughput = result.throughput if result is not None else throughput
+        if throughput:
+            # Compare runs with different profiles by this line
+            self.log_status(f"Throughput: {throughput['bytes'] / (1024 * 1024):.1f} MB in {throughput['seconds']:.1f}s = "
+                            f"{throughput['bytes_per_second'] / (1024 * 1024):.2f} MB/s (profile: {throughput['profile']})")
+        self.download_button.config(state=tk.NORMAL)
+        messagebox.showinfo("Download Process Complete", "All specified videos have been processed. Check status for details.")
 
 if __name__ == "__main__":
     root = tk.Tk()
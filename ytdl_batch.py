@@ -0,0 +1,218 @@
+"""Headless batch downloader for scripts and cron jobs.
+
+Reads URLs from a file or stdin, one or more per line (lines starting
+with '#' are comments), and downloads them with the same core as the
+Streamlit app and the daemon. The whole input is one batch of the download
+engine, read --chunk-size URLs at a time: the next chunk joins the batch's
+scheduler whenever its queue runs low, so the workers stay busy across chunks
+and a list of tens of thousands of lines is never read into memory at once.
+Repeats are dropped by their canonical URL.
+
+Every URL produces one JSON line on stdout: a repeat as soon as it is read,
+
+    {"event": "result", "url": ..., "status": "duplicate", "duplicate_of": ..., ...}
+
+and every other URL when the batch is done:
+
+    {"event": "result", "url": ..., "status": "finished", "files": [...], ...}
+
+followed by a final {"event": "summary", "batch_id": ..., ...} line. Logs go
+to stderr with --verbose. The exit status is 0 if every URL finished, 1 if
+any failed and 130 if interrupted. An interrupted (or crashed) batch is kept
+in the batch journal; ``--resume [BATCH_ID]`` runs it again, skipping what it
+already finished, and also queues any URLs given as input. Neither tkinter
+nor streamlit is imported, and yt-dlp only once there is work to do.
+"""
+import argparse
+import json
+import os
+import signal
+import sys
+import threading
+import time
+import uuid
+
+from bandwidth_governor import parse_rate
+from content_index import DEDUPE_MODES, DEFAULT_DEDUPE_MODE
+from download_scheduler import DEFAULT_MAX_CONCURRENT, DEFAULT_PER_HOST_LIMIT
+from batch_journal import get_default_journal
+from download_engine import DownloadEngine, VideoResult
+from format_presets import DEFAULT_PRESET, preset_names
+from throughput_profiles import DEFAULT_PROFILE, profile_names
+from url_canonical import canonicalize_url, split_urls
+
+DEFAULT_CHUNK_SIZE = 200
+# Progress is not reported, so the coalescer may drop nearly all of it
+CLI_PROGRESS_RATE = 0.5
+
+
+def iter_input_urls(stream):
+    """Yield URLs from a text stream line by line, skipping blanks and comments"""
+    for line in stream:
+        # Only whole-line comments: URLs may carry a '#' fragment
+        if not line.lstrip().startswith('#'):
+            yield from split_urls(line)
+
+
+def iter_chunks(urls, size, seen, on_duplicate=None):
+    """Group canonical URLs into lists of up to size, skipping any already in seen
+
+    on_duplicate(url, canonical) is called for every URL skipped.
+    """
+    chunk = []
+    for url in urls:
+        canonical = canonicalize_url(url)
+        if canonical in seen:
+            if on_duplicate:
+                on_duplicate(url, canonical)
+            continue
+        seen.add(canonical)
+        chunk.append(canonical)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def log_message(msg_type, job_id, data):
+    if msg_type == 'log':
+        print(data.replace('**', ''), file=sys.stderr)
+
+
+def emit(record, out=sys.stdout):
+    out.write(json.dumps(record) + '\n')
+    out.flush()
+
+
+def find_resumable(batch_id=None):
+    """Return the interrupted CLI batch batch_id (the latest one if None), or None"""
+    # Stopping is the only way to interrupt the CLI, so stopped batches can be resumed too
+    batches = get_default_journal().interrupted_batches(owner='cli', include_cancelled=True)
+    if batch_id is None:
+        return batches[-1] if batches else None
+    return next((batch for batch in batches if batch['batch_id'] == batch_id), None)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Download the URLs listed in a file (or stdin) and report JSON lines")
+    parser.add_argument('input', nargs='?', default=None,
+                        help="file with URLs, '-' for stdin (default, unless resuming)")
+    parser.add_argument('-o', '--output-dir', default='.', help="download directory (default: current directory)")
+    parser.add_argument('-j', '--max-concurrent', type=int, default=DEFAULT_MAX_CONCURRENT)
+    parser.add_argument('--per-host-limit', type=int, default=DEFAULT_PER_HOST_LIMIT)
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help="URLs read from the input at a time")
+    parser.add_argument('--preset', choices=preset_names(), default=DEFAULT_PRESET, help="quality preset")
+    parser.add_argument('--profile', choices=profile_names(), default=DEFAULT_PROFILE, help="throughput profile")
+    parser.add_argument('--dedupe', choices=DEDUPE_MODES + ('none',), default=DEFAULT_DEDUPE_MODE,
+                        help="what to do with downloads identical to existing files")
+    parser.add_argument('--max-rate', type=parse_rate, default=None, help="total bandwidth for all downloads, e.g. 5M (bytes/s)")
+    parser.add_argument('--video-rate', type=parse_rate, default=None, help="bandwidth for each video, e.g. 1M (bytes/s)")
+    parser.add_argument('--no-archive', action='store_true', help="download videos already in the download archive again")
+    parser.add_argument('--no-preflight', action='store_true', help="skip size estimation before each chunk")
+    parser.add_argument('--resume', nargs='?', const='', default=None, metavar='BATCH_ID',
+                        help="run an interrupted batch again with its saved options (default: the latest one)")
+    parser.add_argument('-v', '--verbose', action='store_true', help="log to stderr")
+    parser.add_argument('--debug', action='store_true', help="log yt-dlp debug output (implies --verbose)")
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.chunk_size < 1:
+        parser.error("--chunk-size must be at least 1")
+
+    resumed = None
+    if args.resume is not None:
+        try:
+            resumed = find_resumable(args.resume or None)
+        except Exception as e:
+            parser.error(f"batch journal unavailable: {e}")
+        if resumed is None:
+            parser.error(f"no interrupted batch {args.resume!r} to resume" if args.resume else "no interrupted batch to resume")
+
+    download_path = os.path.abspath(os.path.expanduser(args.output_dir))
+    options = {
+        'max_concurrent': args.max_concurrent,
+        'per_host_limit': args.per_host_limit,
+        'use_archive': not args.no_archive,
+        'debug': args.debug,
+        'progress_rate': CLI_PROGRESS_RATE,
+        'dedupe_mode': None if args.dedupe == 'none' else args.dedupe,
+        'throughput_profile': args.profile,
+        'format_preset': args.preset,
+        'preflight': not args.no_preflight,
+        'rate_limit': args.video_rate,
+        'global_rate_limit': args.max_rate,
+    }
+    verbose = args.verbose or args.debug
+
+    engine = DownloadEngine(**options)
+    current = {'job': None}
+    interrupted = threading.Event()
+
+    def on_signal(signum, frame):
+        # Running downloads stop at their next progress event; the batch then reports
+        interrupted.set()
+        if current['job'] is not None:
+            current['job'].cancel()
+
+    signal.signal(signal.SIGINT, on_signal)
+    signal.signal(signal.SIGTERM, on_signal)
+
+    counts = {}
+
+    def report(video):
+        counts[video.status] = counts.get(video.status, 0) + 1
+        emit(dict({'event': 'result'}, **video.to_dict()))
+
+    def on_duplicate(url, canonical):
+        report(VideoResult(url, status='duplicate', error=f"Same video as {canonical}"))
+
+    started = time.monotonic()
+    submit_options = {}
+    if resumed is not None:
+        batch_id = resumed['batch_id']
+        download_path = resumed['download_path']
+        submit_options = resumed['options']
+        first = resumed['urls']
+    else:
+        # Unique per run: a journal entry under the same job id would be resumed
+        batch_id = f"cli-{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}"
+        first = None
+    input_name = args.input or (None if resumed is not None else '-')
+    stream = None
+    if input_name is not None:
+        stream = sys.stdin if input_name == '-' else open(input_name, encoding='utf-8')
+    try:
+        # URLs a resumed batch already has are dropped by the batch itself, without a result of their own
+        chunks = iter_chunks(iter_input_urls(stream or []), args.chunk_size, set(), on_duplicate)
+        if first is None:
+            first = next(chunks, [])
+        if first:
+            job = engine.submit(first, download_path, on_message=log_message if verbose else None, job_id=batch_id,
+                                queue_messages=False, echo=sys.stderr if verbose else None, owner='cli',
+                                **dict(submit_options, more_urls=chunks))
+            current['job'] = job
+            for video in job.wait_result().videos:
+                report(video)
+    finally:
+        if stream is not None and stream is not sys.stdin:
+            stream.close()
+
+    emit({
+        'event': 'summary',
+        'batch_id': batch_id,
+        'counts': counts,
+        'seconds': round(time.monotonic() - started, 2),
+        'interrupted': interrupted.is_set(),
+    })
+    if interrupted.is_set():
+        print(f"Interrupted; run again with --resume {batch_id} (and the same input) to finish the batch", file=sys.stderr)
+        return 130
+    return 1 if counts.get('failed') else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())